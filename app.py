@@ -1,11 +1,13 @@
 import os
 import logging
-import tempfile
 import json
-import time
+import base64
 import subprocess
-from datetime import datetime
-from urllib.parse import urlparse
+import threading
+import mimetypes
+from functools import partial
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, quote
 
 def format_duration(seconds):
     """Format duration from seconds to HH:MM:SS"""
@@ -19,18 +21,36 @@ def format_duration(seconds):
     if hours > 0:
         return f"{hours:02d}:{minutes:02d}:{secs:02d}"
     return f"{minutes:02d}:{secs:02d}"
-from flask import Flask, render_template, request, jsonify, flash, session, redirect, send_file
-import yt_dlp
-from googleapiclient.discovery import build
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, send_file
 from googleapiclient.http import MediaFileUpload
 from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import Flow
 import requests
+from werkzeug.exceptions import HTTPException
 from config import Config
-from models import db, User, Video, ApiCredential
+from models import db, User, Video, ApiCredential, MediaFile, DownloadJob, DownloadBatch
+import migrations
+from jobs import JobQueue, JobQueueFull
+from batches import BatchScheduler
+from playlists import is_youtube_collection_url, iter_collection_entries
+from metadata_cache import MetadataCache, extract_video_id
+from media_store import MediaStore
+from workdir import WorkDir
+from janitor import MediaJanitor
+from utils import generate_temp_filename
+from progress import tracker as progress_tracker
+from google_clients import ServicePool
+from drive_folders import DriveFolderIndex
+from uploads import UploadEngine, open_upload_session, PipeMediaUpload
+from search_index import SearchIndex
+from http_cache import HttpCache
+from formats import FormatPlanner, fallback_selector
+from download_engine import DownloadEngine
+from download_strategies import (StrategyRegistry, YtDlpEngineStrategy, YtDlpCliStrategy, PytubeStrategy,
+                                 YoutubeDlStrategy, YT_DLP_PROGRESS_TEMPLATE, parse_yt_dlp_progress)
 from urllib.parse import urlparse, parse_qs
 from flask_login import LoginManager, current_user, login_required
+from sqlalchemy.orm import selectinload
 
 def is_valid_youtube_url(url):
     try:
@@ -73,6 +93,8 @@ db.init_app(app)
 # Create tables
 with app.app_context():
     db.create_all()
+    # create_all() leaves existing tables alone, migrations bring them up to date
+    migrations.upgrade()
 
 # Set up Flask-Login
 login_manager = LoginManager()
@@ -83,16 +105,75 @@ login_manager.login_view = 'google_auth.login'
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# Temporary directory for storing downloads
-temp_dir = tempfile.gettempdir()
+# Scratch and finished-media directories for downloads
+workdir = WorkDir(app.config['WORK_DIR'])
+
+# Background worker pool for downloads
+job_queue = JobQueue(app)
+
+# Schedules batch downloads onto the worker pool
+batch_scheduler = BatchScheduler(job_queue, app)
+
+# Shared cache of yt-dlp extraction results
+metadata_cache = MetadataCache(app)
+
+# Downloaded files, reused across requests for the same video and format
+media_store = MediaStore(workdir.media_dir)
+
+# Evicts old media once the disk budget is exceeded
+janitor = MediaJanitor(app, media_store, workdir)
+
+# Reusable Drive and YouTube service objects per user
+service_pool = ServicePool(app)
+
+# Local index of each user's Drive folders
+drive_folder_index = DriveFolderIndex(app)
+
+# Runs Drive and YouTube uploads with adaptive chunk sizes
+upload_engine = UploadEngine(app)
+
+# Full-text search over downloaded videos
+video_search = SearchIndex(app)
+
+# ETags, compression and fingerprinted static URLs
+http_cache = HttpCache(app)
+
+# Picks download formats from cached format lists
+format_planner = FormatPlanner(app)
+
+# Warm yt-dlp worker processes that run the downloads
+download_engine = DownloadEngine(app)
+
+# Download and metadata backends, tried healthiest first
+strategies = [
+    YtDlpEngineStrategy(download_engine, metadata_cache),
+    YtDlpCliStrategy(download_engine, timeout=app.config['DOWNLOAD_ENGINE_TIMEOUT']),
+    PytubeStrategy(),
+    YoutubeDlStrategy(),
+]
+download_strategies = StrategyRegistry('download', strategies, app)
+info_strategies = StrategyRegistry('extract_info', strategies, app)
+
+# History page sizes
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Search page sizes
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
 
 # Google Drive API scopes
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
 # Import and register Google Auth blueprint
-from google_auth import google_auth
+from google_auth import google_auth, http_session as google_http_session
+from tokens import token_store
 app.register_blueprint(google_auth)
 
+# Server-side OAuth tokens, refreshed before they expire
+token_store.init_app(app, http_session=google_http_session)
+
 def store_api_credentials(service_name, client_id, client_secret):
     """Store API credentials in the database"""
     try:
@@ -135,56 +216,60 @@ def get_api_credentials(service_name):
         logger.error(f"Error retrieving API credentials: {e}")
         return None
 
+def current_credentials():
+    """Return ready-to-use Google credentials of the logged in user, or None"""
+    if not current_user.is_authenticated:
+        return None
+    
+    # Sessions from before the token store still carry their credentials in the cookie
+    legacy = session.pop('credentials', None)
+    if legacy and not token_store.has(current_user.id):
+        creds_data = json.loads(legacy)
+        token_store.save(current_user.id, Credentials(
+            token=creds_data.get('token'),
+            refresh_token=creds_data.get('refresh_token'),
+            token_uri=creds_data.get('token_uri'),
+            client_id=creds_data.get('client_id'),
+            client_secret=creds_data.get('client_secret'),
+            scopes=creds_data.get('scopes')
+        ))
+    
+    return token_store.get(current_user.id)
+
 def get_authenticated_service():
     """Build and return a Drive service object"""
     try:
-        if 'credentials' not in session:
-            logger.debug("No credentials in session")
+        credentials = current_credentials()
+        if credentials is None:
+            logger.debug("No stored credentials for the current user")
             return None
         
-        # Parse credentials from session
-        creds_data = json.loads(session['credentials'])
-        logger.debug(f"Credentials structure: {list(creds_data.keys())}")
-        
-        # Ensure all required fields are present
-        required_fields = ['token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes']
-        missing_fields = [field for field in required_fields if field not in creds_data]
-        
-        if missing_fields:
-            logger.error(f"Credentials missing required fields: {missing_fields}")
-            flash(f"Authentication issue: Missing {', '.join(missing_fields)}")
-            return None
-        
-        # Create credentials object
-        credentials = Credentials(
-            token=creds_data['token'],
-            refresh_token=creds_data['refresh_token'],
-            token_uri=creds_data['token_uri'],
-            client_id=creds_data['client_id'],
-            client_secret=creds_data['client_secret'],
-            scopes=creds_data['scopes']
-        )
-        
-        # Refresh if expired
-        if credentials and credentials.expired and credentials.refresh_token:
-            credentials.refresh(Request())
-            
-            # Update session with refreshed credentials
-            updated_creds = {
-                'token': credentials.token,
-                'refresh_token': credentials.refresh_token,
-                'token_uri': credentials.token_uri,
-                'client_id': credentials.client_id,
-                'client_secret': credentials.client_secret,
-                'scopes': credentials.scopes
-            }
-            session['credentials'] = json.dumps(updated_creds)
-        
-        return build('drive', 'v3', credentials=credentials)
+        return service_pool.get('drive', 'v3', credentials)
     except Exception as e:
         logger.error(f"Error getting authenticated service: {e}")
         return None
 
+def best_thumbnail(info):
+    """Pick the highest quality thumbnail URL from yt-dlp info"""
+    thumbnails = info.get('thumbnails', [])
+    
+    # Try to get the highest quality thumbnail
+    for quality in ['maxres', 'high', 'medium', 'default', 'standard']:
+        for thumb in thumbnails:
+            if isinstance(thumb, dict) and thumb.get('id') == quality:
+                return thumb.get('url', '')
+    
+    # Fallback to the basic thumbnail if no better one was found
+    return info.get('thumbnail', '')
+
+@app.context_processor
+def inject_google_connected():
+    """Tell templates whether the user has stored Google credentials"""
+    connected = current_user.is_authenticated and (
+        'credentials' in session or token_store.has(current_user.id)
+    )
+    return {'google_connected': connected}
+
 @app.route('/')
 def index():
     """Render the main page with options"""
@@ -210,14 +295,7 @@ def get_metadata():
         if not is_valid_youtube_url(url):
             return jsonify({'error': 'Invalid YouTube URL'}), 400
         
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        info = metadata_cache.get_info(url)
             
         return jsonify({
             'title': info.get('title', 'Unknown title'),
@@ -235,6 +313,33 @@ def history_page():
     """Render the history page"""
     return render_template('history.html')
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Report metadata cache hit/miss counts and API client reuse"""
+    return jsonify({
+        'status': 'success',
+        'metadata_cache': metadata_cache.stats(),
+        'google_clients': service_pool.stats(),
+        'download_engine': download_engine.stats(),
+        'download_strategies': download_strategies.stats(),
+        'info_strategies': info_strategies.stats()
+    })
+
+@app.route('/api/storage', methods=['GET'])
+def storage_usage():
+    """Report disk usage of downloaded media and job scratch space"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'storage': workdir.usage(),
+            'budget_bytes': janitor.max_bytes,
+            'max_age': janitor.max_age,
+            'last_cleanup': janitor.last_run
+        })
+    except Exception as e:
+        logger.error(f"Error measuring storage: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/auth')
 def auth():
     """Start the OAuth flow - redirects to the Google Auth blueprint"""
@@ -316,106 +421,20 @@ def get_video_info():
             logger.warning(f"Invalid YouTube URL: {url}")
             return jsonify({'error': 'Invalid YouTube URL'}), 400
         
-        # Enhanced options for yt-dlp
-        ydl_opts = {
-            'format': 'best[height<=720]',  # Limit to 720p to avoid extremely large files
-            'quiet': True,
-            'no_warnings': True,
-            'skip_download': True,
-            'extract_flat': False,
-            'no_playlist': True,
-            'nocheckcertificate': True,  # Skip HTTPS certificate validation
-            'ignoreerrors': True,        # Skip unavailable videos
-        }
+        # The cached yt-dlp extraction first, other backends while it fails
+        info, strategy = info_strategies.run(url)
         
-        logger.info("Extracting video info with yt-dlp...")
+        response_data = {
+            'title': info.get('title', 'Unknown title'),
+            'duration': info.get('duration', 0),
+            'thumbnail': best_thumbnail(info),
+            'uploader': info.get('uploader', 'Unknown uploader'),
+            # Qualities to choose from, with their estimated download sizes
+            'formats': format_planner.options(info)
+        }
         
-        # Try the primary extraction method
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                # Get the best thumbnail available
-                thumbnails = info.get('thumbnails', [])
-                best_thumbnail = ''
-                
-                if thumbnails:
-                    # Try to get the highest quality thumbnail
-                    for quality in ['maxres', 'high', 'medium', 'default', 'standard']:
-                        for thumb in thumbnails:
-                            if isinstance(thumb, dict) and thumb.get('id') == quality:
-                                best_thumbnail = thumb.get('url', '')
-                                break
-                        if best_thumbnail:
-                            break
-                
-                # Fallback to the basic thumbnail if no better one was found
-                if not best_thumbnail:
-                    best_thumbnail = info.get('thumbnail', '')
-                
-                response_data = {
-                    'title': info.get('title', 'Unknown title'),
-                    'duration': info.get('duration', 0),
-                    'thumbnail': best_thumbnail,
-                    'uploader': info.get('uploader', 'Unknown uploader'),
-                }
-                
-                logger.info(f"Successfully extracted video info: {response_data['title']}")
-                return jsonify(response_data)
-                
-        except Exception as ydl_error:
-            logger.error(f"yt-dlp extraction failed: {ydl_error}")
-            
-            # Fallback to simpler extraction method
-            try:
-                # Try with even more basic options
-                simple_opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'skip_download': True,
-                    'extract_flat': True,
-                    'no_color': True,
-                    'nocheckcertificate': True,  # Skip HTTPS certificate validation
-                    'ignoreerrors': True,        # Skip unavailable videos
-                    'geo_bypass': True,          # Try to bypass geo-restrictions
-                    'no_playlist': True          # Skip playlist info
-                }
-                
-                logger.info("Trying fallback extraction method...")
-                with yt_dlp.YoutubeDL(simple_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    
-                    # Get the best thumbnail from fallback method
-                    thumbnails = info.get('thumbnails', [])
-                    best_thumbnail = ''
-                    
-                    if thumbnails:
-                        # Try to get the highest quality thumbnail
-                        for quality in ['maxres', 'high', 'medium', 'default', 'standard']:
-                            for thumb in thumbnails:
-                                if isinstance(thumb, dict) and thumb.get('id') == quality:
-                                    best_thumbnail = thumb.get('url', '')
-                                    break
-                            if best_thumbnail:
-                                break
-                    
-                    # Fallback to the basic thumbnail if no better one was found
-                    if not best_thumbnail:
-                        best_thumbnail = info.get('thumbnail', '')
-                    
-                    response_data = {
-                        'title': info.get('title', 'Unknown title'),
-                        'duration': info.get('duration', 0),
-                        'thumbnail': best_thumbnail,
-                        'uploader': info.get('uploader', 'Unknown uploader'),
-                    }
-                    
-                    logger.info(f"Fallback extraction succeeded: {response_data['title']}")
-                    return jsonify(response_data)
-                    
-            except Exception as fallback_error:
-                logger.error(f"Fallback extraction also failed: {fallback_error}")
-                raise fallback_error
+        logger.info(f"Extracted video info with {strategy}: {response_data['title']}")
+        return jsonify(response_data)
             
     except Exception as e:
         logger.error(f"Error getting video info: {e}")
@@ -423,177 +442,466 @@ def get_video_info():
 
 @app.route('/download', methods=['POST'])
 def download_video():
-    """Download video from YouTube URL"""
+    """Queue a background download for a YouTube URL"""
     data = request.get_json()
     logger.info(f"Download data received: {data}")
     
     url = data.get('url', '')
+    try:
+        format_request = format_planner.parse_request(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    handler = partial(run_download_job, format_request=format_request)
     
-    # Create a unique filename
-    timestamp = int(time.time())
-    temp_file = os.path.join(temp_dir, f"yt_video_{timestamp}")
-    temp_file_mp4 = temp_file + '.mp4'  # Default to mp4 for backup methods
-    logger.info(f"Temp file path: {temp_file}")
+    # Playlists and channels are expanded into a batch of downloads
+    if is_youtube_collection_url(url):
+        try:
+            batch = batch_scheduler.submit_expansion(
+                url,
+                iter_collection_entries(url),
+                handler,
+                skip=is_already_downloaded,
+                concurrency=data.get('concurrency')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            logger.error(f"Error queueing playlist download: {e}")
+            return jsonify({'error': str(e)}), 500
+        
+        response_data = batch.to_dict()
+        response_data['status_url'] = f'/download/batch/{batch.id}'
+        return jsonify(response_data), 202
+    
+    if not is_valid_youtube_url(url):
+        return jsonify({'error': 'Invalid YouTube URL'}), 400
+    
+    # Reuse a file that is already on disk for this video, if its formats are known without extracting
+    youtube_id = extract_video_id(url)
+    info = metadata_cache.lookup(youtube_id) if youtube_id else None
+    if info:
+        try:
+            plan = format_planner.plan(info, **format_request)
+            entry = media_store.lookup(youtube_id, plan.key)
+            if entry:
+                logger.info(f"Reusing downloaded file for {youtube_id}: {entry.path}")
+                job = job_queue.record_completed(url, stored_media_result(entry))
+                return jsonify(job.to_dict())
+        except Exception as e:
+            logger.warning(f"Media store lookup failed: {e}")
+            db.session.rollback()
     
-    # For testing, use the simplest command possible
     try:
-        subprocess.run(['pip', 'list'], capture_output=True, text=True)
+        job = job_queue.submit(url, handler)
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error queueing download: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': f'/jobs/{job.id}'
+    }), 202
+
+@app.route('/download/batch', methods=['POST'])
+def download_batch():
+    """Queue downloads for a list of YouTube URLs"""
+    try:
+        data = request.get_json() or {}
+        urls = data.get('urls', [])
+        concurrency = data.get('concurrency')
+        format_request = format_planner.parse_request(data)
+        
+        if not isinstance(urls, list):
+            return jsonify({'error': 'urls must be a list'}), 400
+        
+        items = []
+        for url in urls:
+            url = url.strip() if isinstance(url, str) else ''
+            items.append((url, None if is_valid_youtube_url(url) else 'Invalid YouTube URL'))
+        
+        batch = batch_scheduler.submit(items, partial(run_download_job, format_request=format_request),
+                                       concurrency=concurrency)
+        response_data = batch.to_dict()
+        response_data['status_url'] = f'/download/batch/{batch.id}'
+        return jsonify(response_data), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error queueing batch download: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/download/batch/<batch_id>', methods=['GET'])
+def get_download_batch(batch_id):
+    """Get aggregate status and per-video results of a batch"""
+    batch = db.session.get(DownloadBatch, batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(batch.to_dict())
+
+@app.route('/transfer', methods=['POST'])
+def transfer_video():
+    """Queue a download that is streamed straight into Drive or YouTube"""
+    try:
+        data = request.get_json() or {}
+        url = data.get('url', '')
+        destination = data.get('destination', 'drive')
         
-        # Simplified approach - use a direct system command with 360p format 
-        # Adding more options to handle various restrictions
-        cmd = f"yt-dlp -f 'bestvideo[height<=360]+bestaudio/best[height<=360]' --no-check-certificates --geo-bypass --ignore-errors -o '{temp_file_mp4}' '{url}'"
-        logger.info(f"Running direct command: {cmd}")
-        subprocess.run(cmd, shell=True, check=True)
+        if not is_valid_youtube_url(url):
+            return jsonify({'error': 'Invalid YouTube URL'}), 400
+        if destination not in ('drive', 'youtube'):
+            return jsonify({'error': 'destination must be drive or youtube'}), 400
         
-        if os.path.exists(temp_file_mp4):
-            logger.info(f"File downloaded successfully: {temp_file_mp4}")
-            
-            # Get metadata
-            try:
-                with yt_dlp.YoutubeDL({'quiet': True, 'skip_download': True, 'nocheckcertificate': True, 'ignoreerrors': True}) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                
-                # Get the best thumbnail available
-                thumbnails = info.get('thumbnails', [])
-                best_thumbnail = ''
-                
-                if thumbnails:
-                    # Try to get the highest quality thumbnail
-                    for quality in ['maxres', 'high', 'medium', 'default', 'standard']:
-                        for thumb in thumbnails:
-                            if isinstance(thumb, dict) and thumb.get('id') == quality:
-                                best_thumbnail = thumb.get('url', '')
-                                break
-                        if best_thumbnail:
-                            break
-                
-                # Fallback to the basic thumbnail if no better one was found
-                if not best_thumbnail:
-                    best_thumbnail = info.get('thumbnail', '')
-                
-                video_info = {
-                    'youtube_id': info.get('id', ''),
-                    'title': info.get('title', 'Unknown'),
-                    'duration': info.get('duration', 0),
-                    'thumbnail_url': best_thumbnail,
-                    'uploader': info.get('uploader', 'Unknown uploader'),
-                    'filename': temp_file_mp4
-                }
-            except Exception as e:
-                logger.warning(f"Could not get metadata: {e}")
-                # Fallback metadata
-                video_info = {
-                    'youtube_id': url.split('v=')[-1] if 'v=' in url else url.split('/')[-1],
-                    'title': os.path.basename(temp_file_mp4),
-                    'duration': 0,
-                    'thumbnail_url': '',
-                    'uploader': 'Unknown',
-                    'filename': temp_file_mp4
-                }
-                
-            return process_downloaded_video(url, video_info)
+        credentials = current_credentials()
+        if credentials is None:
+            return jsonify({'error': 'Not authenticated with Google'}), 401
+        if destination == 'youtube' and 'https://www.googleapis.com/auth/youtube.upload' not in (credentials.scopes or []):
+            return jsonify({'error': 'YouTube upload permission not granted', 'action_required': 'reauth'}), 403
         
+        options = {
+            'folder_id': data.get('folder_id'),
+            'privacy_status': data.get('privacy_status', 'private'),
+            'format': format_planner.parse_request(data)
+        }
+        # The job fetches the user's credentials from the token store when it starts
+        job = job_queue.submit(url, partial(run_transfer_job, destination=destination,
+                                            user_id=current_user.id, options=options))
+    except ValueError as e:
+        # Bad format preferences
+        return jsonify({'error': str(e)}), 400
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        logger.error(f"Download error: {e}")
-        
-        # Last attempt - basic pytube with additional error handling
-        try:
-            logger.info("Trying basic pytube...")
-            from pytube import YouTube
-            from pytube.exceptions import RegexMatchError, VideoUnavailable
-            
-            try:
-                yt = YouTube(url, use_oauth=False, allow_oauth_cache=False)
-            except RegexMatchError:
-                logger.error("PyTube couldn't parse the URL")
-                raise
-            except VideoUnavailable:
-                logger.error("PyTube reports video unavailable")
-                raise
-                
-            # Try to get the highest quality stream with specific format if possible
-            logger.info("Getting available streams...")
-            highest_res_stream = None
-            
-            try:
-                # Try to get a progressive MP4 stream first
-                highest_res_stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
-                logger.info(f"Found progressive stream: {highest_res_stream}")
-            except Exception as stream_error:
-                logger.warning(f"Error getting progressive stream: {stream_error}")
-                
-            # Fallback to any available stream if no progressive stream found
-            if not highest_res_stream:
-                try:
-                    highest_res_stream = yt.streams.get_highest_resolution()
-                    logger.info(f"Falling back to highest resolution: {highest_res_stream}")
-                except Exception as fallback_error:
-                    logger.warning(f"Error getting highest resolution: {fallback_error}")
-            
-            if highest_res_stream:
-                logger.info(f"Downloading with stream: {highest_res_stream}")
-                download_path = highest_res_stream.download(output_path=temp_dir, filename=f"yt_video_{timestamp}.mp4")
-                logger.info(f"Downloaded with pytube: {download_path}")
-                
-                if os.path.exists(download_path):
-                    video_info = {
-                        'youtube_id': yt.video_id,
-                        'title': yt.title,
-                        'duration': yt.length,
-                        'thumbnail_url': yt.thumbnail_url,
-                        'uploader': yt.author,
-                        'filename': download_path
-                    }
-                    return process_downloaded_video(url, video_info)
-                else:
-                    logger.error(f"PyTube reported success but file doesn't exist at {download_path}")
-            else:
-                logger.error("No suitable stream found for download")
-        except Exception as pytube_error:
-            logger.error(f"Basic pytube error: {pytube_error}")
+        logger.error(f"Error queueing transfer: {e}")
+        return jsonify({'error': str(e)}), 500
     
-    # If all methods fail
-    return jsonify({'error': 'All download methods failed'}), 500
+    return jsonify({
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': f'/jobs/{job.id}'
+    }), 202
 
-def process_downloaded_video(url, video_info):
-    """Process a successfully downloaded video and create database entry"""
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the current state of a background job"""
+    job = db.session.get(DownloadJob, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream a job's transfer progress as Server-Sent Events"""
+    phase = request.args.get('phase')
+    
+    if progress_tracker.get(job_id) is None:
+        job = db.session.get(DownloadJob, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        # Progress is kept in memory, so a job finished elsewhere only has its DB state
+        state = stored_job_state(job, phase)
+        if state is not None:
+            return Response(f"data: {json.dumps(state)}\n\n", mimetype='text/event-stream')
+    
+    def check():
+        # The tracker never hears about jobs that died with another process
+        with app.app_context():
+            job = db.session.get(DownloadJob, job_id)
+            return stored_job_state(job, phase) if job else None
+    
+    return Response(
+        progress_tracker.stream(job_id, phase=phase, check=check),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stored_job_state(job, phase=None):
+    """Build a terminal progress state from a job's DB row, or None while it runs"""
+    if job.status not in ('completed', 'failed'):
+        return None
+    return {
+        'job_id': job.id,
+        'phase': phase or 'download',
+        'status': 'finished' if job.status == 'completed' else 'error',
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error
+    }
+
+def is_already_downloaded(youtube_id):
+    """Check whether a YouTube video has been downloaded successfully before"""
+    return db.session.query(
+        Video.query.filter_by(youtube_id=youtube_id, download_success=True).exists()
+    ).scalar()
+
+def stored_media_result(entry):
+    """Build a download result for a file that is already in the media store"""
+    return {
+        'status': 'success',
+        'message': 'Video already downloaded',
+        'filename': entry.path,
+        'title': entry.video.title,
+        'video_id': entry.video_id,
+        'reused': True
+    }
+
+def plan_download(url, format_request=None, single_file=False):
+    """Plan the format of a download from the video's cached format list"""
     try:
-        filename = video_info['filename']
-        # Get file size
-        file_size = os.path.getsize(filename)
-        logger.info(f"File size: {file_size} bytes")
-        
-        # Create database record
-        video = Video(
-            youtube_id=video_info['youtube_id'],
-            title=video_info['title'],
-            url=url,
-            duration=video_info['duration'],
-            thumbnail_url=video_info['thumbnail_url'],
-            uploader=video_info['uploader'],
-            file_size=file_size,
-            download_success=True,
-            uploaded_to_youtube=False,
-            youtube_upload_id=None
-        )
+        info = metadata_cache.get_info(url)
+    except Exception as e:
+        logger.warning(f"Could not get formats, leaving the choice to yt-dlp: {e}")
+        info = None
+    return format_planner.plan(info, single_file=single_file, **(format_request or {}))
+
+def run_download_job(job, format_request=None):
+    """Download the job's video in the planned format and create its database entry"""
+    def download_to(output_path):
+        # Download into a private scratch dir, then publish the finished file
+        with workdir.scratch(job.id) as scratch_dir:
+            partial_path = os.path.join(scratch_dir, os.path.basename(output_path))
+            video_info = fetch_video(job.url, partial_path, job_id=job.id, format_selector=plan.selector)
+            video_info['filename'] = workdir.commit(video_info['filename'], output_path)
+        return process_downloaded_video(job.url, video_info)
+    
+    try:
+        plan = plan_download(job.url, format_request)
+        if plan.estimated_size:
+            progress_tracker.update(job.id, 'download', downloaded_bytes=0, total_bytes=plan.estimated_size)
+        
+        youtube_id = extract_video_id(job.url)
+        if youtube_id:
+            entry = media_store.lookup(youtube_id, plan.key)
+            if entry:
+                result = stored_media_result(entry)
+            else:
+                result, produced = media_store.fetch(youtube_id, plan.key, download_to)
+                if produced:
+                    media_store.record(youtube_id, plan.key, result['filename'], result['video_id'])
+        else:
+            result = download_to(workdir.media_path(generate_temp_filename()))
+    except Exception as e:
+        progress_tracker.fail(job.id, 'download', str(e))
+        raise
+    result['format'] = plan.to_dict()
+    progress_tracker.finish(job.id, 'download', result=result)
+    return result
+
+def report_yt_dlp_progress(line, job_id=None):
+    """
+    Feed one line of yt-dlp output into the progress tracker
+
+    Returns:
+        bool: True if the line was a progress line
+    """
+    fields = parse_yt_dlp_progress(line)
+    if fields is None:
+        return False
+    if job_id and fields:
+        progress_tracker.update(job_id, 'download', **fields)
+    return True
+
+def run_transfer_job(job, destination, user_id, options):
+    """
+    Stream a video from yt-dlp into a Drive or YouTube resumable upload
+    
+    The video never touches the local disk: yt-dlp writes to a pipe that is
+    read chunk by chunk by the upload, so memory use stays constant.
+    """
+    try:
+        info = metadata_cache.get_info(job.url)
+    except Exception as e:
+        logger.warning(f"Could not get metadata: {e}")
+        info = {'id': extract_video_id(job.url) or '', 'title': job.url}
+    title = info.get('title', 'Unknown')
+    
+    process = None
+    try:
+        credentials = token_store.get(user_id)
+        if credentials is None:
+            raise RuntimeError('Not authenticated with Google')
+        
+        # A pipe can't be merged into, so only formats with audio and video in one file
+        plan = format_planner.plan(info, single_file=True, **options.get('format', {}))
+        process = open_yt_dlp_stream(job.url, job_id=job.id, format_selector=plan.selector)
+        
+        def check_exit():
+            # Fail before the final chunk so a broken download is never published
+            returncode = process.wait()
+            if returncode != 0:
+                raise RuntimeError(f'yt-dlp exited with status {returncode}')
+        
+        media = PipeMediaUpload(process.stdout, mimetype='video/mp4', on_eof=check_exit)
+        
+        if destination == 'drive':
+            file_metadata = {'name': f"{title}.mp4"}
+            if options.get('folder_id'):
+                file_metadata['parents'] = [options['folder_id']]
+            drive_service = service_pool.get('drive', 'v3', credentials)
+            upload_request = drive_service.files().create(
+                body=file_metadata,
+                media_body=media,
+                fields='id'
+            )
+            phase = 'drive_upload'
+        else:
+            body = {
+                'snippet': {
+                    'title': title,
+                    'description': info.get('description', ''),
+                    'tags': info.get('tags', []),
+                    'categoryId': '22'
+                },
+                'status': {
+                    'privacyStatus': options.get('privacy_status', 'private')
+                }
+            }
+            youtube_service = service_pool.get('youtube', 'v3', credentials)
+            upload_request = youtube_service.videos().insert(
+                part=','.join(body.keys()),
+                body=body,
+                media_body=media
+            )
+            phase = 'youtube_upload'
+        
+        response = upload_engine.execute(upload_request, job_id=job.id, phase=phase)
+        
+        file_size = media.size()
+        result = process_downloaded_video(job.url, {
+            'youtube_id': info.get('id', ''),
+            'title': title,
+            'duration': info.get('duration', 0),
+            'thumbnail_url': best_thumbnail(info),
+            'uploader': info.get('uploader', 'Unknown uploader'),
+            'file_size': file_size
+        })
         
-        db.session.add(video)
+        video = db.session.get(Video, result['video_id'])
+        if destination == 'drive':
+            video.uploaded_to_drive = True
+            video.drive_file_id = response.get('id')
+            video.drive_folder_id = options.get('folder_id')
+            result['file_id'] = response.get('id')
+        else:
+            video.uploaded_to_youtube = True
+            video.youtube_upload_id = response.get('id')
+            result['youtube_video_id'] = response.get('id')
         db.session.commit()
-        logger.info(f"Video record created with ID: {video.id}")
         
-        # Add video ID to response for later reference
-        response_data = {
-            'status': 'success',
-            'message': 'Video downloaded successfully',
-            'filename': filename,
-            'title': video_info['title'],
-            'video_id': video.id
-        }
-        logger.info(f"Sending response with data: {response_data}")
-        return jsonify(response_data)
+        progress_tracker.finish(job.id, 'download', downloaded_bytes=file_size, total_bytes=file_size)
+        result['message'] = f'Video transferred to {"Google Drive" if destination == "drive" else "YouTube"}'
+        return result
     except Exception as e:
-        logger.error(f"Error processing downloaded video: {e}")
-        return jsonify({'error': str(e)}), 500
+        progress_tracker.fail(job.id, 'download', str(e))
+        raise
+    finally:
+        if process is not None:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+def open_yt_dlp_stream(url, job_id=None, format_selector=None):
+    """
+    Start yt-dlp writing a single-file format of the video to its stdout
+    
+    Log and progress output go to stderr, which is drained by a background
+    thread so the process never blocks on it.
+    
+    Returns:
+        subprocess.Popen: The running process, read its stdout in binary mode
+    """
+    format_selector = format_selector or fallback_selector(format_planner.default_height, single_file=True)
+    cmd = ['yt-dlp', '--newline', '--progress-template', YT_DLP_PROGRESS_TEMPLATE,
+           '-f', format_selector, '--no-check-certificates', '--geo-bypass',
+           '--no-part', *download_engine.cli_arguments(), '-o', '-', url]
+    logger.info(f"Running command: {cmd}")
+    
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    def drain_stderr():
+        for line in process.stderr:
+            line = line.decode('utf-8', 'replace')
+            if not report_yt_dlp_progress(line, job_id):
+                logger.debug(f"yt-dlp: {line.strip()}")
+    
+    threading.Thread(target=drain_stderr, name=f'yt-dlp-stderr-{job_id}', daemon=True).start()
+    return process
+
+def fetch_video(url, temp_file_mp4, job_id=None, format_selector=None):
+    """Download video from YouTube URL to the given path, returning its info dict"""
+    logger.info(f"Temp file path: {temp_file_mp4}")
+    format_selector = format_selector or fallback_selector(format_planner.default_height)
+    
+    def on_progress(**progress):
+        if job_id:
+            progress_tracker.update(job_id, 'download', **progress)
+    
+    video_info, strategy = download_strategies.run(url, temp_file_mp4, format_selector, progress=on_progress)
+    logger.info(f"File downloaded with {strategy}: {video_info['filename']}")
+    if 'title' in video_info:
+        return video_info
+    
+    # Get metadata
+    try:
+        info, _ = info_strategies.run(url)
+        video_info.update({
+            'youtube_id': info.get('id', ''),
+            'title': info.get('title', 'Unknown'),
+            'duration': info.get('duration', 0),
+            'thumbnail_url': best_thumbnail(info),
+            'uploader': info.get('uploader', 'Unknown uploader')
+        })
+    except Exception as e:
+        logger.warning(f"Could not get metadata: {e}")
+        # Fallback metadata
+        video_info.update({
+            'youtube_id': url.split('v=')[-1] if 'v=' in url else url.split('/')[-1],
+            'title': os.path.basename(temp_file_mp4),
+            'duration': 0,
+            'thumbnail_url': '',
+            'uploader': 'Unknown'
+        })
+    return video_info
+
+def process_downloaded_video(url, video_info):
+    """Process a successfully downloaded video and create database entry"""
+    filename = video_info.get('filename')
+    # Get file size, streamed transfers report it since no local file exists
+    file_size = video_info.get('file_size') or os.path.getsize(filename)
+    logger.info(f"File size: {file_size} bytes")
+    
+    # Create database record
+    video = Video(
+        youtube_id=video_info['youtube_id'],
+        title=video_info['title'],
+        url=url,
+        duration=video_info['duration'],
+        thumbnail_url=video_info['thumbnail_url'],
+        uploader=video_info['uploader'],
+        file_size=file_size,
+        download_success=True,
+        uploaded_to_youtube=False,
+        youtube_upload_id=None
+    )
+    
+    db.session.add(video)
+    db.session.flush()
+    # Indexed in the same transaction, so search never misses a saved video
+    video_search.index_video(video)
+    db.session.commit()
+    logger.info(f"Video record created with ID: {video.id}")
+    
+    # Add video ID to response for later reference
+    response_data = {
+        'status': 'success',
+        'message': 'Video downloaded successfully',
+        'filename': filename,
+        'title': video_info['title'],
+        'video_id': video.id
+    }
+    logger.info(f"Download result: {response_data}")
+    return response_data
 
 @app.route('/upload_to_drive', methods=['POST'])
 def upload_to_drive():
@@ -603,6 +911,7 @@ def upload_to_drive():
         filename = data.get('filename', '')
         folder_id = data.get('folder_id', None)
         video_id = data.get('video_id', None)
+        job_id = data.get('job_id', None)
         
         if not os.path.exists(filename):
             return jsonify({'error': 'File not found'}), 404
@@ -625,11 +934,16 @@ def upload_to_drive():
             resumable=True
         )
         
-        file = drive_service.files().create(
+        upload_request = drive_service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id'
-        ).execute()
+        )
+        # Continue an interrupted upload of the same file instead of starting over
+        checkpoint = open_upload_session(video_id, 'drive', filename) if video_id else None
+        with media_store.lease(filename):
+            file = upload_engine.execute(upload_request, job_id=job_id, phase='drive_upload',
+                                        checkpoint=checkpoint)
         
         # Update database record if video_id was provided
         if video_id:
@@ -654,33 +968,45 @@ def upload_to_drive():
 
 @app.route('/get_drive_folders', methods=['GET'])
 def get_drive_folders():
-    """Get list of Google Drive folders"""
+    """Get list of Google Drive folders, optionally filtered by name prefix"""
     try:
         drive_service = get_authenticated_service()
         if not drive_service:
             return jsonify({'error': 'Not authenticated with Google Drive'}), 401
         
-        # Query all folders including those in shared drives and shared with the user
-        results = drive_service.files().list(
-            q="mimeType='application/vnd.google-apps.folder'",
-            spaces='drive',
-            fields='files(id, name, parents)',
-            pageSize=1000,  # Get maximum number of folders
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True
-        ).execute()
-        
-        folders = results.get('files', [])
+        sync_drive_folders(drive_service)
+        folders = drive_folder_index.folders(current_user.id, prefix=request.args.get('q'))
         logger.info(f"Found {len(folders)} folders")
         
-        # Sort folders by name for better display
-        folders.sort(key=lambda x: x.get('name', '').lower())
-        
         return jsonify({'folders': folders})
     except Exception as e:
         logger.error(f"Error getting folders: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get_drive_folders/tree', methods=['GET'])
+def get_drive_folder_tree():
+    """Get Google Drive folders as a tree"""
+    try:
+        drive_service = get_authenticated_service()
+        if not drive_service:
+            return jsonify({'error': 'Not authenticated with Google Drive'}), 401
+        
+        sync_drive_folders(drive_service)
+        return jsonify({'folders': drive_folder_index.tree(current_user.id)})
+    except Exception as e:
+        logger.error(f"Error getting folder tree: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def sync_drive_folders(drive_service):
+    """Update the current user's folder index, falling back to the stored one"""
+    try:
+        drive_folder_index.sync(current_user.id, drive_service, force=request.args.get('refresh') == '1')
+    except Exception as e:
+        db.session.rollback()
+        if not drive_folder_index.is_indexed(current_user.id):
+            raise
+        logger.warning(f"Serving Drive folders from the stored index: {e}")
+
 @app.route('/api/upload_to_yt', methods=['POST'])
 def upload_to_yt():
     """Upload video to YouTube with original metadata"""
@@ -690,6 +1016,7 @@ def upload_to_yt():
         
         filename = data.get('filename', '')
         video_id = data.get('video_id', None)
+        job_id = data.get('job_id', None)
         privacy_status = data.get('privacy_status', 'private')
         
         if not os.path.exists(filename):
@@ -707,8 +1034,7 @@ def upload_to_yt():
             try:
                 logger.info(f"Fetching metadata for video ID: {youtube_id}")
                 
-                with yt_dlp.YoutubeDL({'quiet': True, 'skip_download': True}) as ydl:
-                    info = ydl.extract_info(f"https://www.youtube.com/watch?v={youtube_id}", download=False)
+                info = metadata_cache.get_info(f"https://www.youtube.com/watch?v={youtube_id}")
                 
                 title = info.get('title', 'Unknown title')
                 description = info.get('description', '')
@@ -723,27 +1049,17 @@ def upload_to_yt():
             return jsonify({'error': 'Video ID is required for upload with original metadata'}), 400
         
         # Now upload to YouTube with the original metadata
-        # Google OAuth credentials from session
-        if 'credentials' not in session:
+        # Google OAuth credentials from the token store
+        credentials = current_credentials()
+        if credentials is None:
             return jsonify({'error': 'Not authenticated with Google, please login first'}), 401
         
-        # Build the YouTube API service object
-        creds_data = json.loads(session['credentials'])
-        credentials = Credentials(
-            token=creds_data['token'],
-            refresh_token=creds_data['refresh_token'],
-            token_uri=creds_data['token_uri'],
-            client_id=creds_data['client_id'],
-            client_secret=creds_data['client_secret'],
-            scopes=creds_data['scopes']
-        )
-        
         # Check if YouTube scope is present
-        if 'https://www.googleapis.com/auth/youtube.upload' not in credentials.scopes:
+        if 'https://www.googleapis.com/auth/youtube.upload' not in (credentials.scopes or []):
             return jsonify({'error': 'YouTube upload permission not granted', 'action_required': 'reauth'}), 403
         
         # Build YouTube API client
-        youtube = build('youtube', 'v3', credentials=credentials)
+        youtube = service_pool.get('youtube', 'v3', credentials)
         
         # Prepare video upload metadata
         body = {
@@ -772,8 +1088,10 @@ def upload_to_yt():
             media_body=media
         )
         
-        # This is a simplified version without a resumable upload
-        response = insert_request.execute()
+        checkpoint = open_upload_session(video_id, 'youtube', filename)
+        with media_store.lease(filename):
+            response = upload_engine.execute(insert_request, job_id=job_id, phase='youtube_upload',
+                                            checkpoint=checkpoint)
         
         logger.info(f"YouTube upload successful: {response}")
         
@@ -805,6 +1123,7 @@ def upload_to_youtube():
         
         filename = data.get('filename', '')
         video_id = data.get('video_id', None)
+        job_id = data.get('job_id', None)
         title = data.get('title', os.path.basename(filename))
         description = data.get('description', 'Uploaded via YouTube Downloader App')
         tags = data.get('tags', '').split(',') if data.get('tags') else []
@@ -819,28 +1138,12 @@ def upload_to_youtube():
         if not os.path.exists(filename):
             return jsonify({'error': 'File not found'}), 404
             
-        # Get authenticated service
-        credentials_data = json.loads(session.get('credentials', '{}'))
-        if not credentials_data:
+        # Get authenticated service, the token store keeps the token fresh
+        credentials = current_credentials()
+        if credentials is None:
             return jsonify({'error': 'Not authenticated with Google'}), 401
             
-        credentials = Credentials(
-            token=credentials_data.get('token'),
-            refresh_token=credentials_data.get('refresh_token'),
-            token_uri=credentials_data.get('token_uri'),
-            client_id=credentials_data.get('client_id'),
-            client_secret=credentials_data.get('client_secret'),
-            scopes=credentials_data.get('scopes')
-        )
-        
-        if credentials.expired:
-            request_obj = Request()
-            credentials.refresh(request_obj)
-            # Update stored credentials
-            credentials_data['token'] = credentials.token
-            session['credentials'] = json.dumps(credentials_data)
-            
-        youtube_service = build('youtube', 'v3', credentials=credentials)
+        youtube_service = service_pool.get('youtube', 'v3', credentials)
         
         # Create video metadata
         body = {
@@ -855,12 +1158,11 @@ def upload_to_youtube():
             }
         }
         
-        # Create media upload with progress reporting
+        # Create media upload, the upload engine picks the chunk size
         media = MediaFileUpload(
             filename, 
             mimetype='video/mp4',
-            resumable=True,
-            chunksize=1024*1024
+            resumable=True
         )
         
         # Upload video
@@ -870,17 +1172,11 @@ def upload_to_youtube():
             media_body=media
         )
         
-        response = None
-        last_progress = 0
-        
-        while response is None:
-            status, response = request_obj.next_chunk()
-            if status:
-                progress = int(status.progress() * 100)
-                # Only log if progress has changed significantly
-                if progress - last_progress >= 5:
-                    logger.info(f"YouTube upload progress: {progress}%")
-                    last_progress = progress
+        # Continue an interrupted upload of the same file instead of starting over
+        checkpoint = open_upload_session(video_id, 'youtube', filename) if video_id else None
+        with media_store.lease(filename):
+            response = upload_engine.execute(request_obj, job_id=job_id, phase='youtube_upload',
+                                            checkpoint=checkpoint)
         
         youtube_video_id = response.get('id')
         logger.info(f"Video uploaded successfully to YouTube. ID: {youtube_video_id}")
@@ -899,7 +1195,7 @@ def upload_to_youtube():
             if video and video.uploaded_to_drive and os.path.exists(filename):
                 logger.info(f"Cleaning up file after successful uploads: {filename}")
                 try:
-                    os.remove(filename)
+                    media_store.discard(filename)
                 except Exception as e:
                     logger.error(f"Error removing temporary file: {e}")
                 
@@ -925,38 +1221,170 @@ def upload_to_youtube():
 
 @app.route('/download_file/<path:filename>')
 def download_file(filename):
-    """Download a file to user's device"""
+    """Download a file to user's device, resumable with Range requests"""
     try:
-        # Ensure the file exists and is within the temp directory
-        if not os.path.exists(filename) or not filename.startswith(temp_dir):
+        # The router merges the leading slash of absolute paths away
+        if not os.path.isabs(filename):
+            filename = '/' + filename
+        
+        # Ensure the file exists and is a finished download
+        if not os.path.exists(filename) or not workdir.is_media(filename):
             return jsonify({'error': 'File not found'}), 404
+        
+        download_name = os.path.basename(filename)
+        # The janitor evicts least recently used files first
+        media_store.touch(filename)
+        if app.config.get('DOWNLOAD_OFFLOAD'):
+            # No lease outlives this request, the janitor spares recently used files instead
+            return offloaded_file_response(filename, download_name)
             
-        return send_file(
-            filename,
-            as_attachment=True,
-            download_name=os.path.basename(filename)
-        )
+        # Keep the janitor away from the file until the transfer is done
+        lease = media_store.open_lease(filename)
+        try:
+            # Conditional responses answer Range and If-Range against the file's ETag
+            response = send_file(
+                filename,
+                as_attachment=True,
+                download_name=download_name,
+                conditional=True,
+                etag=True
+            )
+        except Exception:
+            lease.close()
+            raise
+        response.call_on_close(lease.close)
+        return response
+    except HTTPException:
+        # e.g. 416 for a range past the end of the file
+        raise
     except Exception as e:
         logger.error(f"Error downloading file: {e}")
         return jsonify({'error': str(e)}), 500
 
+def offloaded_file_response(path, download_name):
+    """
+    Let the front proxy send a media file instead of a Python worker
+
+    The proxy handles Range and If-Range itself and sends with sendfile().
+    For nginx, DOWNLOAD_OFFLOAD_PREFIX must be an internal location aliased
+    to the media directory, e.g.
+    location /protected-media/ { internal; alias <WORK_DIR>/media/; }
+    """
+    mode = app.config['DOWNLOAD_OFFLOAD']
+    real_path = os.path.realpath(path)
+    response = Response(mimetype=mimetypes.guess_type(real_path)[0] or 'application/octet-stream')
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(real_path, workdir.media_dir)
+        prefix = app.config['DOWNLOAD_OFFLOAD_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative)}"
+    elif mode == 'x-sendfile':
+        response.headers['X-Sendfile'] = real_path
+    else:
+        raise ValueError(f"Unknown DOWNLOAD_OFFLOAD mode: {mode}")
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return response
+
 @app.route('/history', methods=['GET'])
 def get_history():
-    """Get download/upload history"""
+    """Get one page of download/upload history, newest first"""
     try:
-        # Get all videos from database, ordered by download date (newest first)
-        videos = Video.query.order_by(Video.download_date.desc()).all()
-        
-        # Convert to list of dictionaries
-        video_list = [video.to_dict() for video in videos]
+        # Pages only change when videos or their local files do
+        not_modified = http_cache.precondition(*history_state())
+        if not_modified:
+            return not_modified
+        
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        # locally_available reads media_files, load them for the whole page in one query
+        query = Video.query.options(selectinload(Video.media_files))
+        
+        for field in ('uploaded_to_drive', 'uploaded_to_youtube'):
+            value = request.args.get(field)
+            if value is not None:
+                query = query.filter(getattr(Video, field) == (value.lower() in ('1', 'true', 'yes')))
+        if request.args.get('uploader'):
+            query = query.filter(Video.uploader == request.args['uploader'])
+        if request.args.get('date_from'):
+            query = query.filter(Video.download_date >= parse_history_date(request.args['date_from']))
+        if request.args.get('date_to'):
+            query = query.filter(Video.download_date < parse_history_date(request.args['date_to'], end=True))
+        
+        # Keyset pagination: continue strictly after the last row of the previous page
+        cursor = request.args.get('cursor')
+        if cursor:
+            last_date, last_id = decode_history_cursor(cursor)
+            query = query.filter(db.tuple_(Video.download_date, Video.id) < (last_date, last_id))
+        
+        videos = query.order_by(Video.download_date.desc(), Video.id.desc()).limit(limit + 1).all()
+        has_more = len(videos) > limit
+        videos = videos[:limit]
         
         return jsonify({
             'status': 'success',
-            'videos': video_list
+            'videos': [video.to_dict() for video in videos],
+            'next_cursor': encode_history_cursor(videos[-1]) if has_more else None
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting history: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/search', methods=['GET'])
+def search_videos():
+    """Full-text search over downloaded videos, best matches first"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'No search query provided'}), 400
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        
+        results, has_more = video_search.search(query, page=page, per_page=per_page)
+        
+        return jsonify({
+            'status': 'success',
+            'videos': [dict(video.to_dict(), rank=rank) for video, rank in results],
+            'page': page,
+            'per_page': per_page,
+            'next_page': page + 1 if has_more else None
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error searching videos: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def history_state():
+    """Return stamps that change whenever any history page would change"""
+    return db.session.query(
+        db.func.max(Video.id),
+        db.func.max(Video.updated_at),
+        db.session.query(db.func.count(MediaFile.id)).scalar_subquery(),
+        db.session.query(db.func.max(MediaFile.id)).scalar_subquery()
+    ).one()
+
+def encode_history_cursor(video):
+    """Encode the sort key of the last video on a page as an opaque cursor"""
+    raw = json.dumps([video.download_date.isoformat(), video.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_history_cursor(cursor):
+    """Decode a cursor from encode_history_cursor(), raising ValueError if it is invalid"""
+    try:
+        download_date, video_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(download_date), int(video_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def parse_history_date(value, end=False):
+    """Parse an ISO date filter; a bare end date includes that whole day"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
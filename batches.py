@@ -0,0 +1,222 @@
+import logging
+import threading
+import uuid
+from urllib.parse import urlparse
+
+from jobs import owner_is_gone, process_owner
+from models import db, DownloadBatch
+
+logger = logging.getLogger(__name__)
+
+# Hostnames that are served by the same origin
+HOST_ALIASES = {
+    'youtu.be': 'youtube.com',
+    'm.youtube.com': 'youtube.com',
+    'music.youtube.com': 'youtube.com',
+}
+
+def host_key(url):
+    """Return the origin a URL is downloaded from, for per-host limits"""
+    host = urlparse(url).netloc.lower().split(':')[0]
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    return HOST_ALIASES.get(host, host)
+
+class BatchScheduler:
+    """
+    Dispatches the jobs of download batches onto the job queue
+
+    Each batch has its own concurrency limit, and all batches share a limit
+    on concurrent downloads per host. The job queue's worker pool acts as
+    the global limit.
+    """
+
+    def __init__(self, job_queue, app=None):
+        self.app = None
+        self.job_queue = job_queue
+        self.max_urls = 200
+        self.max_expansion = 1000
+        self.default_concurrency = 3
+        self.max_concurrency = 10
+        self.per_host_limit = 4
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read batch limits from the application config"""
+        self.app = app
+        self.max_urls = app.config.get('BATCH_MAX_URLS', self.max_urls)
+        self.max_expansion = app.config.get('PLAYLIST_MAX_VIDEOS', self.max_expansion)
+        self.default_concurrency = app.config.get('BATCH_DEFAULT_CONCURRENCY', self.default_concurrency)
+        self.max_concurrency = app.config.get('BATCH_MAX_CONCURRENCY', self.max_concurrency)
+        self.per_host_limit = app.config.get('DOWNLOAD_PER_HOST_LIMIT', self.per_host_limit)
+        with app.app_context():
+            self.recover()
+
+    def recover(self):
+        """Close the listings of playlists and channels that an exited process left open"""
+        batches = DownloadBatch.query.filter_by(expanding=True).all()
+        interrupted = [batch for batch in batches if owner_is_gone(batch.owner)]
+        for batch in interrupted:
+            batch.expanding = False
+            batch.error = 'Listing interrupted by a server restart'
+        db.session.commit()
+        if interrupted:
+            logger.warning(f"Closed {len(interrupted)} interrupted batch listings")
+        return len(interrupted)
+
+    def submit(self, items, handler, concurrency=None):
+        """
+        Create a batch and start dispatching its valid items
+
+        Args:
+            items (list): (url, error) pairs; items with an error are
+                recorded as failed without being downloaded
+            handler (callable): Job handler, see JobQueue.submit()
+            concurrency (int): Downloads of this batch allowed at once
+
+        Returns:
+            DownloadBatch: The new batch
+        """
+        if not items:
+            raise ValueError('No URLs given')
+        if len(items) > self.max_urls:
+            raise ValueError(f'A batch may contain at most {self.max_urls} URLs')
+
+        concurrency = self._concurrency(concurrency)
+
+        batch = DownloadBatch(id=uuid.uuid4().hex, concurrency=concurrency)
+        db.session.add(batch)
+        db.session.commit()
+
+        pending = []
+        for position, (url, error) in enumerate(items):
+            job = self.job_queue.create(
+                url,
+                status='failed' if error else 'queued',
+                error=error,
+                batch_id=batch.id,
+                batch_position=position
+            )
+            if not error:
+                pending.append((job.id, url))
+
+        self.start(batch.id, pending, handler, concurrency)
+        logger.info(f"Batch {batch.id}: {len(pending)} of {len(items)} URLs scheduled, concurrency {concurrency}")
+        return batch
+
+    def submit_expansion(self, source_url, entries, handler, skip=None, concurrency=None):
+        """
+        Create a batch that is filled while a playlist or channel is listed
+
+        Args:
+            source_url (str): Playlist or channel URL
+            entries (iterable): Lazily produces (url, youtube id) pairs
+            handler (callable): Job handler, see JobQueue.submit()
+            skip (callable): Called with a youtube id, True to leave it out
+            concurrency (int): Downloads of this batch allowed at once
+
+        Returns:
+            DownloadBatch: The new batch
+        """
+        concurrency = self._concurrency(concurrency)
+
+        batch = DownloadBatch(
+            id=uuid.uuid4().hex,
+            concurrency=concurrency,
+            source_url=source_url,
+            expanding=True,
+            skipped=0,
+            owner=process_owner()
+        )
+        db.session.add(batch)
+        db.session.commit()
+
+        thread = threading.Thread(
+            target=self._expand,
+            args=(batch.id, entries, handler, skip, concurrency),
+            name=f'expand-{batch.id[:8]}',
+            daemon=True
+        )
+        thread.start()
+        logger.info(f"Batch {batch.id}: expanding {source_url}")
+        return batch
+
+    def _expand(self, batch_id, entries, handler, skip, concurrency):
+        """Turn listed entries into jobs and dispatch each as soon as it is found"""
+        with self.app.app_context():
+            stats = {'skipped': 0, 'error': None}
+
+            def discovered():
+                position = 0
+                try:
+                    for url, youtube_id in entries:
+                        if position >= self.max_expansion:
+                            logger.warning(f"Batch {batch_id}: stopping at {self.max_expansion} videos")
+                            break
+                        if skip is not None and skip(youtube_id):
+                            stats['skipped'] += 1
+                            continue
+                        job = self.job_queue.create(url, batch_id=batch_id, batch_position=position)
+                        position += 1
+                        yield job.id, url
+                except Exception as e:
+                    logger.error(f"Batch {batch_id}: listing failed: {e}")
+                    stats['error'] = str(e)
+
+            try:
+                self._dispatch(batch_id, discovered(), handler, concurrency)
+            finally:
+                batch = db.session.get(DownloadBatch, batch_id)
+                batch.expanding = False
+                batch.skipped = stats['skipped']
+                batch.error = stats['error']
+                db.session.commit()
+                logger.info(f"Batch {batch_id}: expansion done, {stats['skipped']} already downloaded")
+
+    def start(self, batch_id, pending, handler, concurrency):
+        """Dispatch (job id, url) pairs of a batch from a background thread"""
+        thread = threading.Thread(
+            target=self._dispatch,
+            args=(batch_id, pending, handler, concurrency),
+            name=f'batch-{batch_id[:8]}',
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _dispatch(self, batch_id, pending, handler, concurrency):
+        """Hand jobs to the queue as the batch and host limits allow"""
+        batch_slots = threading.BoundedSemaphore(concurrency)
+        for job_id, url in pending:
+            host_slots = self._host_slots_for(url)
+            batch_slots.acquire()
+            host_slots.acquire()
+
+            def release(_, host_slots=host_slots):
+                host_slots.release()
+                batch_slots.release()
+
+            try:
+                self.job_queue.enqueue(job_id, handler, on_done=release)
+            except Exception as e:
+                logger.error(f"Batch {batch_id}: could not schedule job {job_id}: {e}")
+                release(job_id)
+
+    def _concurrency(self, requested):
+        """Validate a requested concurrency and clamp it to the configured maximum"""
+        try:
+            concurrency = int(requested or self.default_concurrency)
+        except (TypeError, ValueError):
+            raise ValueError('concurrency must be an integer')
+        return max(1, min(concurrency, self.max_concurrency))
+
+    def _host_slots_for(self, url):
+        """Return the semaphore limiting concurrent downloads from a URL's host"""
+        key = host_key(url)
+        with self._lock:
+            if key not in self._host_slots:
+                self._host_slots[key] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[key]
@@ -0,0 +1,187 @@
+"""
+Download throughput of each download mode against a local fixture server
+
+Starts a threaded HTTP server that serves a progressive file with Range
+support and an HLS playlist of fragments, throttling every connection like
+a video CDN does. Then it downloads both through the download engine once
+per mode and prints the time and throughput. aria2c is skipped when it
+isn't installed.
+
+Usage:
+    python benchmarks/download_modes.py [--size 32] [--fragments 32] [--connection-rate 4096]
+                                        [--rate-limit 0] [--repeat 2]
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from download_engine import DOWNLOAD_MODES, DownloadEngine
+
+# Bytes written between throttling checks
+WRITE_CHUNK = 64 * 1024
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves /video.mp4, /playlist.m3u8 and its /fragment/<n>.ts files"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def respond(self, head):
+        server = self.server
+        if self.path.split('?')[0] == '/playlist.m3u8':
+            body = server.playlist.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+            return
+
+        match = re.fullmatch(r'/fragment/(\d+)\.ts', self.path.split('?')[0])
+        if self.path.split('?')[0] == '/video.mp4':
+            data, content_type = server.video, 'video/mp4'
+        elif match and int(match.group(1)) < len(server.fragments):
+            data, content_type = server.fragments[int(match.group(1))], 'video/mp2t'
+        else:
+            self.send_error(404)
+            return
+
+        start, end = 0, len(data) - 1
+        ranged = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if ranged:
+            start = int(ranged.group(1))
+            end = min(int(ranged.group(2)), end) if ranged.group(2) else end
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if not head:
+            self.send_throttled(data, start, end + 1)
+
+    def send_throttled(self, data, start, stop):
+        """Write a byte range no faster than the server's per-connection rate"""
+        rate = self.server.connection_rate
+        started = time.monotonic()
+        sent = 0
+        try:
+            for offset in range(start, stop, WRITE_CHUNK):
+                chunk = data[offset:min(offset + WRITE_CHUNK, stop)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if rate:
+                    delay = sent / rate - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Downloaders drop connections they no longer need
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def start_server(size, fragments, connection_rate):
+    server = FixtureServer(('127.0.0.1', 0), FixtureHandler)
+    server.connection_rate = connection_rate
+    server.video = os.urandom(size)
+    fragment_size = max(size // fragments, 1)
+    server.fragments = [server.video[i:i + fragment_size] for i in range(0, size, fragment_size)]
+    server.playlist = '\n'.join(
+        ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+        + [f'#EXTINF:4.0,\n/fragment/{i}.ts' for i in range(len(server.fragments))]
+        + ['#EXT-X-ENDLIST', '']
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def create_app(work_dir, mode, rate_limit):
+    app = Flask(__name__)
+    app.config.update(
+        WORK_DIR=work_dir,
+        DOWNLOAD_WORKERS=1,
+        DOWNLOAD_ENGINE_PROCESSES=1,
+        DOWNLOAD_MODE=mode,
+        DOWNLOAD_RATE_LIMIT=rate_limit,
+    )
+    return app
+
+def run_mode(mode, urls, work_dir, args):
+    engine = DownloadEngine(create_app(work_dir, mode, args.rate_limit))
+    if engine.mode != mode:
+        print(f'{mode}: skipped, aria2c is not installed')
+        engine.shutdown()
+        return
+    try:
+        for name, url in urls.items():
+            # The first download starts the worker, the timed ones reuse it
+            engine.download(url, os.path.join(work_dir, f'warm-{mode}-{name}'), 'best')
+            timings = []
+            for i in range(args.repeat):
+                path = os.path.join(work_dir, f'{mode}-{name}-{i}')
+                started = time.perf_counter()
+                result = engine.download(url, path, 'best')
+                timings.append(time.perf_counter() - started)
+                size = os.path.getsize(result['filename'])
+                os.remove(result['filename'])
+            elapsed = min(timings)
+            print(f'{mode:10} {name:12} {elapsed:7.2f} s  {size / elapsed / 1024 ** 2:8.2f} MiB/s')
+    except Exception as e:
+        print(f'{mode}: failed: {e}')
+    finally:
+        engine.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=32, help='Fixture size in MiB')
+    parser.add_argument('--fragments', type=int, default=32, help='Fragments of the HLS fixture')
+    parser.add_argument('--connection-rate', type=int, default=4096, help='Server KiB/s per connection, 0 unlimited')
+    parser.add_argument('--rate-limit', type=int, default=0, help='DOWNLOAD_RATE_LIMIT in KiB/s, 0 unlimited')
+    parser.add_argument('--repeat', type=int, default=2, help='Timed downloads per mode and fixture')
+    args = parser.parse_args()
+    args.rate_limit *= 1024
+
+    server = start_server(args.size * 1024 ** 2, args.fragments, args.connection_rate * 1024)
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    urls = {'progressive': f'{base}/video.mp4', 'hls': f'{base}/playlist.m3u8'}
+    print(f'Fixture: {args.size} MiB, {len(server.fragments)} fragments, '
+          f'{args.connection_rate or "unlimited"} KiB/s per connection, aria2c: {bool(shutil.which("aria2c"))}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in DOWNLOAD_MODES:
+            run_mode(mode, urls, tmp, args)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Query plans and timings of hot lookups before and after the schema migrations
+
+Builds a throwaway SQLite database, drops the indexes the migrations add to
+get the old schema, fills it with rows and prints EXPLAIN QUERY PLAN output
+and timings. Then it runs the migrations and prints the same again.
+
+Usage:
+    python benchmarks/query_plans.py [--videos 50000] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+from models import db, User, Video, ApiCredential
+
+NEW_INDEXES = [
+    'ix_video_download_date_id',
+    'ix_video_drive_download_date_id',
+    'ix_video_youtube_download_date_id',
+    'ix_video_uploader_download_date_id',
+    'ix_video_youtube_id',
+    'uq_api_credential_service_name',
+]
+
+QUERIES = {
+    'history page': (
+        'SELECT id FROM video ORDER BY download_date DESC, id DESC LIMIT 50',
+        {}
+    ),
+    'history page, drive filter': (
+        'SELECT id FROM video WHERE uploaded_to_drive = 1 '
+        'ORDER BY download_date DESC, id DESC LIMIT 50',
+        {}
+    ),
+    'video by youtube_id': (
+        'SELECT id FROM video WHERE youtube_id = :youtube_id',
+        {'youtube_id': 'vid0012345'}
+    ),
+    'credentials by service_name': (
+        'SELECT client_id FROM api_credential WHERE service_name = :service_name',
+        {'service_name': 'service-0777'}
+    ),
+    'user by email': (
+        'SELECT id FROM user WHERE email = :email',
+        {'email': 'user0777@example.com'}
+    ),
+}
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+def populate(videos):
+    start = datetime(2024, 1, 1)
+    db.session.bulk_insert_mappings(Video, [
+        {
+            'youtube_id': f'vid{i:07d}',
+            'title': f'Video {i}',
+            'url': f'https://www.youtube.com/watch?v=vid{i:07d}',
+            'uploader': f'Channel {i % 97}',
+            'download_date': start + timedelta(minutes=i),
+            'uploaded_to_drive': i % 3 == 0,
+            'uploaded_to_youtube': i % 5 == 0,
+        }
+        for i in range(videos)
+    ])
+    db.session.bulk_insert_mappings(ApiCredential, [
+        {'service_name': f'service-{i:04d}', 'client_id': f'client-{i}', 'client_secret': 'secret'}
+        for i in range(1000)
+    ])
+    db.session.bulk_insert_mappings(User, [
+        {'username': f'user{i}', 'email': f'user{i:04d}@example.com'}
+        for i in range(1000)
+    ])
+    db.session.commit()
+
+def report(label, repeat):
+    print(f'\n== {label} ==')
+    with db.engine.connect() as connection:
+        for name, (sql, params) in QUERIES.items():
+            plan = connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params).fetchall()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(text(sql), params).fetchall()
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            print(f'{name}: {elapsed:.3f} ms')
+            for row in plan:
+                print(f'    {row[-1]}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--videos', type=int, default=50000, help='Number of video rows')
+    parser.add_argument('--repeat', type=int, default=200, help='Runs per query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            with db.engine.begin() as connection:
+                for name in NEW_INDEXES:
+                    connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+            populate(args.videos)
+            report('before migrations', args.repeat)
+
+            applied = migrations.upgrade()
+            with db.engine.begin() as connection:
+                connection.execute(text('ANALYZE'))
+            print(f'\nApplied migrations: {applied}')
+            report('after migrations', args.repeat)
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     # Flask configuration
@@ -11,3 +12,76 @@ class Config:
     
     # Application configuration
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500 MB max upload size
+    
+    # Downloads pick the best format up to this height unless the request asks otherwise
+    DEFAULT_MAX_HEIGHT = int(os.environ.get('DEFAULT_MAX_HEIGHT', 360))
+    
+    # Background download jobs
+    DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 3))
+    DOWNLOAD_QUEUE_SIZE = int(os.environ.get('DOWNLOAD_QUEUE_SIZE', 50))
+    
+    # yt-dlp worker processes kept warm between downloads
+    DOWNLOAD_ENGINE_PROCESSES = int(os.environ.get('DOWNLOAD_ENGINE_PROCESSES', DOWNLOAD_WORKERS))
+    DOWNLOAD_ENGINE_MAX_TASKS = int(os.environ.get('DOWNLOAD_ENGINE_MAX_TASKS', 50))  # downloads before a worker is replaced, 0 never
+    DOWNLOAD_ENGINE_TIMEOUT = int(os.environ.get('DOWNLOAD_ENGINE_TIMEOUT', 6 * 3600))  # seconds per download
+    
+    # Download acceleration: 'default', 'fragments' (parallel DASH/HLS fragments) or 'aria2c'
+    DOWNLOAD_MODE = os.environ.get('DOWNLOAD_MODE', 'fragments')
+    DOWNLOAD_CONCURRENT_FRAGMENTS = int(os.environ.get('DOWNLOAD_CONCURRENT_FRAGMENTS', 4))
+    DOWNLOAD_ARIA2C_CONNECTIONS = int(os.environ.get('DOWNLOAD_ARIA2C_CONNECTIONS', 8))  # connections per file
+    DOWNLOAD_RATE_LIMIT = int(os.environ.get('DOWNLOAD_RATE_LIMIT', 0))  # bytes/s for all downloads of a process, 0 unlimited
+    
+    # Download and metadata backends in order of preference; failing ones are skipped for a while
+    DOWNLOAD_STRATEGIES = os.environ.get('DOWNLOAD_STRATEGIES', 'yt-dlp,yt-dlp-cli,pytube,youtube-dl').split(',')
+    STRATEGY_WINDOW = int(os.environ.get('STRATEGY_WINDOW', 600))  # seconds of calls the success rate covers
+    STRATEGY_FAILURE_THRESHOLD = int(os.environ.get('STRATEGY_FAILURE_THRESHOLD', 3))  # failures in a row that open the circuit
+    STRATEGY_COOLDOWN = int(os.environ.get('STRATEGY_COOLDOWN', 300))  # seconds before a failing backend is tried again
+    
+    # yt-dlp metadata cache
+    METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 256))
+    METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 600))  # seconds
+    METADATA_DB_TTL = int(os.environ.get('METADATA_DB_TTL', 24 * 3600))  # seconds before a stored row is refreshed
+    
+    # Scratch space for running downloads and finished media files
+    WORK_DIR = os.environ.get('WORK_DIR', os.path.join(tempfile.gettempdir(), 'directtoyt'))
+    
+    # Media janitor: evict least recently used files over budget or age
+    MEDIA_MAX_BYTES = int(os.environ.get('MEDIA_MAX_BYTES', 10 * 1024 ** 3))
+    MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 24 * 3600))  # seconds since last use
+    SCRATCH_MAX_AGE = int(os.environ.get('SCRATCH_MAX_AGE', 6 * 3600))  # abandoned job dirs
+    JANITOR_INTERVAL = int(os.environ.get('JANITOR_INTERVAL', 300))  # seconds, 0 disables
+    
+    # Batch downloads
+    BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 200))
+    BATCH_DEFAULT_CONCURRENCY = int(os.environ.get('BATCH_DEFAULT_CONCURRENCY', 3))
+    BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 10))
+    DOWNLOAD_PER_HOST_LIMIT = int(os.environ.get('DOWNLOAD_PER_HOST_LIMIT', 4))
+    PLAYLIST_MAX_VIDEOS = int(os.environ.get('PLAYLIST_MAX_VIDEOS', 1000))  # new videos queued per expansion
+    
+    # Resumable uploads: chunk sizes adapt to throughput within these bounds
+    UPLOAD_CHUNK_INITIAL = int(os.environ.get('UPLOAD_CHUNK_INITIAL', 8 * 1024 * 1024))
+    UPLOAD_CHUNK_MIN = int(os.environ.get('UPLOAD_CHUNK_MIN', 1024 * 1024))
+    UPLOAD_CHUNK_MAX = int(os.environ.get('UPLOAD_CHUNK_MAX', 128 * 1024 * 1024))
+    UPLOAD_CHUNK_TARGET_SECONDS = float(os.environ.get('UPLOAD_CHUNK_TARGET_SECONDS', 8))  # per chunk
+    UPLOAD_MAX_RETRIES = int(os.environ.get('UPLOAD_MAX_RETRIES', 5))  # per chunk
+    
+    # Pooled Google API clients
+    CLIENT_POOL_IDLE_TIMEOUT = int(os.environ.get('CLIENT_POOL_IDLE_TIMEOUT', 300))  # seconds before an idle client is closed
+    CLIENT_POOL_MAX_IDLE = int(os.environ.get('CLIENT_POOL_MAX_IDLE', 4))  # idle clients kept per user and API
+    
+    # Server-side OAuth tokens, refreshed in the background before they expire
+    TOKEN_REFRESH_MARGIN = int(os.environ.get('TOKEN_REFRESH_MARGIN', 300))  # seconds before expiry
+    TOKEN_REFRESH_INTERVAL = int(os.environ.get('TOKEN_REFRESH_INTERVAL', 60))  # seconds, 0 disables
+    
+    # Drive folder index: seconds between syncs with the Drive changes API
+    DRIVE_SYNC_INTERVAL = int(os.environ.get('DRIVE_SYNC_INTERVAL', 60))
+    
+    # Response compression and static asset caching
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # bytes, smaller bodies are sent as is
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 365 * 24 * 3600))  # seconds, for fingerprinted URLs
+    
+    # Hand /download_file transfers to the front proxy: '', 'x-accel-redirect' (nginx) or 'x-sendfile'
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '')
+    DOWNLOAD_OFFLOAD_PREFIX = os.environ.get('DOWNLOAD_OFFLOAD_PREFIX', '/protected-media/')  # internal nginx location of the media dir
+    DOWNLOAD_OFFLOAD_LEASE = int(os.environ.get('DOWNLOAD_OFFLOAD_LEASE', 6 * 3600))  # seconds the janitor spares a file handed to the proxy
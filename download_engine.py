@@ -0,0 +1,362 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress events sent by a worker for one download
+PROGRESS_INTERVAL = 0.5
+
+# yt-dlp options shared by every download of a worker
+BASE_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'noprogress': True,
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'geo_bypass': True,
+    'merge_output_format': 'mp4',
+}
+
+# Download modes: yt-dlp's own downloader, parallel fragments, or aria2c
+DOWNLOAD_MODES = ('default', 'fragments', 'aria2c')
+
+# Protocols yt-dlp downloads in fragments, with concurrent_fragment_downloads threads
+FRAGMENTED_PROTOCOLS = ('m3u8', 'm3u8_native', 'http_dash_segments', 'http_dash_segments_generator')
+
+# yt-dlp options a mode may set, reset before every download
+ACCELERATION_KEYS = ('concurrent_fragment_downloads', 'external_downloader', 'external_downloader_args', 'ratelimit')
+
+def acceleration_options(mode, fragments=1, connections=1, rate_limit=0):
+    """
+    Build the yt-dlp options of a download mode
+
+    Args:
+        mode (str): One of DOWNLOAD_MODES
+        fragments (int): DASH/HLS fragments fetched at the same time
+        connections (int): aria2c connections per file
+        rate_limit (int): Bytes per second for the whole download, 0 for none
+
+    Returns:
+        dict: Options to merge into the YoutubeDL params
+    """
+    if mode not in DOWNLOAD_MODES:
+        raise ValueError(f"Download mode must be one of {', '.join(DOWNLOAD_MODES)}")
+
+    options = {}
+    if mode in ('fragments', 'aria2c') and fragments > 1:
+        options['concurrent_fragment_downloads'] = fragments
+    if mode == 'aria2c':
+        # Direct http(s) formats are split over several connections,
+        # other protocols stay with yt-dlp's native downloaders
+        options['external_downloader'] = {'default': 'aria2c'}
+        options['external_downloader_args'] = {'aria2c': [
+            f'--max-connection-per-server={connections}', f'--split={connections}', '--min-split-size=1M'
+        ]}
+    if rate_limit:
+        # aria2c applies it as --max-overall-download-limit; the worker splits
+        # it between fragment threads, which throttle on their own
+        options['ratelimit'] = rate_limit
+    return options
+
+class DownloadEngineError(RuntimeError):
+    """A download failed in, or together with, its worker process"""
+
+class DownloadEngine:
+    """
+    Runs yt-dlp downloads in long-lived worker processes
+
+    Each worker imports yt-dlp once and keeps a single YoutubeDL instance,
+    so extractors, the YouTube player code cache and cookies stay warm
+    between downloads instead of being rebuilt by a new CLI process every
+    time. Workers run this module as a script and talk JSON lines over
+    their stdin and stdout: a download is sent as plain arguments, answered
+    with progress events and a result. Workers start on demand, up to
+    DOWNLOAD_ENGINE_PROCESSES, and are replaced after
+    DOWNLOAD_ENGINE_MAX_TASKS downloads or when they die.
+
+    DOWNLOAD_MODE speeds up single downloads with parallel fragments or
+    aria2c. DOWNLOAD_RATE_LIMIT caps the bandwidth of all downloads of the
+    process; every download job gets an equal share of it.
+    """
+
+    def __init__(self, app=None):
+        self.processes = 3
+        self.max_tasks = 50
+        self.timeout = 6 * 3600
+        self.state_dir = None
+        self.mode = 'default'
+        self.rate_limit = 0
+        self.options = {}
+        self._idle = queue.LifoQueue()
+        self._slots = None
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._stats = {'completed': 0, 'failed': 0, 'started': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read pool settings from the config; workers start on the first download"""
+        self.processes = app.config.get('DOWNLOAD_ENGINE_PROCESSES', self.processes)
+        self.max_tasks = app.config.get('DOWNLOAD_ENGINE_MAX_TASKS', self.max_tasks)
+        self.timeout = app.config.get('DOWNLOAD_ENGINE_TIMEOUT', self.timeout)
+        self.state_dir = os.path.join(app.config['WORK_DIR'], 'engine')
+        self._slots = threading.BoundedSemaphore(self.processes)
+
+        self.mode = app.config.get('DOWNLOAD_MODE', self.mode)
+        if self.mode == 'aria2c' and not shutil.which('aria2c'):
+            logger.warning("aria2c not found, downloading fragments concurrently instead")
+            self.mode = 'fragments'
+        fragments = app.config.get('DOWNLOAD_CONCURRENT_FRAGMENTS', 4)
+        connections = app.config.get('DOWNLOAD_ARIA2C_CONNECTIONS', 8)
+        total = app.config.get('DOWNLOAD_RATE_LIMIT', 0)
+        # Download jobs run on the job queue workers, at most that many download at once
+        concurrent = max(app.config.get('DOWNLOAD_WORKERS', self.processes), self.processes, 1)
+        self.rate_limit = max(total // concurrent, 1) if total else 0
+        self.options = acceleration_options(self.mode, fragments, connections, self.rate_limit)
+        logger.info(f"Download mode {self.mode}, rate limit per download {self.rate_limit or 'none'}")
+
+    def cli_arguments(self):
+        """yt-dlp command line options with this process' rate limit, for piped downloads"""
+        # Piped downloads are single progressive files, fragment threads wouldn't help them
+        if self.rate_limit:
+            return ['--limit-rate', str(self.rate_limit)]
+        return []
+
+    def download(self, url, output_path, format_selector, progress=None):
+        """
+        Download a video in a worker process and wait for it to finish
+
+        Args:
+            url (str): Video URL
+            output_path (str): File to write
+            format_selector (str): yt-dlp format selector
+            progress (callable): Called with downloaded_bytes, total_bytes,
+                speed and eta keyword arguments while the download runs
+
+        Returns:
+            dict: filename, format_id, elapsed seconds and worker pid
+        """
+        with self._slots:
+            worker = self._checkout()
+            try:
+                result = worker.run({'url': url, 'output_path': output_path, 'format': format_selector,
+                                     'options': self.options}, progress, self.timeout)
+            except Exception:
+                with self._lock:
+                    self._stats['failed'] += 1
+                raise
+            else:
+                with self._lock:
+                    self._stats['completed'] += 1
+            finally:
+                self._checkin(worker)
+            return result
+
+    def stats(self):
+        """Return worker and download counters"""
+        with self._lock:
+            return dict(self._stats, workers=len(self._workers), idle=self._idle.qsize(),
+                        mode=self.mode, rate_limit=self.rate_limit)
+
+    def shutdown(self):
+        """Stop all idle workers"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._retire(worker)
+
+    def _checkout(self):
+        """Take an idle worker, or start one; the caller holds a slot"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.alive():
+                return worker
+            self._retire(worker)
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        worker = EngineWorker(self.state_dir)
+        with self._lock:
+            self._workers.add(worker)
+            self._stats['started'] += 1
+        logger.info(f"Started download worker {worker.pid}")
+        return worker
+
+    def _checkin(self, worker):
+        """Keep a healthy worker for the next download, retire a used up or broken one"""
+        if worker.alive() and not worker.busy and (not self.max_tasks or worker.tasks < self.max_tasks):
+            self._idle.put(worker)
+        else:
+            self._retire(worker)
+
+    def _retire(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.stop()
+
+class EngineWorker:
+    """Parent side of one worker process"""
+
+    def __init__(self, state_dir):
+        self.tasks = 0
+        self.busy = False
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), state_dir],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        self.pid = self.process.pid
+        self._events = queue.Queue()
+        threading.Thread(target=self._read, name=f'download-worker-{self.pid}', daemon=True).start()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, task, progress, timeout):
+        """Send one download to the worker and wait for its result"""
+        self.tasks += 1
+        self.busy = True
+        try:
+            self.process.stdin.write(json.dumps(task) + '\n')
+            self.process.stdin.flush()
+        except OSError as e:
+            raise DownloadEngineError(f'Download worker {self.pid} is gone: {e}')
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                event = self._events.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                # A stuck worker would hold the slot forever, replace it
+                self.process.kill()
+                self.process.wait()
+                raise DownloadEngineError(f'Download timed out after {timeout}s')
+
+            kind = event.get('type')
+            if kind == 'progress':
+                if progress is not None:
+                    try:
+                        progress(**event['progress'])
+                    except Exception as e:
+                        logger.debug(f"Progress callback failed: {e}")
+            elif kind == 'result':
+                self.busy = False
+                return event['result']
+            elif kind == 'error':
+                self.busy = False
+                raise DownloadEngineError(event['error'])
+            else:
+                raise DownloadEngineError(f'Download worker {self.pid} exited with code {self.process.wait()}')
+
+    def stop(self):
+        """Close the worker's input so it exits, killing it if it doesn't"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def _read(self):
+        for line in self.process.stdout:
+            try:
+                self._events.put(json.loads(line))
+            except ValueError:
+                logger.debug(f"Download worker {self.pid}: {line.strip()}")
+        self._events.put({'type': 'exit'})
+
+def worker_main(state_dir):
+    """
+    Worker process loop: run downloads read from stdin with one YoutubeDL
+
+    Events go to the original stdout; anything else written there, e.g. by
+    yt-dlp, is redirected to stderr so it can't corrupt the protocol.
+    """
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    import yt_dlp
+
+    current = {'sent': 0.0, 'filename': None}
+
+    def send(event):
+        channel.write(json.dumps(event) + '\n')
+
+    def on_progress(status):
+        if status.get('status') not in ('downloading', 'finished'):
+            return
+        now = time.monotonic()
+        if status['status'] == 'downloading' and now - current['sent'] < PROGRESS_INTERVAL:
+            return
+        current['sent'] = now
+        send({'type': 'progress', 'progress': {
+            'downloaded_bytes': int(status.get('downloaded_bytes') or 0),
+            'total_bytes': int(status.get('total_bytes') or status.get('total_bytes_estimate') or 0) or None,
+            'speed': status.get('speed'),
+            'eta': status.get('eta'),
+        }})
+
+    def on_finished(filename):
+        current['filename'] = filename
+
+    # Cookies stay in the instance's jar, the player code cache on disk is shared by all workers
+    ydl = yt_dlp.YoutubeDL(dict(
+        BASE_OPTIONS,
+        cachedir=os.path.join(state_dir, 'cache'),
+        progress_hooks=[on_progress],
+        post_hooks=[on_finished],
+    ))
+
+    for line in sys.stdin:
+        task = json.loads(line)
+        current.update(sent=0.0, filename=None)
+        started = time.monotonic()
+        try:
+            for key in ACCELERATION_KEYS:
+                ydl.params.pop(key, None)
+            ydl.params.update(task.get('options') or {})
+            ydl.params['outtmpl']['default'] = task['output_path']
+            ydl.params['format'] = task['format']
+            ydl.format_selector = ydl.build_format_selector(task['format'])
+            info = ydl.extract_info(task['url'], download=False)
+            limit_fragment_threads(ydl.params, info)
+            info = ydl.process_ie_result(info, download=True)
+            send({'type': 'result', 'result': {
+                'filename': current['filename'] or task['output_path'],
+                'format_id': (info or {}).get('format_id'),
+                'elapsed': round(time.monotonic() - started, 3),
+                'pid': os.getpid(),
+            }})
+        except Exception as e:
+            send({'type': 'error', 'error': str(e)})
+
+    ydl.close()
+
+def limit_fragment_threads(params, info):
+    """Split the rate limit between the fragment threads of a fragmented download"""
+    threads = params.get('concurrent_fragment_downloads') or 1
+    if not params.get('ratelimit') or threads <= 1:
+        return
+    formats = info.get('requested_formats') or [info]
+    if any(f.get('protocol') in FRAGMENTED_PROTOCOLS for f in formats):
+        params['ratelimit'] = max(params['ratelimit'] // threads, 1)
+
+if __name__ == '__main__':
+    worker_main(sys.argv[1])
@@ -0,0 +1,444 @@
+import json
+import logging
+import math
+import os
+import signal
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+from metadata_cache import normalize_info
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp progress line: downloaded/total/estimated total/speed/eta
+YT_DLP_PROGRESS_TEMPLATE = ('download:[progress] %(progress.downloaded_bytes)s/%(progress.total_bytes)s/'
+                            '%(progress.total_bytes_estimate)s/%(progress.speed)s/%(progress.eta)s')
+
+# Seconds a metadata extraction by an external process may take
+EXTRACT_TIMEOUT = 120
+
+def parse_yt_dlp_progress(line):
+    """
+    Read one line of yt-dlp output printed with YT_DLP_PROGRESS_TEMPLATE
+
+    Returns:
+        dict: downloaded_bytes, total_bytes, speed and eta, or None if the
+        line isn't a progress line
+    """
+    line = line.strip()
+    if not line.startswith('[progress] '):
+        return None
+
+    # Fields that yt-dlp doesn't know are printed as NA
+    try:
+        fields = [None if value == 'NA' else float(value)
+                  for value in line[len('[progress] '):].split('/')]
+    except ValueError:
+        logger.debug(f"Unparseable yt-dlp progress: {line}")
+        return {}
+    downloaded, total, total_estimate, speed, eta = (fields + [None] * 5)[:5]
+    return {
+        'downloaded_bytes': int(downloaded or 0),
+        'total_bytes': int(total or total_estimate or 0) or None,
+        'speed': speed,
+        'eta': eta
+    }
+
+def kill_process_group(process):
+    """Kill a process started with start_new_session and everything it started"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+class StrategyError(RuntimeError):
+    """Every strategy failed, or none could be tried"""
+
+class DownloadStrategy(ABC):
+    """
+    A backend that can download videos and extract their metadata
+
+    download() returns a dict with the downloaded 'filename' and, if the
+    backend knows it, the video's youtube_id, title, duration, thumbnail_url
+    and uploader. extract_info() returns a yt-dlp style info dict.
+    """
+
+    name = None
+
+    def available(self):
+        """Whether the backend is installed"""
+        return True
+
+    @abstractmethod
+    def download(self, url, output_path, format_selector, progress=None):
+        """Download a video to output_path"""
+
+    @abstractmethod
+    def extract_info(self, url):
+        """Extract a video's metadata without downloading it"""
+
+class YtDlpEngineStrategy(DownloadStrategy):
+    """yt-dlp in the warm worker processes, metadata through the shared cache"""
+
+    name = 'yt-dlp'
+
+    def __init__(self, engine, metadata_cache):
+        self.engine = engine
+        self.metadata_cache = metadata_cache
+
+    def download(self, url, output_path, format_selector, progress=None):
+        result = self.engine.download(url, output_path, format_selector, progress=progress)
+        logger.info(f"Downloaded format {result['format_id']} in {result['elapsed']}s")
+        return {'filename': result['filename']}
+
+    def extract_info(self, url):
+        return self.metadata_cache.get_info(url)
+
+class YtDlpCliStrategy(DownloadStrategy):
+    """A new yt-dlp process per call, isolated from the workers' state"""
+
+    name = 'yt-dlp-cli'
+
+    def __init__(self, engine, timeout=6 * 3600):
+        self.engine = engine
+        self.timeout = timeout
+
+    def download(self, url, output_path, format_selector, progress=None):
+        cmd = ['yt-dlp', '--newline', '--progress-template', YT_DLP_PROGRESS_TEMPLATE,
+               '-f', format_selector, '--merge-output-format', 'mp4', '--no-playlist',
+               '--no-check-certificates', '--geo-bypass', *self.engine.cli_arguments(),
+               '-o', output_path, url]
+        logger.info(f"Running command: {cmd}")
+
+        # A session of its own, so a timeout also kills ffmpeg children holding the pipes
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   start_new_session=True)
+        stderr = []
+        timed_out = threading.Event()
+
+        def drain_stderr():
+            stderr.extend(process.stderr)
+
+        def kill():
+            timed_out.set()
+            kill_process_group(process)
+
+        reader = threading.Thread(target=drain_stderr, daemon=True)
+        reader.start()
+        timer = threading.Timer(self.timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            for line in process.stdout:
+                fields = parse_yt_dlp_progress(line)
+                if fields and progress is not None:
+                    progress(**fields)
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                kill_process_group(process)
+            process.wait()
+            reader.join()
+            process.stdout.close()
+            process.stderr.close()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, self.timeout)
+        if returncode != 0:
+            raise RuntimeError(f"yt-dlp exited with status {returncode}: {''.join(stderr[-3:]).strip()}")
+        if not os.path.exists(output_path):
+            raise RuntimeError(f"yt-dlp reported success but {output_path} doesn't exist")
+        return {'filename': output_path}
+
+    def extract_info(self, url):
+        result = subprocess.run(
+            ['yt-dlp', '-J', '--no-playlist', '--no-check-certificates', '--geo-bypass', url],
+            capture_output=True, text=True, timeout=EXTRACT_TIMEOUT
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"yt-dlp exited with status {result.returncode}: {result.stderr.strip()}")
+        return normalize_info(json.loads(result.stdout))
+
+class PytubeStrategy(DownloadStrategy):
+    """pytube, which picks its own progressive stream and ignores the format plan"""
+
+    name = 'pytube'
+
+    def available(self):
+        try:
+            import pytube
+        except ImportError:
+            return False
+        return True
+
+    def download(self, url, output_path, format_selector, progress=None):
+        from pytube import YouTube
+
+        def on_progress(stream, chunk, bytes_remaining):
+            if progress is not None:
+                progress(downloaded_bytes=stream.filesize - bytes_remaining, total_bytes=stream.filesize)
+
+        yt = YouTube(url, use_oauth=False, allow_oauth_cache=False, on_progress_callback=on_progress)
+
+        # A progressive MP4 has audio and video in one file, no merging needed
+        stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+        if stream is None:
+            stream = yt.streams.get_highest_resolution()
+        if stream is None:
+            raise RuntimeError('No suitable stream found for download')
+
+        logger.info(f"Downloading with stream: {stream}")
+        download_path = stream.download(
+            output_path=os.path.dirname(output_path),
+            filename=os.path.basename(output_path)
+        )
+        if not os.path.exists(download_path):
+            raise RuntimeError(f"PyTube reported success but file doesn't exist at {download_path}")
+        return {
+            'youtube_id': yt.video_id,
+            'title': yt.title,
+            'duration': yt.length,
+            'thumbnail_url': yt.thumbnail_url,
+            'uploader': yt.author,
+            'filename': download_path
+        }
+
+    def extract_info(self, url):
+        from pytube import YouTube
+
+        yt = YouTube(url, use_oauth=False, allow_oauth_cache=False)
+        return {
+            'id': yt.video_id,
+            'title': yt.title,
+            'description': yt.description or '',
+            'tags': yt.keywords or [],
+            'duration': yt.length,
+            'thumbnail': yt.thumbnail_url,
+            'uploader': yt.author,
+        }
+
+class YoutubeDlStrategy(DownloadStrategy):
+    """The original youtube-dl, in-process, when it's installed"""
+
+    name = 'youtube-dl'
+
+    OPTIONS = {
+        'quiet': True,
+        'no_warnings': True,
+        'noplaylist': True,
+        'nocheckcertificate': True,
+        'geo_bypass': True,
+    }
+
+    def available(self):
+        try:
+            import youtube_dl
+        except ImportError:
+            return False
+        return True
+
+    def download(self, url, output_path, format_selector, progress=None):
+        import youtube_dl
+
+        def on_progress(status):
+            if progress is not None and status.get('status') == 'downloading':
+                progress(
+                    downloaded_bytes=int(status.get('downloaded_bytes') or 0),
+                    total_bytes=int(status.get('total_bytes') or status.get('total_bytes_estimate') or 0) or None,
+                    speed=status.get('speed'),
+                    eta=status.get('eta')
+                )
+
+        options = dict(self.OPTIONS, format=format_selector, outtmpl=output_path,
+                       merge_output_format='mp4', progress_hooks=[on_progress])
+        with youtube_dl.YoutubeDL(options) as ydl:
+            ydl.download([url])
+        if not os.path.exists(output_path):
+            raise RuntimeError(f"youtube-dl reported success but {output_path} doesn't exist")
+        return {'filename': output_path}
+
+    def extract_info(self, url):
+        import youtube_dl
+
+        with youtube_dl.YoutubeDL(self.OPTIONS) as ydl:
+            return normalize_info(ydl.extract_info(url, download=False))
+
+class StrategyHealth:
+    """Recent outcomes, latency and circuit breaker state of one strategy"""
+
+    def __init__(self, window, threshold, cooldown):
+        self.window = window
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.outcomes = deque()
+        self.attempts = 0
+        self.successes = 0
+        self.latency = None
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.trial = False
+
+    @property
+    def score(self):
+        """Success rate of the last window seconds, 1.0 without recent calls"""
+        cutoff = time.monotonic() - self.window
+        while self.outcomes and self.outcomes[0][0] < cutoff:
+            self.outcomes.popleft()
+        return (sum(ok for _, ok in self.outcomes) + 1) / (len(self.outcomes) + 1)
+
+    @property
+    def state(self):
+        if self.open_until is None:
+            return 'closed'
+        if time.monotonic() < self.open_until:
+            return 'open'
+        return 'half-open'
+
+    def acquire(self):
+        """Claim an attempt: always when closed, once per cooldown when half-open"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def record_success(self, elapsed):
+        self.attempts += 1
+        self.successes += 1
+        self.outcomes.append((time.monotonic(), True))
+        # Exponentially weighted, recent calls count most
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.trial = False
+
+    def record_failure(self):
+        self.attempts += 1
+        self.outcomes.append((time.monotonic(), False))
+        self.consecutive_failures += 1
+        if self.trial or self.consecutive_failures >= self.threshold:
+            self.open_until = time.monotonic() + self.cooldown
+        self.trial = False
+
+    def release(self):
+        """Give back a half-open trial whose outcome says nothing about this strategy"""
+        self.attempts += 1
+        self.trial = False
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'recent_success_rate': round(self.score, 3),
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'retry_in': max(math.ceil(self.open_until - time.monotonic()), 0) if self.open_until else None
+        }
+
+class StrategyRegistry:
+    """
+    Runs one operation of the registered strategies, healthiest first
+
+    Strategies are ordered by their success rate over the last
+    STRATEGY_WINDOW seconds, then by DOWNLOAD_STRATEGIES order, which
+    decides as soon as old failures have aged out. A strategy that fails
+    STRATEGY_FAILURE_THRESHOLD times in a row is skipped for
+    STRATEGY_COOLDOWN seconds, then gets a single trial call. Only failures
+    of calls that another strategy completed count: when every strategy
+    fails, the input is to blame, e.g. a private video.
+    """
+
+    def __init__(self, operation, strategies=(), app=None):
+        self.operation = operation
+        self.window = 600
+        self.threshold = 3
+        self.cooldown = 300
+        self.strategies = []
+        self._health = {}
+        self._lock = threading.Lock()
+        self._candidates = list(strategies)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the installed strategies named by DOWNLOAD_STRATEGIES, in its order"""
+        self.window = app.config.get('STRATEGY_WINDOW', self.window)
+        self.threshold = app.config.get('STRATEGY_FAILURE_THRESHOLD', self.threshold)
+        self.cooldown = app.config.get('STRATEGY_COOLDOWN', self.cooldown)
+        by_name = {strategy.name: strategy for strategy in self._candidates}
+        names = app.config.get('DOWNLOAD_STRATEGIES') or list(by_name)
+        for name in names:
+            strategy = by_name.get(name)
+            if strategy is None:
+                logger.warning(f"Unknown download strategy {name}")
+            elif not strategy.available():
+                logger.info(f"Download strategy {name} is not installed, skipping it")
+            else:
+                self.register(strategy)
+
+    def register(self, strategy):
+        """Add a strategy after the existing ones"""
+        with self._lock:
+            self.strategies.append(strategy)
+            self._health[strategy.name] = StrategyHealth(self.window, self.threshold, self.cooldown)
+
+    def order(self):
+        """Strategies to try, healthiest first"""
+        with self._lock:
+            # Rounded, so an occasional failure doesn't reorder the strategies
+            ranked = sorted(
+                enumerate(self.strategies),
+                key=lambda item: (-round(self._health[item[1].name].score, 1), item[0])
+            )
+        return [strategy for _, strategy in ranked]
+
+    def run(self, *args, **kwargs):
+        """
+        Call the operation on each strategy until one succeeds
+
+        Returns:
+            tuple: (the strategy's result, the strategy's name)
+        """
+        failed = []
+        errors = []
+        for strategy in self.order():
+            health = self._health[strategy.name]
+            with self._lock:
+                allowed = health.acquire()
+            if not allowed:
+                errors.append(f'{strategy.name}: circuit open')
+                continue
+
+            started = time.monotonic()
+            try:
+                result = getattr(strategy, self.operation)(*args, **kwargs)
+            except Exception as e:
+                logger.warning(f"{self.operation} with {strategy.name} failed: {e}")
+                failed.append(health)
+                errors.append(f'{strategy.name}: {e}')
+                continue
+
+            with self._lock:
+                health.record_success(time.monotonic() - started)
+                # These failed where this strategy didn't, so they are unhealthy
+                for other in failed:
+                    other.record_failure()
+            return result, strategy.name
+
+        with self._lock:
+            for other in failed:
+                other.release()
+        raise StrategyError(f"All {self.operation} methods failed: {'; '.join(errors) or 'none available'}")
+
+    def stats(self):
+        """Return health statistics per strategy, in the order they would be tried"""
+        order = self.order()
+        with self._lock:
+            return [dict(self._health[strategy.name].to_dict(), name=strategy.name) for strategy in order]
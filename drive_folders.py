@@ -0,0 +1,222 @@
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from googleapiclient.errors import HttpError
+from sqlalchemy.exc import IntegrityError
+
+from models import db, DriveFolder, DriveSyncState
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+class DriveFolderIndex:
+    """
+    Per-user local index of Google Drive folders
+
+    The first request walks every page of the user's folders. After that
+    the index follows the Drive changes API from a saved page token, at most
+    once per DRIVE_SYNC_INTERVAL, so listing, tree and prefix search are
+    served from the database.
+    """
+
+    def __init__(self, app=None):
+        self.sync_interval = 60
+        self.page_size = 1000
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the sync interval from the application config"""
+        self.sync_interval = app.config.get('DRIVE_SYNC_INTERVAL', self.sync_interval)
+
+    def sync(self, user_id, drive_service, force=False):
+        """
+        Bring a user's index up to date if it is older than the sync interval
+
+        Args:
+            user_id (int): Owner of the index
+            drive_service: Drive v3 service of the user
+            force (bool): Sync even if the index is fresh
+        """
+        with self._lock_for(user_id):
+            state = DriveSyncState.query.filter_by(user_id=user_id).first()
+            if state is None or not state.page_token:
+                self._full_sync(user_id, drive_service, state)
+                return
+
+            fresh_until = state.synced_at + timedelta(seconds=self.sync_interval) if state.synced_at else None
+            if not force and fresh_until and datetime.utcnow() < fresh_until:
+                return
+
+            try:
+                self._apply_changes(user_id, drive_service, state)
+            except HttpError as e:
+                # An expired or invalid page token means walking everything again
+                if e.resp.status not in (400, 403, 404, 410):
+                    raise
+                logger.warning(f"Drive changes for user {user_id} unavailable ({e.resp.status}), resyncing")
+                db.session.rollback()
+                self._full_sync(user_id, drive_service, state)
+
+    def is_indexed(self, user_id):
+        """Check whether a user's folders have been indexed at least once"""
+        state = DriveSyncState.query.filter_by(user_id=user_id).first()
+        return state is not None and state.full_sync_at is not None
+
+    def folders(self, user_id, prefix=None):
+        """
+        List indexed folders sorted by name
+
+        Args:
+            user_id (int): Owner of the index
+            prefix (str): Only return folders whose name starts with this
+
+        Returns:
+            list: Folder dicts with id, name and parents
+        """
+        query = DriveFolder.query.filter_by(user_id=user_id)
+        if prefix:
+            escaped = prefix.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(DriveFolder.name_key.like(f'{escaped}%', escape='\\'))
+        return [folder.to_dict() for folder in query.order_by(DriveFolder.name_key).all()]
+
+    def tree(self, user_id):
+        """
+        Arrange indexed folders as a tree
+
+        Returns:
+            list: Root folder dicts, each with a sorted 'children' list
+        """
+        nodes = {folder['id']: dict(folder, children=[]) for folder in self.folders(user_id)}
+        roots = []
+        for node in nodes.values():
+            parent_ids = [parent for parent in node['parents'] if parent in nodes]
+            if parent_ids:
+                nodes[parent_ids[0]]['children'].append(node)
+            else:
+                # Parents outside the index are My Drive, shared drives or unshared folders
+                roots.append(node)
+        return roots
+
+    def _full_sync(self, user_id, drive_service, state):
+        """Replace the index with a full walk over every page of folders"""
+        # Taken first, so changes made during the walk are replayed afterwards
+        start_token = drive_service.changes().getStartPageToken(supportsAllDrives=True).execute()['startPageToken']
+
+        found = {}
+        page_token = None
+        while True:
+            response = drive_service.files().list(
+                q=f"mimeType='{FOLDER_MIME_TYPE}' and trashed=false",
+                spaces='drive',
+                fields='nextPageToken, files(id, name, parents)',
+                pageSize=self.page_size,
+                pageToken=page_token,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True
+            ).execute()
+            for item in response.get('files', []):
+                found[item['id']] = item
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        # Reconcile with the stored rows instead of replacing them all
+        for folder in DriveFolder.query.filter_by(user_id=user_id):
+            item = found.pop(folder.folder_id, None)
+            if item is None:
+                db.session.delete(folder)
+            else:
+                self._update_folder(folder, item)
+        for item in found.values():
+            db.session.add(self._new_folder(user_id, item))
+
+        if state is None:
+            state = DriveSyncState(user_id=user_id)
+            db.session.add(state)
+        now = datetime.utcnow()
+        state.page_token = start_token
+        state.full_sync_at = now
+        state.synced_at = now
+        self._commit()
+        logger.info(f"Indexed Drive folders for user {user_id}")
+
+    def _apply_changes(self, user_id, drive_service, state):
+        """Apply every change since the saved page token to the index"""
+        existing = {folder.folder_id: folder for folder in DriveFolder.query.filter_by(user_id=user_id)}
+        page_token = state.page_token
+        applied = 0
+        while True:
+            response = drive_service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                fields='nextPageToken, newStartPageToken, '
+                       'changes(removed, fileId, file(id, name, mimeType, parents, trashed))',
+                pageSize=self.page_size,
+                includeRemoved=True,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True
+            ).execute()
+
+            for change in response.get('changes', []):
+                item = change.get('file') or {}
+                file_id = change.get('fileId') or item.get('id')
+                is_folder = item.get('mimeType') == FOLDER_MIME_TYPE
+                if change.get('removed') or item.get('trashed') or not is_folder:
+                    folder = existing.pop(file_id, None)
+                    if folder is not None:
+                        db.session.delete(folder)
+                        applied += 1
+                    continue
+
+                folder = existing.get(file_id)
+                if folder is None:
+                    folder = existing[file_id] = self._new_folder(user_id, item)
+                    db.session.add(folder)
+                else:
+                    self._update_folder(folder, item)
+                applied += 1
+
+            if response.get('newStartPageToken'):
+                page_token = response['newStartPageToken']
+                break
+            page_token = response['nextPageToken']
+
+        state.page_token = page_token
+        state.synced_at = datetime.utcnow()
+        self._commit()
+        if applied:
+            logger.info(f"Applied {applied} Drive folder changes for user {user_id}")
+
+    def _new_folder(self, user_id, item):
+        name = item.get('name', '')
+        return DriveFolder(
+            user_id=user_id,
+            folder_id=item['id'],
+            name=name,
+            name_key=name.lower(),
+            parents=json.dumps(item.get('parents', []))
+        )
+
+    def _update_folder(self, folder, item):
+        folder.name = item.get('name', folder.name)
+        folder.name_key = folder.name.lower()
+        folder.parents = json.dumps(item.get('parents', []))
+
+    def _commit(self):
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker process synced the same user at the same time
+            db.session.rollback()
+
+    def _lock_for(self, user_id):
+        with self._locks_lock:
+            if user_id not in self._locks:
+                self._locks[user_id] = threading.Lock()
+            return self._locks[user_id]
@@ -0,0 +1,236 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Requested codec names and the yt-dlp vcodec prefixes they match
+VIDEO_CODECS = {
+    'h264': ('avc1', 'h264'),
+    'vp9': ('vp9', 'vp09'),
+    'av1': ('av01',),
+}
+
+# Containers that merge into an .mp4 output without remuxing problems
+MP4_VIDEO_EXTS = ('mp4',)
+MP4_AUDIO_EXTS = ('m4a', 'mp4')
+
+class FormatPlan:
+    """A chosen download format with its estimated output size"""
+
+    def __init__(self, format_id, fallback, height=None, vcodec=None, acodec=None,
+                 ext=None, estimated_size=None):
+        self.format_id = format_id
+        self.fallback = fallback
+        self.height = height
+        self.vcodec = vcodec
+        self.acodec = acodec
+        self.ext = ext
+        self.estimated_size = estimated_size
+
+    @property
+    def selector(self):
+        """yt-dlp -f argument: the planned format ids, then the generic selector"""
+        if self.format_id is None:
+            return self.fallback
+        return f'{self.format_id}/{self.fallback}'
+
+    @property
+    def key(self):
+        """Media store key, files of the same formats are shared between requests"""
+        return self.format_id or self.fallback
+
+    def to_dict(self):
+        """Convert the plan to a dictionary"""
+        return {
+            'format_id': self.format_id,
+            'height': self.height,
+            'vcodec': self.vcodec,
+            'acodec': self.acodec,
+            'ext': self.ext,
+            'estimated_size': self.estimated_size
+        }
+
+    def __repr__(self):
+        return f'<FormatPlan {self.key}>'
+
+class FormatPlanner:
+    """
+    Chooses download formats from the format list of a cached extraction
+
+    Candidates are single files with audio and video, and video-only formats
+    paired with the best matching audio-only format. They are ranked by the
+    requested maximum height, then the requested codec, then how well they
+    merge into mp4, then bitrate. Formats whose estimated size is over the
+    budget are skipped. The plan's format ids go straight to yt-dlp, so the
+    download doesn't resolve a selector again.
+    """
+
+    def __init__(self, app=None):
+        self.default_height = 360
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the default resolution from the application config"""
+        self.default_height = app.config.get('DEFAULT_MAX_HEIGHT', self.default_height)
+
+    def parse_request(self, data):
+        """
+        Read format preferences from a request body
+
+        Args:
+            data (dict): Request JSON with optional max_height, codec and max_bytes
+
+        Returns:
+            dict: Keyword arguments for plan()
+        """
+        data = data or {}
+        if not isinstance(data, dict):
+            raise ValueError('Format preferences must be an object')
+        try:
+            max_height = int(data.get('max_height') or self.default_height)
+            max_bytes = int(data['max_bytes']) if data.get('max_bytes') else None
+        except (TypeError, ValueError):
+            raise ValueError('max_height and max_bytes must be integers')
+        if max_height <= 0:
+            raise ValueError('max_height must be positive')
+        codec = data.get('codec') or None
+        if codec is not None and (not isinstance(codec, str) or codec not in VIDEO_CODECS):
+            raise ValueError(f"codec must be one of {', '.join(VIDEO_CODECS)}")
+        return {'max_height': max_height, 'codec': codec, 'max_bytes': max_bytes}
+
+    def plan(self, info, max_height=None, codec=None, max_bytes=None, single_file=False):
+        """
+        Choose the best format of a video for the request
+
+        Args:
+            info (dict): Normalized metadata with a 'formats' list, or None
+            max_height (int): Highest acceptable video height
+            codec (str): Preferred video codec, a key of VIDEO_CODECS
+            max_bytes (int): Size budget of the downloaded file
+            single_file (bool): Only formats with audio and video in one file,
+                for downloads streamed to a pipe that can't be merged
+
+        Returns:
+            FormatPlan: The plan; without usable formats it only has the
+            generic selector that yt-dlp resolves itself
+        """
+        max_height = max_height or self.default_height
+        fallback = fallback_selector(max_height, single_file)
+        candidates = self._candidates(info, single_file)
+        if not candidates:
+            return FormatPlan(None, fallback)
+
+        fitting = [c for c in candidates if c['height'] <= max_height]
+        if not fitting:
+            # Nothing is small enough, take the lowest resolution there is
+            lowest = min(c['height'] for c in candidates)
+            fitting = [c for c in candidates if c['height'] == lowest]
+
+        if max_bytes:
+            within = [c for c in fitting if c['size'] is not None and c['size'] <= max_bytes]
+            if within:
+                fitting = within
+            else:
+                logger.info(f"No format fits {max_bytes} bytes, using the smallest")
+                known = [c for c in fitting if c['size'] is not None] or fitting
+                fitting = [min(known, key=lambda c: c['size'] or 0)]
+
+        prefixes = VIDEO_CODECS.get(codec, ())
+        best = max(fitting, key=lambda c: (
+            c['height'],
+            c['vcodec'].startswith(prefixes) if prefixes else False,
+            c['mp4'],
+            c['tbr'],
+        ))
+        return FormatPlan(
+            best['format_id'], fallback,
+            height=best['height'],
+            vcodec=best['vcodec'],
+            acodec=best['acodec'],
+            ext=best['ext'],
+            estimated_size=best['size']
+        )
+
+    def options(self, info, single_file=False):
+        """
+        List the best plan for every available height, highest first
+
+        Returns:
+            list: Plan dicts for choosing a quality
+        """
+        heights = sorted({c['height'] for c in self._candidates(info, single_file)}, reverse=True)
+        return [self.plan(info, max_height=height, single_file=single_file).to_dict() for height in heights]
+
+    def _candidates(self, info, single_file):
+        """Single-file formats and video+audio pairs with their estimated sizes"""
+        formats = [f for f in (info or {}).get('formats') or [] if is_media_format(f)]
+        duration = (info or {}).get('duration')
+
+        candidates = []
+        for fmt in formats:
+            if has_video(fmt) and has_audio(fmt):
+                candidates.append(candidate(fmt['format_id'], fmt, None, duration))
+
+        if not single_file:
+            audio = [f for f in formats if has_audio(f) and not has_video(f)]
+            best_audio = max(audio, key=audio_rank) if audio else None
+            for fmt in formats:
+                if has_video(fmt) and not has_audio(fmt) and best_audio is not None:
+                    # mp4 video merges with m4a audio, anything else with the best audio
+                    paired = best_audio
+                    if fmt.get('ext') in MP4_VIDEO_EXTS:
+                        m4a = [f for f in audio if f.get('ext') in MP4_AUDIO_EXTS]
+                        paired = max(m4a, key=audio_rank) if m4a else best_audio
+                    candidates.append(candidate(f"{fmt['format_id']}+{paired['format_id']}", fmt, paired, duration))
+        return candidates
+
+def fallback_selector(max_height, single_file=False):
+    """Generic yt-dlp selector for a height limit, used when no formats are known"""
+    if single_file:
+        return f'best[height<={max_height}][ext=mp4]/best[height<={max_height}]'
+    return f'bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]'
+
+def candidate(format_id, video, audio, duration):
+    """Describe a format, or a video+audio pair, for ranking"""
+    size = estimate_size(video, duration)
+    if audio is not None:
+        audio_size = estimate_size(audio, duration)
+        size = size + audio_size if size is not None and audio_size is not None else None
+    if audio is None:
+        mp4 = video.get('ext') in MP4_VIDEO_EXTS
+    else:
+        mp4 = video.get('ext') in MP4_VIDEO_EXTS and audio.get('ext') in MP4_AUDIO_EXTS
+    return {
+        'format_id': format_id,
+        'height': video.get('height') or 0,
+        'vcodec': video.get('vcodec') or '',
+        'acodec': (audio or video).get('acodec') or '',
+        # Pairs are merged with --merge-output-format mp4
+        'ext': 'mp4' if audio is not None else video.get('ext'),
+        'mp4': mp4,
+        'tbr': (video.get('tbr') or 0) + ((audio or {}).get('tbr') or 0),
+        'size': size,
+    }
+
+def estimate_size(fmt, duration):
+    """Bytes of a format from its reported size, or its bitrate and the duration"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    if fmt.get('tbr') and duration:
+        # tbr is in kbit/s
+        return int(fmt['tbr'] * 125 * duration)
+    return None
+
+def audio_rank(fmt):
+    return fmt.get('abr') or fmt.get('tbr') or 0
+
+def has_video(fmt):
+    return fmt.get('vcodec', 'none') != 'none' and bool(fmt.get('height'))
+
+def has_audio(fmt):
+    return fmt.get('acodec', 'none') != 'none'
+
+def is_media_format(fmt):
+    """Skip storyboards and formats yt-dlp can't name"""
+    return bool(fmt.get('format_id')) and fmt.get('ext') != 'mhtml' and 'mhtml' not in (fmt.get('protocol') or '')
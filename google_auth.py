@@ -3,12 +3,18 @@
 import json
 import os
 import logging
+import threading
+import time
+from datetime import datetime, timedelta
 
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Blueprint, redirect, request, url_for, session, jsonify
-from flask_login import login_user, logout_user, login_required
+from flask_login import current_user, login_user, logout_user, login_required
+from google.oauth2.credentials import Credentials
 from oauthlib.oauth2 import WebApplicationClient
 from models import db, User
+from tokens import token_store
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +62,87 @@ else:
 
 google_auth = Blueprint("google_auth", __name__)
 
+# Shared keep-alive connections for discovery, token and userinfo calls
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Seconds to wait on Google's endpoints before giving up
+HTTP_TIMEOUT = 10
+
+def cache_max_age(headers, default):
+    """Return how many seconds a response may be cached according to its headers"""
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        name = name.lower()
+        if name in ("no-store", "no-cache"):
+            return 0
+        if name == "max-age":
+            try:
+                age = int(headers.get("Age", 0))
+                return max(0, int(value) - age)
+            except ValueError:
+                pass
+    return default
+
+class ProviderConfig:
+    """
+    Google's OpenID provider configuration, cached per Cache-Control
+
+    The first call fetches the document; after that it is served from memory.
+    Once it has expired the cached copy is still returned while a background
+    thread revalidates it, so logins never wait on the discovery round trip.
+    """
+
+    def __init__(self, url, default_max_age=3600, retry_after=60):
+        self.url = url
+        self.default_max_age = default_max_age
+        self.retry_after = retry_after
+        self._config = None
+        self._etag = None
+        self._expires_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return the provider configuration
+
+        Returns:
+            dict: The discovery document
+        """
+        with self._lock:
+            if self._config is None:
+                # Nothing to serve yet, concurrent first callers share this fetch
+                self._fetch()
+                return self._config
+            if time.monotonic() >= self._expires_at and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, name="openid-config-refresh", daemon=True).start()
+            return self._config
+
+    def _refresh(self):
+        try:
+            self._fetch()
+        except Exception as e:
+            logger.warning(f"Refreshing the OpenID configuration failed: {e}")
+            self._expires_at = time.monotonic() + self.retry_after
+        finally:
+            self._refreshing = False
+
+    def _fetch(self):
+        """Fetch or revalidate the document and work out how long it is fresh"""
+        headers = {"If-None-Match": self._etag} if self._etag and self._config else {}
+        response = http_session.get(self.url, headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code != 304:
+            response.raise_for_status()
+            self._config = response.json()
+            self._etag = response.headers.get("ETag")
+        max_age = cache_max_age(response.headers, self.default_max_age)
+        self._expires_at = time.monotonic() + max_age
+        logger.debug(f"OpenID configuration cached for {max_age}s")
+
+provider_config = ProviderConfig(GOOGLE_DISCOVERY_URL)
+
 # Define the OAuth scopes needed
 SCOPES = [
     'https://www.googleapis.com/auth/drive',  # Full Drive access to see all folders
@@ -75,7 +162,7 @@ def login():
         
     # Get Google's OAuth 2.0 endpoints from discovery document
     try:
-        google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+        google_provider_cfg = provider_config.get()
         authorization_endpoint = google_provider_cfg["authorization_endpoint"]
 
         # Always use the hardcoded redirect URI to match Google Cloud Console settings
@@ -103,7 +190,7 @@ def callback():
     try:
         # Get authorization code sent by Google
         code = request.args.get("code")
-        google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+        google_provider_cfg = provider_config.get()
         token_endpoint = google_provider_cfg["token_endpoint"]
 
         # Always use the hardcoded redirect URI to match Google Cloud Console settings
@@ -111,8 +198,11 @@ def callback():
         
         logger.info(f"Using redirect URI for token: {redirect_uri}")
 
+        # A client of our own, the shared one would mix up tokens of concurrent logins
+        oauth_client = WebApplicationClient(GOOGLE_CLIENT_ID)
+
         # Prepare token request
-        token_url, headers, body = client.prepare_token_request(
+        token_url, headers, body = oauth_client.prepare_token_request(
             token_endpoint,
             authorization_response=request.url.replace("http://", "https://"),
             redirect_url=redirect_uri,
@@ -120,20 +210,21 @@ def callback():
         )
         
         # Exchange code for tokens
-        token_response = requests.post(
+        token_response = http_session.post(
             token_url,
             headers=headers,
             data=body,
             auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET) if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET else None,
+            timeout=HTTP_TIMEOUT,
         )
 
         # Parse the tokens
-        client.parse_request_body_response(json.dumps(token_response.json()))
+        oauth_client.parse_request_body_response(json.dumps(token_response.json()))
         
         # Now get user information from Google
         userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
-        uri, headers, body = client.add_token(userinfo_endpoint)
-        userinfo_response = requests.get(uri, headers=headers, data=body)
+        uri, headers, body = oauth_client.add_token(userinfo_endpoint)
+        userinfo_response = http_session.get(uri, headers=headers, data=body, timeout=HTTP_TIMEOUT)
         
         # Get user info
         userinfo = userinfo_response.json()
@@ -159,17 +250,19 @@ def callback():
         tokens = token_response.json()
         
         # Add missing fields required by google.oauth2.credentials.Credentials
-        creds_data = {
-            'token': tokens.get('access_token'),
-            'refresh_token': tokens.get('refresh_token'),
-            'token_uri': 'https://oauth2.googleapis.com/token',
-            'client_id': GOOGLE_CLIENT_ID,
-            'client_secret': GOOGLE_CLIENT_SECRET,
-            'scopes': SCOPES
-        }
+        credentials = Credentials(
+            token=tokens.get('access_token'),
+            refresh_token=tokens.get('refresh_token'),
+            token_uri='https://oauth2.googleapis.com/token',
+            client_id=GOOGLE_CLIENT_ID,
+            client_secret=GOOGLE_CLIENT_SECRET,
+            scopes=SCOPES,
+            expiry=datetime.utcnow() + timedelta(seconds=int(tokens.get('expires_in', 3600)))
+        )
         
-        # Store credentials in session
-        session['credentials'] = json.dumps(creds_data)
+        # Store credentials on the server, the cookie only carries the login
+        token_store.save(user.id, credentials)
+        session.pop('credentials', None)
         
         return redirect(url_for('index', auth_success=True))
     except Exception as e:
@@ -179,7 +272,8 @@ def callback():
 @google_auth.route("/logout")
 @login_required
 def logout():
-    """Log out the user by clearing session data"""
+    """Log out the user by clearing session data and stored tokens"""
     session.pop('credentials', None)
+    token_store.delete(current_user.id)
     logout_user()
     return redirect(url_for('index'))
\ No newline at end of file
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import threading
+import time
+
+import google_auth_httplib2
+from flask import g
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+logger = logging.getLogger(__name__)
+
+class ServicePool:
+    """
+    Pool of Google API service objects keyed by (api, version, credential)
+
+    Building a service parses its discovery document and creates a new HTTP
+    transport, so pooled services are reused instead. Their httplib2
+    connections stay open between requests, which skips the TLS handshake.
+    A service isn't thread-safe, so each one is checked out by a single
+    caller at a time. Services idle for longer than CLIENT_POOL_IDLE_TIMEOUT
+    are closed.
+    """
+
+    def __init__(self, app=None):
+        self.idle_timeout = 300
+        self.max_idle_per_key = 4
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {'builds': 0, 'reuses': 0, 'evictions': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read pool limits from the config and return services after each app context"""
+        self.idle_timeout = app.config.get('CLIENT_POOL_IDLE_TIMEOUT', self.idle_timeout)
+        self.max_idle_per_key = app.config.get('CLIENT_POOL_MAX_IDLE', self.max_idle_per_key)
+        app.teardown_appcontext(self._release_context)
+
+    def get(self, api, version, credentials):
+        """
+        Check out a service that is returned when the app context ends
+
+        Args:
+            api (str): API name, e.g. 'drive'
+            version (str): API version, e.g. 'v3'
+            credentials: google.oauth2 Credentials of the user
+
+        Returns:
+            Resource: A service object for this caller's exclusive use
+        """
+        service = self.checkout(api, version, credentials)
+        if 'google_services' not in g:
+            g.google_services = []
+        g.google_services.append(service)
+        return service
+
+    def checkout(self, api, version, credentials):
+        """Take an idle service for the key, or build a new one; pair with checkin()"""
+        key = (api, version, credential_key(credentials))
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            idle = self._idle.get(key)
+            entry = idle.pop() if idle else None
+            if entry is not None:
+                self._stats['reuses'] += 1
+
+        if entry is None:
+            # The bundled discovery document avoids a network fetch per build
+            http = google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+            service = build(api, version, http=http, static_discovery=True, cache_discovery=False)
+            service._pool_key = key
+            with self._lock:
+                self._stats['builds'] += 1
+            logger.debug(f"Built {api} {version} service")
+            return service
+
+        service = entry[1]
+        # Tokens are refreshed outside the pool, always send the current one
+        service._http.credentials = credentials
+        return service
+
+    def checkin(self, service):
+        """Return a checked out service to the pool"""
+        key = getattr(service, '_pool_key', None)
+        if key is None:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_key:
+                idle.append((time.monotonic(), service))
+                return
+        close_service(service)
+
+    def stats(self):
+        """Return build and reuse counters"""
+        with self._lock:
+            return dict(self._stats, idle=sum(len(idle) for idle in self._idle.values()))
+
+    def _release_context(self, exception=None):
+        for service in g.pop('google_services', []):
+            self.checkin(service)
+
+    def _evict_idle(self, now):
+        """Close services that have been idle too long; the caller holds the lock"""
+        for key in list(self._idle):
+            fresh = []
+            for last_used, service in self._idle[key]:
+                if now - last_used > self.idle_timeout:
+                    close_service(service)
+                    self._stats['evictions'] += 1
+                else:
+                    fresh.append((last_used, service))
+            if fresh:
+                self._idle[key] = fresh
+            else:
+                del self._idle[key]
+
+def credential_key(credentials):
+    """Identify the user behind credentials, stable across token refreshes"""
+    identity = credentials.refresh_token or credentials.token or ''
+    raw = f"{credentials.client_id}:{identity}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+def close_service(service):
+    """Close the open connections of a service's HTTP transport"""
+    try:
+        service.close()
+    except Exception as e:
+        logger.debug(f"Error closing service: {e}")
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import Response, g, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response bodies worth compressing
+COMPRESSIBLE_TYPES = {'application/json', 'text/html'}
+
+class HttpCache:
+    """
+    Validators, compression and long-lived caching for responses
+
+    GET responses with JSON get an ETag and are answered with 304 when the
+    client already has them. Views that can tell cheaply whether their data
+    changed call precondition() to skip building the response at all. JSON
+    and HTML bodies above COMPRESS_MIN_SIZE are sent with brotli, if it's
+    installed, or gzip. Static URLs carry a content fingerprint, so static
+    files can be cached for STATIC_MAX_AGE.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.min_size = 1024
+        self.level = 6
+        self.static_max_age = 365 * 24 * 3600
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read limits from the config and hook into URL building and responses"""
+        self.app = app
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        self.static_max_age = app.config.get('STATIC_MAX_AGE', self.static_max_age)
+        app.url_defaults(self._fingerprint_static_url)
+        app.after_request(self._after_request)
+
+    def precondition(self, *state):
+        """
+        Derive this response's ETag from cheap state instead of its body
+
+        Args:
+            *state: Values that change whenever the response would change
+
+        Returns:
+            Response: 304 response if the client's copy is current, else None
+        """
+        raw = repr((request.full_path,) + state).encode('utf-8')
+        g.etag = hashlib.sha1(raw).hexdigest()
+        if request.if_none_match.contains_weak(g.etag):
+            response = Response(status=304)
+            response.set_etag(g.etag)
+            return response
+        return None
+
+    def fingerprint(self, filename):
+        """Return a short content hash of a static file, or None if it doesn't exist"""
+        path = os.path.join(self.app.static_folder, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            cached = self._fingerprints.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, 'rb') as f:
+            digest = hashlib.md5(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._fingerprints[filename] = (mtime, digest)
+        return digest
+
+    def _fingerprint_static_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            digest = self.fingerprint(values['filename'])
+            if digest:
+                values['v'] = digest
+
+    def _after_request(self, response):
+        if request.endpoint == 'static':
+            self._cache_static(response)
+            return response
+
+        if response.direct_passthrough:
+            # Files from send_file() have their own validators and Range handling
+            return response
+
+        if response.is_streamed or response.mimetype == 'text/event-stream':
+            # Hashing or measuring the body would hold it back until the generator ends
+            return response
+
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            if 'etag' in g:
+                response.set_etag(g.etag)
+            elif response.mimetype == 'application/json':
+                response.add_etag()
+            if response.get_etag()[0] and not response.headers.get('Cache-Control'):
+                # Browsers keep the copy but ask with If-None-Match before using it
+                response.cache_control.no_cache = True
+            response.make_conditional(request)
+
+        return self._compress(response)
+
+    def _cache_static(self, response):
+        """Cache a static file for long if its URL names the current content"""
+        version = request.args.get('v')
+        filename = request.view_args.get('filename') if request.view_args else None
+        if version and filename and version == self.fingerprint(filename):
+            response.cache_control.no_cache = False
+            response.cache_control.public = True
+            response.cache_control.max_age = self.static_max_age
+            response.cache_control.immutable = True
+
+    def _compress(self, response):
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            body = brotli.compress(body, quality=min(self.level, 11))
+            encoding = 'br'
+        elif accepted['gzip']:
+            body = gzip.compress(body, compresslevel=self.level)
+            encoding = 'gzip'
+        else:
+            return response
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ from what a strong ETag promised
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
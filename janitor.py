@@ -0,0 +1,150 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, MediaFile
+
+logger = logging.getLogger(__name__)
+
+class MediaJanitor:
+    """
+    Background thread that keeps downloaded media within a disk budget
+
+    Finished files are evicted least recently used first once the media
+    directory exceeds MEDIA_MAX_BYTES, or once they haven't been used for
+    MEDIA_MAX_AGE seconds. Files leased by an upload or stream are skipped,
+    and so are files handed to the front proxy in the last
+    DOWNLOAD_OFFLOAD_LEASE seconds, since the proxy can't hold a lease.
+    Scratch directories abandoned by crashed jobs are removed as well.
+    """
+
+    def __init__(self, app=None, media_store=None, workdir=None):
+        self.app = None
+        self.media_store = media_store
+        self.workdir = workdir
+        self.max_bytes = 10 * 1024 ** 3
+        self.max_age = 24 * 3600
+        self.scratch_max_age = 6 * 3600
+        self.offload_lease = 0
+        self.interval = 300
+        self.last_run = None
+        self._thread = None
+        if app is not None:
+            self.init_app(app, media_store, workdir)
+
+    def init_app(self, app, media_store, workdir):
+        """Configure the janitor and start its thread"""
+        self.app = app
+        self.media_store = media_store
+        self.workdir = workdir
+        self.max_bytes = app.config.get('MEDIA_MAX_BYTES', self.max_bytes)
+        self.max_age = app.config.get('MEDIA_MAX_AGE', self.max_age)
+        self.scratch_max_age = app.config.get('SCRATCH_MAX_AGE', self.scratch_max_age)
+        if app.config.get('DOWNLOAD_OFFLOAD'):
+            self.offload_lease = app.config.get('DOWNLOAD_OFFLOAD_LEASE', self.offload_lease)
+        self.interval = app.config.get('JANITOR_INTERVAL', self.interval)
+        if self.interval > 0:
+            self.start()
+
+    def start(self):
+        """Start the background cleanup loop once per process"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='media-janitor', daemon=True)
+        self._thread.start()
+        logger.info(f"Media janitor started: budget {self.max_bytes} bytes, max age {self.max_age}s")
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"Media janitor run failed: {e}")
+
+    def run_once(self):
+        """
+        Run one cleanup pass
+
+        Returns:
+            dict: Summary of what was evicted
+        """
+        now = datetime.utcnow()
+        evicted_files = 0
+        evicted_bytes = 0
+        skipped_in_use = 0
+
+        candidates = self._media_candidates()
+        total_bytes = sum(size for _, _, size, _ in candidates)
+
+        # Oldest access first, so the least recently used files go first
+        for last_used, path, size, entry in candidates:
+            expired = now - last_used > timedelta(seconds=self.max_age)
+            if not expired and total_bytes <= self.max_bytes:
+                break
+
+            # The proxy may still be sending a file it was handed recently
+            if now - last_used < timedelta(seconds=self.offload_lease):
+                skipped_in_use += 1
+                continue
+
+            if not self.media_store.remove_if_unused(path):
+                skipped_in_use += 1
+                continue
+
+            total_bytes -= size
+            evicted_files += 1
+            evicted_bytes += size
+            if entry is not None:
+                # The video is no longer available locally
+                db.session.delete(entry)
+            logger.info(f"Evicted {path} ({size} bytes, last used {last_used})")
+
+        db.session.commit()
+        removed_scratch = self._remove_stale_scratch()
+
+        self.last_run = {
+            'finished_at': datetime.utcnow().isoformat(),
+            'evicted_files': evicted_files,
+            'evicted_bytes': evicted_bytes,
+            'skipped_in_use': skipped_in_use,
+            'removed_scratch_dirs': removed_scratch,
+            'media_bytes': total_bytes
+        }
+        return self.last_run
+
+    def _media_candidates(self):
+        """List finished media files as (last used, path, size, MediaFile) sorted by use"""
+        entries = {entry.path: entry for entry in MediaFile.query.all()}
+        candidates = []
+        for dirent in os.scandir(self.workdir.media_dir):
+            if not dirent.is_file():
+                continue
+            stat = dirent.stat()
+            entry = entries.pop(dirent.path, None)
+            if entry is not None and entry.last_accessed_at:
+                last_used = entry.last_accessed_at
+            else:
+                last_used = datetime.utcfromtimestamp(max(stat.st_mtime, stat.st_atime))
+            candidates.append((last_used, dirent.path, stat.st_size, entry))
+
+        # Entries whose file is already gone are dropped straight away
+        for entry in entries.values():
+            db.session.delete(entry)
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        return candidates
+
+    def _remove_stale_scratch(self):
+        """Remove job scratch directories older than SCRATCH_MAX_AGE"""
+        removed = 0
+        cutoff = time.time() - self.scratch_max_age
+        for dirent in os.scandir(self.workdir.jobs_dir):
+            if dirent.is_dir() and dirent.stat().st_mtime < cutoff:
+                shutil.rmtree(dirent.path, ignore_errors=True)
+                removed += 1
+        return removed
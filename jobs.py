@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import db, DownloadJob
+
+logger = logging.getLogger(__name__)
+
+INTERRUPTED_ERROR = 'Interrupted by a server restart, please try again'
+
+def process_owner():
+    """Name of the current process for job ownership, host:pid"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def owner_is_gone(owner):
+    """
+    Check whether the process that owns a job or batch has exited
+
+    Owners on other hosts can't be checked and count as alive. Rows without
+    an owner predate ownership and count as gone.
+    """
+    if not owner:
+        return True
+    if owner == process_owner():
+        # Nothing is running in this process yet, so the pid was reused
+        return True
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+class JobQueueFull(Exception):
+    """Raised when no more jobs can be accepted"""
+    pass
+
+class JobQueue:
+    """Bounded worker pool that runs download jobs outside the request cycle"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Create the worker pool using the application config"""
+        self.app = app
+        workers = app.config.get('DOWNLOAD_WORKERS', 3)
+        queue_size = app.config.get('DOWNLOAD_QUEUE_SIZE', 50)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='download-job'
+        )
+        # Running plus waiting jobs may never exceed this many
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        logger.info(f"Job queue started with {workers} workers, {queue_size} queue slots")
+        with app.app_context():
+            self.recover()
+
+    def submit(self, url, handler):
+        """
+        Create a job record and schedule it on the worker pool
+
+        Args:
+            url (str): URL the job works on
+            handler (callable): Called with the job inside an app context,
+                must return a JSON-serializable result dict
+
+        Returns:
+            DownloadJob: The newly queued job
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull('Too many downloads in progress, try again later')
+
+        try:
+            job = self.create(url)
+            self._executor.submit(self._run, job.id, handler, None)
+        except Exception:
+            self._slots.release()
+            raise
+
+        logger.info(f"Queued job {job.id} for {url}")
+        return job
+
+    def create(self, url, status='queued', **fields):
+        """Create a job record without scheduling it"""
+        fields.setdefault('owner', process_owner())
+        job = DownloadJob(id=uuid.uuid4().hex, url=url, status=status, **fields)
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def enqueue(self, job_id, handler, on_done=None):
+        """
+        Schedule an existing job, waiting for a free queue slot
+
+        Args:
+            job_id (str): Job created with create()
+            handler (callable): See submit()
+            on_done (callable): Called with the job id once the job has finished
+        """
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._run, job_id, handler, on_done)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def record_completed(self, url, result):
+        """Create a job record for work that was already done, e.g. a cache hit"""
+        now = datetime.utcnow()
+        job = DownloadJob(
+            id=uuid.uuid4().hex,
+            url=url,
+            status='completed',
+            video_id=result.get('video_id'),
+            result=json.dumps(result),
+            started_at=now,
+            finished_at=now
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def recover(self):
+        """
+        Fail the jobs that an exited process left queued or running
+
+        Runs at startup, before this process has queued anything. Handlers
+        only live in the memory of the process that queued the job, so its
+        work can't be picked up again here. Uploads keep their checkpoints
+        and resume when the upload is requested again.
+
+        Returns:
+            int: Number of jobs marked failed
+        """
+        jobs = DownloadJob.query.filter(DownloadJob.status.in_(('queued', 'running'))).all()
+        interrupted = [job for job in jobs if owner_is_gone(job.owner)]
+        now = datetime.utcnow()
+        for job in interrupted:
+            job.status = 'failed'
+            job.error = INTERRUPTED_ERROR
+            job.finished_at = now
+        db.session.commit()
+        if interrupted:
+            logger.warning(f"Marked {len(interrupted)} interrupted jobs failed")
+        return len(interrupted)
+
+    def _run(self, job_id, handler, on_done):
+        """Execute a job and persist its final state"""
+        try:
+            with self.app.app_context():
+                job = db.session.get(DownloadJob, job_id)
+                job.status = 'running'
+                job.started_at = datetime.utcnow()
+                db.session.commit()
+
+                try:
+                    result = handler(job)
+                except Exception as e:
+                    logger.error(f"Job {job_id} failed: {e}")
+                    db.session.rollback()
+                    job = db.session.get(DownloadJob, job_id)
+                    job.status = 'failed'
+                    job.error = str(e)
+                else:
+                    job.status = 'completed'
+                    job.result = json.dumps(result)
+                    job.video_id = result.get('video_id')
+
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                logger.info(f"Job {job_id} finished with status {job.status}")
+        except Exception as e:
+            logger.error(f"Error running job {job_id}: {e}")
+        finally:
+            self._slots.release()
+            if on_done is not None:
+                on_done(job_id)
@@ -0,0 +1,176 @@
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, MediaFile
+
+logger = logging.getLogger(__name__)
+
+class MediaStore:
+    """
+    Local store of downloaded videos keyed by (youtube_id, format selector)
+
+    Repeat requests for a stored key reuse the file on disk, and concurrent
+    requests for the same key share a single download.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def path_for(self, youtube_id, format_selector, extension='mp4'):
+        """Return the deterministic file path for a video and format"""
+        digest = hashlib.sha1(format_selector.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.root, f"yt_{youtube_id}_{digest}.{extension}")
+
+    def lookup(self, youtube_id, format_selector):
+        """
+        Find a stored file for a video and format
+
+        Returns:
+            MediaFile: The entry, or None if it isn't stored or its file is gone
+        """
+        entry = MediaFile.query.filter_by(
+            youtube_id=youtube_id,
+            format_selector=format_selector
+        ).first()
+        if entry is None:
+            return None
+
+        if entry.video is None or not os.path.exists(entry.path):
+            logger.info(f"Dropping stale media entry for {youtube_id}: {entry.path}")
+            db.session.delete(entry)
+            db.session.commit()
+            return None
+
+        entry.last_accessed_at = datetime.utcnow()
+        db.session.commit()
+        return entry
+
+    def record(self, youtube_id, format_selector, path, video_id):
+        """Register a finished download so later requests can reuse it"""
+        entry = MediaFile.query.filter_by(
+            youtube_id=youtube_id,
+            format_selector=format_selector
+        ).first()
+        if entry is None:
+            entry = MediaFile(youtube_id=youtube_id, format_selector=format_selector)
+            db.session.add(entry)
+
+        entry.path = path
+        entry.file_size = os.path.getsize(path)
+        entry.video_id = video_id
+        entry.last_accessed_at = datetime.utcnow()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker registered the same key first; its entry wins
+            db.session.rollback()
+        return entry
+
+    def touch(self, path):
+        """Record a use of a file, the janitor evicts least recently used files first"""
+        updated = MediaFile.query.filter_by(path=path).update({'last_accessed_at': datetime.utcnow()})
+        db.session.commit()
+        if not updated:
+            # Files without an entry are aged by their access time; the
+            # modification time stays put since ETag and If-Range depend on it
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+
+    def open_lease(self, path):
+        """
+        Mark a file as in use until the returned handle is closed
+
+        Leases are shared flock() locks, so they are honoured by the janitor
+        in every worker process.
+
+        Returns:
+            file: Open handle holding the lease
+        """
+        handle = open(path, 'rb')
+        fcntl.flock(handle, fcntl.LOCK_SH)
+        return handle
+
+    @contextmanager
+    def lease(self, path):
+        """Hold a lease on a file for the duration of a with block"""
+        handle = self.open_lease(path)
+        try:
+            yield path
+        finally:
+            handle.close()
+
+    def remove_if_unused(self, path):
+        """
+        Delete a file unless another upload or stream holds a lease on it
+
+        Returns:
+            bool: True if the file was removed or was already gone
+        """
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return True
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return False
+        try:
+            os.remove(path)
+        finally:
+            handle.close()
+        return True
+
+    def discard(self, path):
+        """Delete a stored file and its entry, unless it is still in use"""
+        if not self.remove_if_unused(path):
+            logger.info(f"Keeping {path}, it is still in use")
+            return False
+        MediaFile.query.filter_by(path=path).delete()
+        db.session.commit()
+        return True
+
+    def fetch(self, youtube_id, format_selector, producer):
+        """
+        Run producer once per key, sharing its result with concurrent callers
+
+        Args:
+            youtube_id (str): Canonical YouTube id
+            format_selector (str): yt-dlp format selector
+            producer (callable): Called with the target path, returns a result dict
+
+        Returns:
+            tuple: (result dict, bool telling whether this call produced it)
+        """
+        key = (youtube_id, format_selector)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            logger.info(f"Waiting for in-flight download of {youtube_id}")
+            return future.result(), False
+
+        try:
+            result = producer(self.path_for(youtube_id, format_selector))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return result, True
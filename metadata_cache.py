@@ -0,0 +1,299 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+import yt_dlp
+from sqlalchemy.exc import IntegrityError
+
+from models import db, VideoMetadata
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+# Options used for every cached extraction
+EXTRACT_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'noplaylist': True,
+    'nocheckcertificate': True,
+}
+
+# Fields kept from an extraction; everything else is dropped before caching
+INFO_FIELDS = (
+    'id', 'title', 'description', 'tags', 'categories', 'duration',
+    'thumbnail', 'uploader', 'uploader_id', 'channel', 'channel_id',
+    'upload_date', 'view_count', 'webpage_url',
+)
+THUMBNAIL_FIELDS = ('id', 'url', 'width', 'height', 'preference')
+FORMAT_FIELDS = (
+    'format_id', 'format_note', 'ext', 'protocol', 'width', 'height', 'fps',
+    'vcodec', 'acodec', 'tbr', 'vbr', 'abr', 'filesize', 'filesize_approx',
+)
+
+def normalize_info(info):
+    """
+    Reduce a yt-dlp info dict to the fields the app uses
+
+    Signed stream URLs and extractor internals are dropped so the result is
+    small and stays valid after it has been stored.
+
+    Args:
+        info (dict): Sanitized yt-dlp info dict
+
+    Returns:
+        dict: Normalized metadata
+    """
+    def pick(source, fields):
+        # Missing values are left out so callers' .get() defaults still apply
+        return {key: source[key] for key in fields if source.get(key) is not None}
+
+    normalized = pick(info, INFO_FIELDS)
+    normalized['tags'] = info.get('tags') or []
+    normalized['categories'] = info.get('categories') or []
+    normalized['thumbnails'] = [
+        pick(thumb, THUMBNAIL_FIELDS)
+        for thumb in info.get('thumbnails') or [] if isinstance(thumb, dict)
+    ]
+    normalized['formats'] = [
+        pick(fmt, FORMAT_FIELDS)
+        for fmt in info.get('formats') or [] if isinstance(fmt, dict)
+    ]
+    return normalized
+
+def extract_video_id(url):
+    """
+    Get the canonical YouTube video id from a URL
+
+    Args:
+        url (str): YouTube watch, short, embed or youtu.be URL
+
+    Returns:
+        str: The 11 character video id, or None if it can't be found
+    """
+    try:
+        parsed_url = urlparse(url)
+    except ValueError:
+        return None
+
+    candidate = None
+    if parsed_url.netloc.endswith('youtu.be'):
+        candidate = parsed_url.path.lstrip('/').split('/')[0]
+    elif 'youtube.com' in parsed_url.netloc:
+        if parsed_url.path == '/watch':
+            candidate = parse_qs(parsed_url.query).get('v', [None])[0]
+        else:
+            parts = parsed_url.path.strip('/').split('/')
+            if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+                candidate = parts[1]
+
+    if candidate and YOUTUBE_ID_PATTERN.match(candidate):
+        return candidate
+    return None
+
+class MetadataCache:
+    """
+    Two-tier cache of yt-dlp extraction results
+
+    Lookups go to a size-bounded in-process LRU with a TTL first, then to the
+    VideoMetadata table shared by every worker. Stale database rows are still
+    served and refreshed in the background.
+    """
+
+    def __init__(self, app=None, max_size=256, ttl=600, db_ttl=24 * 3600):
+        self.app = None
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self.hits = 0
+        self.misses = 0
+        self.db_hits = 0
+        self.refreshes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metadata-refresh')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read cache limits from the application config"""
+        self.app = app
+        self.max_size = app.config.get('METADATA_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('METADATA_CACHE_TTL', self.ttl)
+        self.db_ttl = app.config.get('METADATA_DB_TTL', self.db_ttl)
+
+    def get(self, video_id):
+        """Return cached info for a video id, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[video_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(video_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, video_id, info):
+        """Store info for a video id, evicting the least recently used entry"""
+        with self._lock:
+            self._entries[video_id] = (time.monotonic(), info)
+            self._entries.move_to_end(video_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def lookup(self, video_id):
+        """Return cached info from either tier without extracting, or None"""
+        info = self.get(video_id)
+        if info is None:
+            info = self._load(video_id)
+        return info
+
+    def invalidate(self, video_id):
+        """Drop a single cached entry"""
+        with self._lock:
+            self._entries.pop(video_id, None)
+
+    def stats(self):
+        """Return cache hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'db_ttl': self.db_ttl,
+                'db_hits': self.db_hits,
+                'background_refreshes': self.refreshes
+            }
+
+    def get_info(self, url):
+        """
+        Get yt-dlp info for a video URL, extracting it only on a cache miss
+
+        Concurrent misses for the same video share a single extraction.
+
+        Args:
+            url (str): YouTube video URL
+
+        Returns:
+            dict: The yt-dlp info dict
+        """
+        video_id = extract_video_id(url)
+        if video_id:
+            info = self.get(video_id)
+            if info is not None:
+                return info
+
+            info = self._load(video_id)
+            if info is not None:
+                return info
+
+            with self._lock:
+                event = self._inflight.get(video_id)
+                owner = event is None
+                if owner:
+                    event = self._inflight[video_id] = threading.Event()
+
+            if not owner:
+                event.wait()
+                info = self.get(video_id)
+                if info is not None:
+                    return info
+
+        try:
+            info = self._extract(url)
+        finally:
+            if video_id and owner:
+                with self._lock:
+                    self._inflight.pop(video_id, None)
+                event.set()
+        return info
+
+    def _extract(self, url):
+        """Run yt-dlp extraction and cache the result in both tiers"""
+        logger.info(f"Extracting metadata for {url}")
+        with yt_dlp.YoutubeDL(EXTRACT_OPTIONS) as ydl:
+            raw_info = ydl.extract_info(url, download=False)
+
+        if not raw_info:
+            raise ValueError(f"No video information found for {url}")
+
+        info = normalize_info(yt_dlp.YoutubeDL.sanitize_info(raw_info))
+        if info.get('id'):
+            self.set(info['id'], info)
+            self._store(info)
+        return info
+
+    def _load(self, video_id):
+        """Load a video's metadata from the database, refreshing it if stale"""
+        try:
+            row = VideoMetadata.query.filter_by(youtube_id=video_id).first()
+        except Exception as e:
+            logger.warning(f"Could not read cached metadata for {video_id}: {e}")
+            return None
+        if row is None:
+            return None
+
+        info = row.to_info()
+        with self._lock:
+            self.db_hits += 1
+        self.set(video_id, info)
+
+        if datetime.utcnow() - row.fetched_at > timedelta(seconds=self.db_ttl):
+            self._schedule_refresh(video_id)
+        return info
+
+    def _store(self, info):
+        """Insert or update the database row for a video's metadata"""
+        try:
+            row = VideoMetadata.query.filter_by(youtube_id=info['id']).first()
+            if row is None:
+                row = VideoMetadata(youtube_id=info['id'])
+                db.session.add(row)
+            row.data = json.dumps(info)
+            row.fetched_at = datetime.utcnow()
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored the same video first
+            db.session.rollback()
+        except Exception as e:
+            logger.warning(f"Could not store metadata for {info['id']}: {e}")
+            db.session.rollback()
+
+    def _schedule_refresh(self, video_id):
+        """Re-extract a stale video in the background"""
+        if self.app is None:
+            return
+        with self._lock:
+            if video_id in self._refreshing:
+                return
+            self._refreshing.add(video_id)
+        self._refresher.submit(self._refresh, video_id)
+
+    def _refresh(self, video_id):
+        """Background task refreshing one stale database row"""
+        try:
+            with self.app.app_context():
+                self._extract(f"https://www.youtube.com/watch?v={video_id}")
+            with self._lock:
+                self.refreshes += 1
+            logger.info(f"Refreshed cached metadata for {video_id}")
+        except Exception as e:
+            logger.warning(f"Background metadata refresh failed for {video_id}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(video_id)
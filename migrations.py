@@ -0,0 +1,135 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+import search_index
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Applied migrations, one row per version
+schema_version = db.Table(
+    'schema_version',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.String(100), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+def migration(version):
+    """Register a function as the schema migration with this version number"""
+    def register(func):
+        MIGRATIONS.append((version, func.__name__, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+def upgrade():
+    """
+    Apply every migration that hasn't run on this database yet
+
+    db.create_all() only creates missing tables. Changes to tables that
+    already exist, such as new indexes, constraints or columns, are made
+    here. Every migration must also be safe on a database that create_all()
+    has just built from the current models.
+
+    A migration never changes once it is in this list, later schema changes
+    get a new version. So migrations spell out their DDL instead of reading
+    it from the models, which keep changing.
+
+    Returns:
+        list: Versions that were applied
+    """
+    schema_version.create(db.engine, checkfirst=True)
+    applied = []
+    for version, name, func in MIGRATIONS:
+        if _is_applied(version):
+            continue
+
+        logger.info(f"Applying migration {version}: {name}")
+        try:
+            with db.engine.begin() as connection:
+                func(connection)
+                connection.execute(schema_version.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+        except SQLAlchemyError:
+            # Another worker process may have applied it concurrently
+            if _is_applied(version):
+                continue
+            raise
+        applied.append(version)
+    return applied
+
+def _is_applied(version):
+    with db.engine.connect() as connection:
+        row = connection.execute(
+            schema_version.select().where(schema_version.c.version == version)
+        ).first()
+    return row is not None
+
+def create_index(connection, name, table, columns, unique=False):
+    """Create an index unless it exists"""
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    connection.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+def add_column(connection, table, name, column_type):
+    """Add a column unless the table already has it"""
+    existing = {column['name'] for column in inspect(connection).get_columns(table)}
+    if name not in existing:
+        column_type = column_type.compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}'))
+
+@migration(1)
+def add_video_history_indexes(connection):
+    """Keyset indexes for history pages, plus youtube_id for dedup and metadata lookups"""
+    create_index(connection, 'ix_video_download_date_id', 'video', ['download_date', 'id'])
+    create_index(connection, 'ix_video_drive_download_date_id', 'video', ['uploaded_to_drive', 'download_date', 'id'])
+    create_index(connection, 'ix_video_youtube_download_date_id', 'video', ['uploaded_to_youtube', 'download_date', 'id'])
+    create_index(connection, 'ix_video_uploader_download_date_id', 'video', ['uploader', 'download_date', 'id'])
+    create_index(connection, 'ix_video_youtube_id', 'video', ['youtube_id'])
+
+@migration(2)
+def unique_api_credential_service_name(connection):
+    """Keep the newest credentials per service, then enforce one row per service"""
+    rows = connection.execute(text(
+        'SELECT id, service_name FROM api_credential '
+        'ORDER BY service_name, updated_at DESC, id DESC'
+    )).fetchall()
+    seen = set()
+    duplicates = []
+    for row_id, service_name in rows:
+        if service_name in seen:
+            duplicates.append(row_id)
+        seen.add(service_name)
+    for row_id in duplicates:
+        connection.execute(text('DELETE FROM api_credential WHERE id = :id'), {'id': row_id})
+    if duplicates:
+        logger.warning(f"Removed {len(duplicates)} duplicate API credential rows")
+
+    create_index(connection, 'uq_api_credential_service_name', 'api_credential', ['service_name'], unique=True)
+
+# Version 3 is retired: upload_session has been created with its telemetry
+# columns by create_all() ever since the table was released
+
+@migration(4)
+def add_video_search_index(connection):
+    """Full-text index over videos, filled from existing rows and cached metadata"""
+    if search_index.create_schema(connection):
+        indexed = search_index.rebuild(connection)
+        logger.info(f"Indexed {indexed} videos for search")
+
+@migration(5)
+def add_video_updated_at(connection):
+    """Change stamp on videos, the history ETag is derived from its maximum"""
+    add_column(connection, 'video', 'updated_at', db.DateTime())
+    create_index(connection, 'ix_video_updated_at', 'video', ['updated_at'])
+
+@migration(6)
+def add_job_owners(connection):
+    """Owning process of jobs and batches, for failing the ones a restart interrupted"""
+    add_column(connection, 'download_job', 'owner', db.String(100))
+    add_column(connection, 'download_batch', 'owner', db.String(100))
@@ -1,4 +1,5 @@
 from datetime import datetime
+import json
 import os
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
@@ -20,6 +21,11 @@ class User(UserMixin, db.Model):
 
 class ApiCredential(db.Model):
     """Model for storing API credentials"""
+    # One set of credentials per service, looked up by name
+    __table_args__ = (
+        db.Index('uq_api_credential_service_name', 'service_name', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     service_name = db.Column(db.String(50), nullable=False)
     client_id = db.Column(db.String(255), nullable=False)
@@ -32,14 +38,23 @@ class ApiCredential(db.Model):
 
 class Video(db.Model):
     """Model for tracking video downloads and uploads"""
+    # History pages are keyset scans over (download_date, id), optionally filtered
+    __table_args__ = (
+        db.Index('ix_video_download_date_id', 'download_date', 'id'),
+        db.Index('ix_video_drive_download_date_id', 'uploaded_to_drive', 'download_date', 'id'),
+        db.Index('ix_video_youtube_download_date_id', 'uploaded_to_youtube', 'download_date', 'id'),
+        db.Index('ix_video_uploader_download_date_id', 'uploader', 'download_date', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    youtube_id = db.Column(db.String(50), nullable=False)
+    youtube_id = db.Column(db.String(50), nullable=False, index=True)
     title = db.Column(db.String(255), nullable=False)
     url = db.Column(db.String(255), nullable=False)
     duration = db.Column(db.Integer, nullable=True)
     thumbnail_url = db.Column(db.String(255), nullable=True)
     uploader = db.Column(db.String(255), nullable=True)
     download_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     file_size = db.Column(db.BigInteger, nullable=True)
     download_success = db.Column(db.Boolean, default=False)
     uploaded_to_drive = db.Column(db.Boolean, default=False)
@@ -49,9 +64,25 @@ class Video(db.Model):
     uploaded_to_youtube = db.Column(db.Boolean, default=False)
     youtube_upload_id = db.Column(db.String(100), nullable=True)
     
+    # Files of this video still kept on local disk
+    media_files = db.relationship('MediaFile', back_populates='video')
+    
+    # Cached extraction result shared by every download of this YouTube video
+    cached_metadata = db.relationship(
+        'VideoMetadata',
+        primaryjoin='foreign(Video.youtube_id) == VideoMetadata.youtube_id',
+        viewonly=True,
+        uselist=False
+    )
+    
     def __repr__(self):
         return f'<Video {self.title}>'
     
+    @property
+    def locally_available(self):
+        """Whether a downloaded file for this video is still on local disk"""
+        return bool(self.media_files)
+    
     def to_dict(self):
         """Convert video object to dictionary"""
         return {
@@ -69,5 +100,217 @@ class Video(db.Model):
             'drive_file_id': self.drive_file_id,
             'drive_folder_id': self.drive_folder_id,
             'uploaded_to_youtube': self.uploaded_to_youtube,
-            'youtube_upload_id': self.youtube_upload_id
-        }
\ No newline at end of file
+            'youtube_upload_id': self.youtube_upload_id,
+            'locally_available': self.locally_available
+        }
+
+class VideoMetadata(db.Model):
+    """Model for caching normalized yt-dlp metadata per YouTube video"""
+    id = db.Column(db.Integer, primary_key=True)
+    youtube_id = db.Column(db.String(50), unique=True, nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<VideoMetadata {self.youtube_id}>'
+    
+    def to_info(self):
+        """Return the cached metadata as a yt-dlp style info dict"""
+        return json.loads(self.data)
+
+class MediaFile(db.Model):
+    """Model for downloaded files kept on local disk, keyed by video and format"""
+    __table_args__ = (
+        db.UniqueConstraint('youtube_id', 'format_selector', name='uq_media_file_video_format'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    youtube_id = db.Column(db.String(50), nullable=False)
+    format_selector = db.Column(db.String(255), nullable=False)
+    path = db.Column(db.String(512), nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    video = db.relationship('Video', back_populates='media_files')
+    
+    def __repr__(self):
+        return f'<MediaFile {self.youtube_id} {self.format_selector}>'
+
+class DownloadJob(db.Model):
+    """Model for tracking background download jobs"""
+    id = db.Column(db.String(32), primary_key=True)
+    url = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=True)
+    batch_id = db.Column(db.String(32), db.ForeignKey('download_batch.id'), nullable=True)
+    batch_position = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Process that queued the job, host:pid
+    owner = db.Column(db.String(100), nullable=True)
+    
+    def __repr__(self):
+        return f'<DownloadJob {self.id} {self.status}>'
+    
+    def to_dict(self):
+        """Convert job object to dictionary"""
+        return {
+            'job_id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'video_id': self.video_id,
+            'batch_id': self.batch_id,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class DownloadBatch(db.Model):
+    """Model grouping the download jobs of one batch request"""
+    id = db.Column(db.String(32), primary_key=True)
+    concurrency = db.Column(db.Integer, nullable=False)
+    # Set when the batch was expanded from a playlist or channel
+    source_url = db.Column(db.String(255), nullable=True)
+    expanding = db.Column(db.Boolean, default=False)
+    skipped = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Process listing the playlist or channel, host:pid
+    owner = db.Column(db.String(100), nullable=True)
+    
+    jobs = db.relationship('DownloadJob', backref='batch', order_by='DownloadJob.batch_position')
+    
+    def __repr__(self):
+        return f'<DownloadBatch {self.id}>'
+    
+    def to_dict(self):
+        """Convert batch object to dictionary, with per-video results"""
+        counts = {'queued': 0, 'running': 0, 'completed': 0, 'failed': 0}
+        for job in self.jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        
+        if self.expanding or counts['queued'] or counts['running']:
+            status = 'running'
+        elif self.error and not self.jobs:
+            status = 'failed'
+        elif counts['failed'] and counts['completed']:
+            status = 'partial'
+        elif counts['failed']:
+            status = 'failed'
+        else:
+            status = 'completed'
+        
+        return {
+            'batch_id': self.id,
+            'status': status,
+            'concurrency': self.concurrency,
+            'source_url': self.source_url,
+            'expanding': self.expanding,
+            'skipped': self.skipped,
+            'error': self.error,
+            'total': len(self.jobs),
+            'counts': counts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'items': [job.to_dict() for job in self.jobs]
+        }
+
+class UploadSession(db.Model):
+    """Model checkpointing a resumable Drive or YouTube upload of a video"""
+    __table_args__ = (
+        db.UniqueConstraint('video_id', 'destination', name='uq_upload_session_video_destination'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
+    destination = db.Column(db.String(20), nullable=False)  # 'drive' or 'youtube'
+    filename = db.Column(db.String(512), nullable=False)
+    session_uri = db.Column(db.Text, nullable=True)
+    confirmed_offset = db.Column(db.BigInteger, default=0)
+    total_size = db.Column(db.BigInteger, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='active')
+    remote_id = db.Column(db.String(100), nullable=True)
+    # Last adaptive chunk size and measured throughput in bytes per second
+    chunk_size = db.Column(db.BigInteger, nullable=True)
+    throughput = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UploadSession {self.video_id} {self.destination} {self.status}>'
+    
+    def to_dict(self):
+        """Convert upload session object to dictionary"""
+        return {
+            'video_id': self.video_id,
+            'destination': self.destination,
+            'status': self.status,
+            'confirmed_offset': self.confirmed_offset,
+            'total_size': self.total_size,
+            'remote_id': self.remote_id,
+            'chunk_size': self.chunk_size,
+            'throughput': self.throughput,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class OAuthToken(db.Model):
+    """Model storing a user's Google OAuth tokens on the server"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    token = db.Column(db.Text, nullable=True)
+    refresh_token = db.Column(db.Text, nullable=True)
+    token_uri = db.Column(db.String(255), nullable=False)
+    client_id = db.Column(db.String(255), nullable=True)
+    scopes = db.Column(db.Text, nullable=True)  # JSON list
+    expiry = db.Column(db.DateTime, nullable=True)  # UTC
+    # Set when a refresh was rejected, cleared by the next login
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<OAuthToken user {self.user_id}>'
+
+class DriveFolder(db.Model):
+    """Model indexing a user's Google Drive folders"""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'folder_id', name='uq_drive_folder_user_folder'),
+        db.Index('ix_drive_folder_user_name', 'user_id', 'name_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    folder_id = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    # Lowercased name for sorting and prefix search
+    name_key = db.Column(db.String(255), nullable=False)
+    parents = db.Column(db.Text, nullable=True)  # JSON list of folder ids
+    
+    def __repr__(self):
+        return f'<DriveFolder {self.name}>'
+    
+    def to_dict(self):
+        """Convert folder object to dictionary, shaped like a Drive API file"""
+        return {
+            'id': self.folder_id,
+            'name': self.name,
+            'parents': json.loads(self.parents) if self.parents else []
+        }
+
+class DriveSyncState(db.Model):
+    """Model tracking how far a user's folder index has followed Drive changes"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    page_token = db.Column(db.String(255), nullable=True)
+    full_sync_at = db.Column(db.DateTime, nullable=True)
+    synced_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<DriveSyncState user {self.user_id}>'
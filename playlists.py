@@ -0,0 +1,100 @@
+import logging
+from urllib.parse import urlparse, parse_qs
+
+import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+# Flat extraction only lists entries, it never resolves the videos themselves
+FLAT_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'extract_flat': 'in_playlist',
+    'lazy_playlist': True,
+}
+
+# Channel pages are lists of tabs, nesting deeper than this is not followed
+MAX_NESTING = 2
+
+CHANNEL_PREFIXES = ('channel', 'c', 'user')
+
+def is_youtube_collection_url(url):
+    """
+    Check if a URL points to a YouTube playlist or channel
+
+    Args:
+        url (str): URL to check
+
+    Returns:
+        bool: True for playlist and channel URLs
+    """
+    try:
+        parsed_url = urlparse(url)
+        if parsed_url.netloc not in ['youtube.com', 'www.youtube.com', 'm.youtube.com']:
+            return False
+        if parsed_url.path == '/playlist':
+            return bool(parse_qs(parsed_url.query).get('list'))
+
+        parts = parsed_url.path.strip('/').split('/')
+        if parts[0].startswith('@'):
+            return len(parts[0]) > 1
+        return len(parts) >= 2 and parts[0] in CHANNEL_PREFIXES and bool(parts[1])
+    except Exception:
+        return False
+
+def channel_videos_url(url):
+    """Point a bare channel URL at its videos tab instead of the tab list"""
+    parsed_url = urlparse(url)
+    parts = parsed_url.path.strip('/').split('/')
+    bare_handle = len(parts) == 1 and parts[0].startswith('@')
+    bare_channel = len(parts) == 2 and parts[0] in CHANNEL_PREFIXES
+    if bare_handle or bare_channel:
+        return parsed_url._replace(path='/' + '/'.join(parts + ['videos'])).geturl()
+    return url
+
+def iter_collection_entries(url):
+    """
+    Lazily list the videos of a playlist or channel
+
+    Entries are produced page by page as yt-dlp fetches them, so callers can
+    start working on the first videos before the listing is complete.
+
+    Args:
+        url (str): Playlist or channel URL
+
+    Yields:
+        tuple: (watch URL, youtube id) for every video found
+    """
+    seen = set()
+    with yt_dlp.YoutubeDL(FLAT_OPTIONS) as ydl:
+        for youtube_id in _walk(ydl, channel_videos_url(url), 0):
+            if youtube_id in seen:
+                continue
+            seen.add(youtube_id)
+            yield f"https://www.youtube.com/watch?v={youtube_id}", youtube_id
+
+def _walk(ydl, url, depth):
+    """Yield video ids below a URL, following nested playlists and tabs"""
+    # process=False keeps 'entries' as a lazy generator over the result pages
+    info = ydl.extract_info(url, download=False, process=False)
+    while info and info.get('_type') in ('url', 'url_transparent'):
+        info = ydl.extract_info(info['url'], download=False, process=False,
+                                ie_key=info.get('ie_key'))
+    if not info:
+        return
+
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        if info.get('id'):
+            yield info['id']
+        return
+
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        if entry.get('ie_key') == 'Youtube' and entry.get('id'):
+            yield entry['id']
+        elif entry.get('url') and depth < MAX_NESTING:
+            yield from _walk(ydl, entry['url'], depth + 1)
+        else:
+            logger.debug(f"Skipping playlist entry {entry.get('url')}")
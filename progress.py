@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('finished', 'error')
+
+class ProgressTracker:
+    """Thread-safe store of the latest transfer progress for each job"""
+
+    def __init__(self, retention=3600):
+        self.retention = retention
+        self._cond = threading.Condition()
+        self._states = {}
+        self._seq = 0
+
+    def update(self, job_id, phase, status='running', downloaded_bytes=None,
+               total_bytes=None, speed=None, eta=None, **extra):
+        """
+        Record progress for a job and wake up any listeners
+
+        Args:
+            job_id (str): Job the transfer belongs to
+            phase (str): Transfer phase, e.g. 'download' or 'drive_upload'
+            status (str): 'running', 'finished' or 'error'
+            downloaded_bytes (int): Bytes transferred so far
+            total_bytes (int): Expected size, if known
+            speed (float): Bytes per second, measured here when not given
+            eta (float): Seconds remaining, estimated here when not given
+        """
+        now = time.time()
+        with self._cond:
+            previous = self._states.get(job_id)
+            if previous is None or previous['phase'] != phase:
+                previous = {'phase': phase, 'started_at': now,
+                            'downloaded_bytes': 0, 'updated_at': now}
+
+            if downloaded_bytes is None:
+                downloaded_bytes = previous['downloaded_bytes']
+            if total_bytes is None:
+                total_bytes = previous.get('total_bytes')
+
+            if speed is None:
+                elapsed = now - previous['updated_at']
+                delta = downloaded_bytes - previous['downloaded_bytes']
+                if elapsed > 0 and delta > 0:
+                    measured = delta / elapsed
+                    last_speed = previous.get('speed')
+                    # Smooth the measurement so one slow chunk doesn't swing the ETA
+                    speed = measured if last_speed is None else 0.3 * measured + 0.7 * last_speed
+                else:
+                    speed = previous.get('speed')
+            if eta is None and speed and total_bytes:
+                eta = max(total_bytes - downloaded_bytes, 0) / speed
+
+            percent = None
+            if total_bytes:
+                percent = round(min(downloaded_bytes / total_bytes, 1.0) * 100, 1)
+            if status == 'finished':
+                percent = 100.0
+                eta = 0
+
+            self._seq += 1
+            state = {
+                'seq': self._seq,
+                'job_id': job_id,
+                'phase': phase,
+                'status': status,
+                'downloaded_bytes': downloaded_bytes,
+                'total_bytes': total_bytes,
+                'percent': percent,
+                'speed': speed,
+                'eta': eta,
+                'started_at': previous['started_at'],
+                'updated_at': now,
+            }
+            state.update(extra)
+            self._states[job_id] = state
+            self._prune(now)
+            self._cond.notify_all()
+        return state
+
+    def finish(self, job_id, phase, **extra):
+        """Mark a transfer phase as finished"""
+        return self.update(job_id, phase, status='finished', **extra)
+
+    def fail(self, job_id, phase, error):
+        """Mark a transfer phase as failed"""
+        return self.update(job_id, phase, status='error', error=error)
+
+    def get(self, job_id):
+        """Return the latest progress state for a job, if any"""
+        with self._cond:
+            state = self._states.get(job_id)
+            return dict(state) if state else None
+
+    def wait(self, job_id, after_seq=0, timeout=None):
+        """Block until the job has a state newer than after_seq, or timeout"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._states.get(job_id, {}).get('seq', 0) > after_seq,
+                timeout=timeout
+            )
+            state = self._states.get(job_id)
+            if state and state['seq'] > after_seq:
+                return dict(state)
+            return None
+
+    def stream(self, job_id, phase=None, keepalive=15, check=None):
+        """
+        Generate Server-Sent Events for a job's progress
+
+        The stream ends once the requested phase (or any phase, when none is
+        given) reaches a terminal status.
+
+        Args:
+            check (callable): Called on every keepalive timeout, returns a
+                terminal state recorded elsewhere (e.g. the job's DB row)
+                that ends the stream, or None to keep waiting
+        """
+        seq = 0
+        while True:
+            state = self.wait(job_id, seq, timeout=keepalive)
+            if state is None:
+                final = check() if check is not None else None
+                if final is not None:
+                    yield f"data: {json.dumps(final)}\n\n"
+                    return
+                yield ': keepalive\n\n'
+                continue
+            seq = state['seq']
+            yield f"data: {json.dumps(state)}\n\n"
+            if state['status'] in TERMINAL_STATUSES and phase in (None, state['phase']):
+                return
+
+    def _prune(self, now):
+        """Forget finished transfers older than the retention period"""
+        expired = [job_id for job_id, state in self._states.items()
+                   if state['status'] in TERMINAL_STATUSES
+                   and now - state['updated_at'] > self.retention]
+        for job_id in expired:
+            del self._states[job_id]
+
+# Shared tracker for all transfers in this process
+tracker = ProgressTracker()
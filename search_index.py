@@ -0,0 +1,202 @@
+import json
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+
+from models import db, Video, VideoMetadata
+
+logger = logging.getLogger(__name__)
+
+# Only this many words of a query are searched for
+MAX_QUERY_TERMS = 10
+
+# SQLite: FTS5 table whose rowid is the video id, column order matches SQLITE_WEIGHTS
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS video_search USING fts5("
+    "title, uploader, tags, description, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+]
+SQLITE_WEIGHTS = '10.0, 5.0, 3.0, 1.0'
+
+# Postgres: one weighted tsvector per video with a GIN index
+POSTGRES_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS video_search ("
+    "video_id INTEGER PRIMARY KEY REFERENCES video (id) ON DELETE CASCADE, "
+    "document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_video_search_document ON video_search USING GIN (document)",
+]
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', :title), 'A') || "
+    "setweight(to_tsvector('simple', :uploader), 'B') || "
+    "setweight(to_tsvector('simple', :tags), 'C') || "
+    "setweight(to_tsvector('simple', :description), 'D')"
+)
+
+def create_schema(connection):
+    """
+    Create the full-text index for the connection's database
+
+    Returns:
+        bool: False if the database has no full-text support
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = SQLITE_SCHEMA
+    elif dialect == 'postgresql':
+        statements = POSTGRES_SCHEMA
+    else:
+        return False
+
+    try:
+        for statement in statements:
+            connection.execute(text(statement))
+    except OperationalError as e:
+        # SQLite builds without FTS5
+        logger.warning(f"Full-text index unavailable, search falls back to LIKE: {e}")
+        return False
+    return True
+
+def rebuild(connection):
+    """Index every video, using cached metadata for descriptions and tags"""
+    rows = connection.execute(
+        db.select(Video.id, Video.title, Video.uploader, VideoMetadata.data)
+        .outerjoin(VideoMetadata, VideoMetadata.youtube_id == Video.youtube_id)
+    ).fetchall()
+    for video_id, title, uploader, data in rows:
+        info = json.loads(data) if data else None
+        _upsert(connection, connection.dialect.name, video_id, document(title, uploader, info))
+    return len(rows)
+
+def document(title, uploader, info=None):
+    """Return the searchable fields of a video"""
+    info = info or {}
+    return {
+        'title': title or '',
+        'uploader': uploader or '',
+        'tags': ' '.join(info.get('tags') or []),
+        'description': info.get('description') or '',
+    }
+
+def query_terms(query):
+    """Split a user query into at most MAX_QUERY_TERMS lowercase words"""
+    return re.findall(r'\w+', query.lower())[:MAX_QUERY_TERMS]
+
+def _upsert(executor, dialect, video_id, fields):
+    """Replace a video's entry using a connection or session"""
+    params = dict(fields, video_id=video_id)
+    if dialect == 'sqlite':
+        executor.execute(text('DELETE FROM video_search WHERE rowid = :video_id'), params)
+        executor.execute(text(
+            'INSERT INTO video_search (rowid, title, uploader, tags, description) '
+            'VALUES (:video_id, :title, :uploader, :tags, :description)'
+        ), params)
+    elif dialect == 'postgresql':
+        executor.execute(text(
+            f'INSERT INTO video_search (video_id, document) VALUES (:video_id, {POSTGRES_DOCUMENT}) '
+            'ON CONFLICT (video_id) DO UPDATE SET document = EXCLUDED.document'
+        ), params)
+
+class SearchIndex:
+    """
+    Ranked full-text search over video titles, uploaders, tags and descriptions
+
+    SQLite databases use an FTS5 table ranked with bm25, Postgres databases a
+    weighted tsvector with a GIN index ranked with ts_rank_cd. Every word of
+    a query has to match the start of an indexed word. Other databases, or
+    SQLite without FTS5, fall back to unranked LIKE matching.
+    """
+
+    def __init__(self, app=None):
+        self.available = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Check once whether the database has the full-text index"""
+        with app.app_context():
+            self.available = self._has_index()
+
+    def index_video(self, video, info=None):
+        """
+        Add or update one video in the index, committing with the session
+
+        Args:
+            video (Video): Video row, flushed so it has an id
+            info (dict): Cached yt-dlp metadata with description and tags
+        """
+        if not self.available:
+            return
+        if info is None:
+            row = VideoMetadata.query.filter_by(youtube_id=video.youtube_id).first()
+            info = row.to_info() if row else None
+        _upsert(db.session, db.engine.dialect.name, video.id, document(video.title, video.uploader, info))
+
+    def search(self, query, page=1, per_page=20):
+        """
+        Search videos, best matches first
+
+        Args:
+            query (str): Words to search for
+            page (int): 1-based page number
+            per_page (int): Results per page
+
+        Returns:
+            tuple: (list of (Video, rank) pairs, whether more pages follow)
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], False
+
+        offset = (page - 1) * per_page
+        if self.available:
+            ranked = self._ranked_ids(terms, per_page + 1, offset)
+        else:
+            ranked = self._like_ids(terms, per_page + 1, offset)
+
+        has_more = len(ranked) > per_page
+        ranked = ranked[:per_page]
+        query = Video.query.options(selectinload(Video.media_files)).filter(Video.id.in_([row[0] for row in ranked]))
+        videos = {video.id: video for video in query}
+        return [(videos[video_id], rank) for video_id, rank in ranked if video_id in videos], has_more
+
+    def _ranked_ids(self, terms, limit, offset):
+        if db.engine.dialect.name == 'sqlite':
+            sql = (
+                f'SELECT rowid, bm25(video_search, {SQLITE_WEIGHTS}) AS rank FROM video_search '
+                'WHERE video_search MATCH :match ORDER BY rank, rowid DESC LIMIT :limit OFFSET :offset'
+            )
+            # bm25 is lower for better matches, flip it so higher ranks are better
+            match = ' '.join(f'"{term}"*' for term in terms)
+            rows = db.session.execute(text(sql), {'match': match, 'limit': limit, 'offset': offset})
+            return [(video_id, -rank) for video_id, rank in rows]
+
+        sql = (
+            'SELECT video_id, ts_rank_cd(document, query) AS rank '
+            "FROM video_search, to_tsquery('simple', :match) AS query "
+            'WHERE document @@ query ORDER BY rank DESC, video_id DESC LIMIT :limit OFFSET :offset'
+        )
+        match = ' & '.join(f'{term}:*' for term in terms)
+        rows = db.session.execute(text(sql), {'match': match, 'limit': limit, 'offset': offset})
+        return [(video_id, rank) for video_id, rank in rows]
+
+    def _like_ids(self, terms, limit, offset):
+        query = db.session.query(Video.id)
+        for term in terms:
+            pattern = f'%{term}%'
+            query = query.filter(db.or_(Video.title.ilike(pattern), Video.uploader.ilike(pattern)))
+        rows = query.order_by(Video.download_date.desc(), Video.id.desc()).limit(limit).offset(offset)
+        return [(video_id, None) for video_id, in rows]
+
+    def _has_index(self):
+        dialect = db.engine.dialect.name
+        if dialect not in ('sqlite', 'postgresql'):
+            return False
+        try:
+            db.session.execute(text('SELECT 1 FROM video_search LIMIT 1'))
+            return True
+        except Exception:
+            db.session.rollback()
+            return False
@@ -11,6 +11,122 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Follow a transfer phase of a job over Server-Sent Events.
+    // onUpdate receives every progress event for that phase.
+    function watchProgress(jobId, phase, onUpdate) {
+        const source = new EventSource(`/jobs/${jobId}/events?phase=${phase}`);
+        source.onmessage = function(event) {
+            const state = JSON.parse(event.data);
+            if (state.phase !== phase) return;
+            onUpdate(state);
+            if (state.status === 'finished' || state.status === 'error') {
+                source.close();
+            }
+        };
+        return source;
+    }
+
+    function showProgress(bar, statusElement, state, label) {
+        const percent = Math.round(state.percent || 0);
+        bar.style.width = `${percent}%`;
+        bar.textContent = `${percent}%`;
+        if (statusElement) {
+            let text = `${label}: ${formatBytes(state.downloaded_bytes)}`;
+            if (state.total_bytes) text += ` of ${formatBytes(state.total_bytes)}`;
+            if (state.speed) text += ` at ${formatBytes(state.speed)}/s`;
+            if (state.eta) text += `, ${Math.round(state.eta)}s left`;
+            statusElement.textContent = text;
+        }
+    }
+
+    function formatBytes(bytes) {
+        if (!bytes) return '0 B';
+        const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+        let size = bytes;
+        let unitIndex = 0;
+        while (size >= 1024 && unitIndex < units.length - 1) {
+            size /= 1024;
+            unitIndex++;
+        }
+        return `${size.toFixed(1)} ${units[unitIndex]}`;
+    }
+
+    // Wait for a background download job using its progress stream,
+    // checking the job record alongside it in case the stream stalls
+    // and falling back to polling when the stream isn't available
+    function waitForJob(jobId, onUpdate, interval = 5000) {
+        if (!window.EventSource) {
+            return pollJob(jobId);
+        }
+        return new Promise((resolve, reject) => {
+            let timer = null;
+            let done = false;
+            function settle(callback, value) {
+                if (done) return;
+                done = true;
+                clearTimeout(timer);
+                source.close();
+                callback(value);
+            }
+            function check() {
+                fetch(`/jobs/${jobId}`)
+                    .then(response => response.json())
+                    .then(job => {
+                        if (done) return;
+                        if (job.status === 'completed') {
+                            settle(resolve, job.result);
+                        } else if (job.status === 'failed') {
+                            settle(reject, new Error(job.error || 'Download failed'));
+                        } else {
+                            timer = setTimeout(check, interval);
+                        }
+                    })
+                    .catch(() => {
+                        if (!done) timer = setTimeout(check, interval);
+                    });
+            }
+            const source = watchProgress(jobId, 'download', state => {
+                if (onUpdate) onUpdate(state);
+                if (state.status === 'finished') {
+                    settle(resolve, state.result);
+                } else if (state.status === 'error') {
+                    settle(reject, new Error(state.error || 'Download failed'));
+                }
+            });
+            source.onerror = function() {
+                if (done) return;
+                done = true;
+                clearTimeout(timer);
+                source.close();
+                pollJob(jobId).then(resolve, reject);
+            };
+            timer = setTimeout(check, interval);
+        });
+    }
+
+    // Poll a background job until it completes or fails
+    function pollJob(jobId, interval = 2000) {
+        return new Promise((resolve, reject) => {
+            function poll() {
+                fetch(`/jobs/${jobId}`)
+                    .then(response => response.json())
+                    .then(job => {
+                        if (job.error && !job.status) {
+                            reject(new Error(job.error));
+                        } else if (job.status === 'completed') {
+                            resolve(job.result);
+                        } else if (job.status === 'failed') {
+                            reject(new Error(job.error || 'Download failed'));
+                        } else {
+                            setTimeout(poll, interval);
+                        }
+                    })
+                    .catch(reject);
+            }
+            poll();
+        });
+    }
+
     // Initialize elements
     const youtubeForm = document.getElementById('youtube-form');
     const youtubeUrl = document.getElementById('youtube-url');
@@ -100,6 +216,16 @@ document.addEventListener('DOMContentLoaded', function() {
                     this.src = 'https://via.placeholder.com/120x90?text=No+Thumbnail';
                 };
                 
+                // Offer the available qualities with their estimated sizes
+                const qualitySelect = document.getElementById('video-quality');
+                if (qualitySelect) {
+                    qualitySelect.innerHTML = '<option value="">Default quality</option>' +
+                        (data.formats || []).map(format => {
+                            const size = format.estimated_size ? ` (~${formatBytes(format.estimated_size)})` : '';
+                            return `<option value="${format.height}">${format.height}p${size}</option>`;
+                        }).join('');
+                }
+                
                 downloadButton.disabled = false;
             })
             .catch(error => {
@@ -117,35 +243,21 @@ document.addEventListener('DOMContentLoaded', function() {
     // Save to Device button handler
     const saveToDeviceBtn = document.getElementById('save-to-device');
     if (saveToDeviceBtn) {
-        saveToDeviceBtn.addEventListener('click', async function() {
+        saveToDeviceBtn.addEventListener('click', function() {
             if (!currentVideoData || !currentVideoData.filename) {
                 showError('Please download a video first');
                 return;
             }
 
-            saveToDeviceBtn.disabled = true;
-            saveToDeviceBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Preparing Download...';
-
-            try {
-                const response = await fetch(`/download_file/${encodeURIComponent(currentVideoData.filename)}`);
-                if (!response.ok) throw new Error('Download failed');
-                
-                const blob = await response.blob();
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = currentVideoData.title + '.mp4';
-                document.body.appendChild(a);
-                a.click();
-                window.URL.revokeObjectURL(url);
-                document.body.removeChild(a);
-                
-                saveToDeviceBtn.innerHTML = '<i class="fas fa-check me-2"></i>Downloaded';
-            } catch (error) {
-                showError('Error downloading file: ' + error.message);
-                saveToDeviceBtn.innerHTML = '<i class="fas fa-save me-2"></i>Save to Device';
-            }
-            saveToDeviceBtn.disabled = false;
+            // Let the browser download the file itself, so it can pause and resume with Range requests
+            const a = document.createElement('a');
+            a.href = `/download_file/${encodeURIComponent(currentVideoData.filename)}`;
+            a.download = currentVideoData.title + '.mp4';
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            
+            saveToDeviceBtn.innerHTML = '<i class="fas fa-check me-2"></i>Download started';
         });
     }
 
@@ -167,10 +279,13 @@ document.addEventListener('DOMContentLoaded', function() {
             downloadButton.disabled = true;
             downloadButton.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Downloading...';
 
+            const qualitySelect = document.getElementById('video-quality');
+            const maxHeight = qualitySelect ? parseInt(qualitySelect.value, 10) || null : null;
+            
             fetch('/download', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ url: youtubeUrl.value.trim() })
+                body: JSON.stringify({ url: youtubeUrl.value.trim(), max_height: maxHeight })
             })
             .then(response => {
                 // First check if the response is ok
@@ -184,6 +299,20 @@ document.addEventListener('DOMContentLoaded', function() {
                     throw new Error('Could not parse server response. Try again later.');
                 });
             })
+            .then(job => {
+                if (job.error) throw new Error(job.error);
+
+                // Already downloaded before, the file can be used right away
+                if (job.status === 'completed') {
+                    return Object.assign({}, job.result, { job_id: job.job_id });
+                }
+
+                // The download runs in the background, wait for it to finish
+                return waitForJob(job.job_id, state => {
+                    const percent = Math.round(state.percent || 0);
+                    downloadButton.innerHTML = `<i class="fas fa-spinner fa-spin me-2"></i>Downloading... ${percent}%`;
+                }).then(data => Object.assign({}, data, { job_id: job.job_id }));
+            })
             .then(data => {
                 if (data.error) throw new Error(data.error);
 
@@ -263,11 +392,18 @@ document.addEventListener('DOMContentLoaded', function() {
             progressContainer.classList.remove('d-none');
             startProcessButton.disabled = true;
 
-            // Reset progress bars
-            downloadProgress.style.width = '0%';
-            downloadProgress.textContent = '0%';
+            // The video is already downloaded at this point
+            downloadProgress.style.width = '100%';
+            downloadProgress.textContent = '100%';
+            downloadStatus.textContent = 'Download complete!';
             uploadProgress.style.width = '0%';
             uploadProgress.textContent = '0%';
+            uploadStatus.textContent = 'Preparing for upload...';
+
+            const uploadWatcher = currentVideoData.job_id && window.EventSource ?
+                watchProgress(currentVideoData.job_id, 'drive_upload', state => {
+                    showProgress(uploadProgress, uploadStatus, state, 'Uploading to Google Drive');
+                }) : null;
 
             // Upload to Drive
             fetch('/upload_to_drive', {
@@ -276,11 +412,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify({
                     filename: currentVideoData.filename,
                     folder_id: driveFolders.value,
-                    video_id: currentVideoData.video_id
+                    video_id: currentVideoData.video_id,
+                    job_id: currentVideoData.job_id
                 }),
             })
             .then(response => response.json())
             .then(data => {
+                if (uploadWatcher) uploadWatcher.close();
                 if (data.error) throw new Error(data.error);
 
                 uploadProgress.style.width = '100%';
@@ -293,6 +431,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             })
             .catch(error => {
+                if (uploadWatcher) uploadWatcher.close();
                 showError('Upload error: ' + error.message);
                 startProcessButton.disabled = false;
             });
@@ -362,8 +501,8 @@ document.addEventListener('DOMContentLoaded', function() {
             youtubeProgress.classList.remove('d-none');
             youtubeUploadStatus.textContent = 'Preparing YouTube upload with original metadata...';
             
-            // Simulate YouTube upload progress
-            simulateYoutubeUploadProgress();
+            // Follow the real upload progress
+            watchYoutubeUploadProgress();
             
             // Start YouTube upload with original metadata
             fetch('/api/upload_to_yt', {
@@ -374,13 +513,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify({
                     filename: currentVideoData.filename,
                     video_id: currentVideoData.video_id,
+                    job_id: currentVideoData.job_id,
                     privacy_status: 'private' // Default to private for safety
                 }),
             })
             .then(response => response.json())
             .then(data => {
-                // Clear interval
-                clearInterval(youtubeProgressInterval);
+                stopYoutubeUploadProgress();
                 
                 if (data.error) {
                     showError(data.error);
@@ -430,7 +569,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 }, 2000);
             })
             .catch(error => {
-                clearInterval(youtubeProgressInterval);
+                stopYoutubeUploadProgress();
                 showError('YouTube upload error: ' + error.message);
                 youtubeProgress.classList.add('d-none');
                 uploadToYTButton.disabled = false;
@@ -439,7 +578,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // YouTube upload button click handler
-    let youtubeProgressInterval;
+    let youtubeProgressWatcher;
     if (startYoutubeUploadButton) {
         startYoutubeUploadButton.addEventListener('click', function() {
             // Get form values
@@ -458,8 +597,8 @@ document.addEventListener('DOMContentLoaded', function() {
             youtubeProgress.classList.remove('d-none');
             youtubeUploadStatus.textContent = 'Preparing YouTube upload...';
 
-            // Simulate YouTube upload progress
-            simulateYoutubeUploadProgress();
+            // Follow the real upload progress
+            watchYoutubeUploadProgress();
 
             // Start YouTube upload
             fetch('/upload_to_youtube', {
@@ -470,6 +609,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify({
                     filename: currentVideoData.filename,
                     video_id: currentVideoData.video_id,
+                    job_id: currentVideoData.job_id,
                     title: title,
                     description: description,
                     tags: tags,
@@ -478,8 +618,7 @@ document.addEventListener('DOMContentLoaded', function() {
             })
             .then(response => response.json())
             .then(data => {
-                // Clear interval
-                clearInterval(youtubeProgressInterval);
+                stopYoutubeUploadProgress();
 
                 if (data.error) {
                     showError(data.error);
@@ -523,136 +662,34 @@ document.addEventListener('DOMContentLoaded', function() {
                 }, 2000);
             })
             .catch(error => {
-                clearInterval(youtubeProgressInterval);
+                stopYoutubeUploadProgress();
                 showError('YouTube upload error: ' + error.message);
                 youtubeProgress.classList.add('d-none');
             });
         });
     }
 
-    // Simulate YouTube upload progress
-    function simulateYoutubeUploadProgress() {
-        let progress = 0;
-
-        youtubeProgressInterval = setInterval(() => {
-            if (progress < 95) { // Only go to 95% for simulation
-                progress += Math.random() * 5;
-                progress = Math.min(progress, 95);
-
-                youtubeUploadProgress.style.width = `${progress}%`;
-                youtubeUploadProgress.textContent = `${Math.round(progress)}%`;
-
-                if (progress < 30) {
-                    youtubeUploadStatus.textContent = 'Preparing video for YouTube...';
-                } else if (progress < 60) {
-                    youtubeUploadStatus.textContent = 'Uploading to YouTube...';
-                } else if (progress < 90) {
-                    youtubeUploadStatus.textContent = 'Processing on YouTube servers...';
-                }
-            } else {
-                clearInterval(youtubeProgressInterval);
-            }
-        }, 1000);
-    }
-
-    //Simulate download and upload progress
-    let downloadProgressTimeout;
-    let uploadProgressTimeout;
-
-    function simulateDownloadProgress() {
-        let progress = 0;
-
-        downloadProgressTimeout = setInterval(() => {
-            if (progress < 100) {
-                progress += Math.random() * 10;
-                progress = Math.min(progress, 100);
-
-                downloadProgress.style.width = `${progress}%`;
-                downloadProgress.textContent = `${Math.round(progress)}%`;
-
-                if (progress < 30) {
-                    downloadStatus.textContent = 'Initializing download...';
-                } else if (progress < 60) {
-                    downloadStatus.textContent = 'Downloading video...';
-                } else if (progress < 90) {
-                    downloadStatus.textContent = 'Processing video...';
-                } else {
-                    downloadStatus.textContent = 'Download complete!';
-                    clearInterval(downloadProgressTimeout);
-
-                    // Show YouTube upload buttons
-                    const uploadToYouTubeButton = document.getElementById('upload-to-youtube-button');
-                    const uploadToYTButton = document.getElementById('upload-to-yt-button');
-                    if (uploadToYouTubeButton) {
-                        uploadToYouTubeButton.classList.remove('d-none');
-                    }
-                    if (uploadToYTButton) {
-                        uploadToYTButton.classList.remove('d-none');
-                    }
-                }
-            } else {
-                clearInterval(downloadProgressTimeout);
-            }
-        }, 1000);
-    }
-
-    function simulateUploadProgress() {
-        let progress = 0;
-
-        uploadProgressTimeout = setInterval(() => {
-            if (progress < 100) {
-                progress += Math.random() * 8;
-                progress = Math.min(progress, 100);
-
-                uploadProgress.style.width = `${progress}%`;
-                uploadProgress.textContent = `${Math.round(progress)}%`;
-
-                if (progress < 30) {
-                    uploadStatus.textContent = 'Preparing for upload...';
-                } else if (progress < 60) {
-                    uploadStatus.textContent = 'Uploading to Google Drive...';
-                } else if (progress < 90) {
-                    uploadStatus.textContent = 'Finalizing upload...';
-                } else {
-                    uploadStatus.textContent = 'Upload complete!';
-                    clearInterval(uploadProgressTimeout);
-
-                    // Show result after upload is complete
-                    setTimeout(() => {
-                        progressContainer.classList.add('d-none');
-                        resultContainer.classList.remove('d-none');
-                    }, 1000);
-                }
-            } else {
-                clearInterval(uploadProgressTimeout);
-            }
-        }, 1500);
-    }
+    // Show real YouTube upload progress streamed from the server
+    function watchYoutubeUploadProgress() {
+        stopYoutubeUploadProgress();
+        youtubeUploadProgress.style.width = '0%';
+        youtubeUploadProgress.textContent = '0%';
 
-    // Start simulated progress when process starts
-    if (startProcessButton) {
-        startProcessButton.addEventListener('click', function() {
-            // Clear any existing intervals
-            clearInterval(downloadProgressTimeout);
-            clearInterval(uploadProgressTimeout);
-
-            // Reset progress bars
-            downloadProgress.style.width = '0%';
-            downloadProgress.textContent = '0%';
-            uploadProgress.style.width = '0%';
-            uploadProgress.textContent = '0%';
-
-            // Start simulated progress
-            simulateDownloadProgress();
-
-            // Start upload progress after a delay
-            setTimeout(() => {
-                simulateUploadProgress();
-            }, 5000);
+        if (!currentVideoData.job_id || !window.EventSource) {
+            youtubeUploadStatus.textContent = 'Uploading to YouTube...';
+            return;
+        }
+        youtubeProgressWatcher = watchProgress(currentVideoData.job_id, 'youtube_upload', state => {
+            showProgress(youtubeUploadProgress, youtubeUploadStatus, state, 'Uploading to YouTube');
         });
     }
 
-
+    function stopYoutubeUploadProgress() {
+        if (youtubeProgressWatcher) {
+            youtubeProgressWatcher.close();
+            youtubeProgressWatcher = null;
+        }
+    }
 
     // Authenticate with Google Drive
     const authButton = document.getElementById('auth-button');
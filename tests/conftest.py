@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app reads its configuration at import time, point it at throwaway state
+_scratch = tempfile.mkdtemp(prefix='directtoyt-tests-')
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_scratch, 'app.db')}")
+os.environ.setdefault('WORK_DIR', os.path.join(_scratch, 'work'))
+os.environ.setdefault('JANITOR_INTERVAL', '0')
+os.environ.setdefault('TOKEN_REFRESH_INTERVAL', '0')
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,52 @@
+import pytest
+
+from batches import host_key
+
+@pytest.fixture
+def dispatched(app_module, monkeypatch):
+    """Capture what a batch would dispatch instead of downloading it"""
+    calls = []
+    monkeypatch.setattr(app_module.batch_scheduler, 'start',
+                        lambda batch_id, pending, handler, concurrency: calls.append((pending, concurrency)))
+    return calls
+
+@pytest.mark.parametrize('body, error', [
+    ({'urls': []}, 'No URLs given'),
+    ({'urls': 'https://youtu.be/abc'}, 'urls must be a list'),
+    ({'urls': ['https://youtu.be/abc'] * 201}, 'A batch may contain at most 200 URLs'),
+    ({'urls': ['https://youtu.be/abc'], 'concurrency': 'many'}, 'concurrency must be an integer'),
+    ({'urls': ['https://youtu.be/abc'], 'concurrency': [2]}, 'concurrency must be an integer'),
+])
+def test_invalid_batches_are_rejected(client, dispatched, body, error):
+    response = client.post('/download/batch', json=body)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+    assert dispatched == []
+
+def test_invalid_urls_fail_without_downloading(client, dispatched):
+    response = client.post('/download/batch', json={
+        'urls': ['https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'https://example.com/video', 42]
+    })
+
+    assert response.status_code == 202
+    batch = response.get_json()
+    assert [item['status'] for item in batch['items']] == ['queued', 'failed', 'failed']
+    assert batch['items'][1]['error'] == 'Invalid YouTube URL'
+    pending, _ = dispatched[0]
+    assert [url for _, url in pending] == ['https://www.youtube.com/watch?v=dQw4w9WgXcQ']
+
+@pytest.mark.parametrize('requested, expected', [(None, 3), (0, 3), (-5, 1), (4, 4), (50, 10)])
+def test_concurrency_is_clamped(client, dispatched, requested, expected):
+    response = client.post('/download/batch', json={
+        'urls': ['https://youtu.be/dQw4w9WgXcQ'], 'concurrency': requested
+    })
+
+    assert response.get_json()['concurrency'] == expected
+    assert dispatched[0][1] == expected
+
+def test_host_aliases_share_a_limit():
+    assert host_key('https://www.youtube.com/watch?v=x') == 'youtube.com'
+    assert host_key('https://youtu.be/x') == 'youtube.com'
+    assert host_key('https://m.youtube.com:443/watch?v=x') == 'youtube.com'
+    assert host_key('https://vimeo.com/1') == 'vimeo.com'
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+@pytest.fixture
+def media_file(app_module):
+    path = os.path.join(app_module.workdir.media_dir, 'range-test.mp4')
+    with open(path, 'wb') as f:
+        f.write(bytes(range(256)) * 4)
+    # Old enough that a touch would be visible in the validators
+    os.utime(path, (1_600_000_000, 1_600_000_000))
+    yield path
+    os.remove(path)
+
+def test_validators_stay_stable_across_downloads(client, media_file):
+    first = client.get(f'/download_file{media_file}')
+    second = client.get(f'/download_file{media_file}')
+
+    assert first.status_code == 200
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.headers['Last-Modified'] == second.headers['Last-Modified']
+    assert os.stat(media_file).st_mtime == 1_600_000_000
+
+def test_range_request_resumes_download(client, media_file):
+    response = client.get(f'/download_file{media_file}', headers={'Range': 'bytes=1000-'})
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 1000-1023/1024'
+    assert response.data == (bytes(range(256)) * 4)[1000:]
+
+def test_if_range_with_current_etag_returns_partial(client, media_file):
+    etag = client.get(f'/download_file{media_file}').headers['ETag']
+    response = client.get(f'/download_file{media_file}',
+                          headers={'Range': 'bytes=0-9', 'If-Range': etag})
+
+    assert response.status_code == 206
+    assert response.data == bytes(range(10))
+
+def test_if_range_with_stale_etag_returns_whole_file(client, media_file):
+    response = client.get(f'/download_file{media_file}',
+                          headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+
+    assert response.status_code == 200
+    assert len(response.data) == 1024
+
+def test_range_past_the_end_is_rejected(client, media_file):
+    response = client.get(f'/download_file{media_file}', headers={'Range': 'bytes=5000-'})
+
+    assert response.status_code == 416
+
+def test_files_outside_media_dir_are_not_served(client, tmp_path):
+    outside = tmp_path / 'secret.mp4'
+    outside.write_bytes(b'secret')
+
+    assert client.get(f'/download_file{outside}').status_code == 404
@@ -0,0 +1,95 @@
+import os
+import stat
+import subprocess
+import time
+
+import pytest
+
+from download_strategies import DownloadStrategy, StrategyError, StrategyRegistry, YtDlpCliStrategy
+
+class Engine:
+    def cli_arguments(self):
+        return []
+
+class Fake(DownloadStrategy):
+    def __init__(self, name, fails=False):
+        self.name = name
+        self.fails = fails
+        self.calls = 0
+
+    def download(self, url, output_path, format_selector, progress=None):
+        return {'filename': output_path}
+
+    def extract_info(self, url):
+        self.calls += 1
+        if self.fails:
+            raise RuntimeError(f'{self.name} broke')
+        return {'id': url}
+
+def fake_yt_dlp(directory, body):
+    path = directory / 'yt-dlp'
+    path.write_text('#!/bin/sh\n' + body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(directory)
+
+def test_cli_download_times_out(tmp_path, monkeypatch):
+    bin_dir = fake_yt_dlp(tmp_path, 'echo "[progress] 1/10/NA/1/9"\nsleep 8\n')
+    monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ['PATH'])
+    progress = []
+
+    started = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        YtDlpCliStrategy(Engine(), timeout=1).download(
+            'https://www.youtube.com/watch?v=aaaaaaaaaaa', str(tmp_path / 'out.mp4'), 'best',
+            progress=lambda **fields: progress.append(fields)
+        )
+
+    assert time.monotonic() - started < 4
+    assert progress[0]['downloaded_bytes'] == 1
+
+def test_cli_download_writes_file(tmp_path, monkeypatch):
+    # The output path is the second to last argument
+    bin_dir = fake_yt_dlp(tmp_path, 'for a in "$@"; do out=$prev; prev=$a; done\necho data > "$out"\n')
+    monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ['PATH'])
+    output = str(tmp_path / 'out.mp4')
+
+    result = YtDlpCliStrategy(Engine(), timeout=10).download(
+        'https://www.youtube.com/watch?v=aaaaaaaaaaa', output, 'best')
+
+    assert result == {'filename': output}
+
+def test_strategies_must_implement_both_operations():
+    class DownloadOnly(DownloadStrategy):
+        name = 'download-only'
+
+        def download(self, url, output_path, format_selector, progress=None):
+            return {'filename': output_path}
+
+    with pytest.raises(TypeError):
+        DownloadOnly()
+
+def test_registry_falls_back_and_demotes_failing_strategy():
+    broken, working = Fake('broken', fails=True), Fake('working')
+    registry = StrategyRegistry('extract_info', [broken, working])
+    registry.register(broken)
+    registry.register(working)
+
+    assert registry.run('a') == ({'id': 'a'}, 'working')
+    assert registry.run('b') == ({'id': 'b'}, 'working')
+    assert [strategy.name for strategy in registry.order()] == ['working', 'broken']
+    # Demoted after its first failure, so the second call went straight to working
+    assert broken.calls == 1
+
+def test_registry_keeps_order_when_every_strategy_fails():
+    first, second = Fake('first', fails=True), Fake('second', fails=True)
+    registry = StrategyRegistry('extract_info', [first, second])
+    registry.register(first)
+    registry.register(second)
+
+    for _ in range(5):
+        with pytest.raises(StrategyError):
+            registry.run('private')
+
+    # The input was to blame, not the strategies
+    assert [strategy.name for strategy in registry.order()] == ['first', 'second']
+    assert all(stats['state'] == 'closed' for stats in registry.stats())
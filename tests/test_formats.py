@@ -0,0 +1,99 @@
+import pytest
+
+from formats import FormatPlanner
+
+@pytest.fixture
+def planner():
+    return FormatPlanner()
+
+def test_parse_request_defaults(planner):
+    assert planner.parse_request(None) == {'max_height': 360, 'codec': None, 'max_bytes': None}
+
+def test_parse_request_reads_numbers_from_strings(planner):
+    request = planner.parse_request({'max_height': '720', 'codec': 'vp9', 'max_bytes': '1000'})
+
+    assert request == {'max_height': 720, 'codec': 'vp9', 'max_bytes': 1000}
+
+@pytest.mark.parametrize('data', [
+    {'max_height': 'high'},
+    {'max_height': [1]},
+    {'max_height': {'a': 1}},
+    {'max_height': -1},
+    {'max_bytes': [1]},
+    {'codec': 'mpeg2'},
+    {'codec': ['h264']},
+    ['max_height'],
+])
+def test_parse_request_rejects_bad_values(planner, data):
+    with pytest.raises(ValueError):
+        planner.parse_request(data)
+
+@pytest.mark.parametrize('path, body', [
+    ('/download', {'url': 'https://youtu.be/abc', 'max_height': [1]}),
+    ('/download/batch', {'urls': ['https://youtu.be/abc'], 'max_height': [1]}),
+    ('/download/batch', {'urls': [], 'max_bytes': {'a': 1}}),
+])
+def test_download_routes_answer_bad_formats_with_400(client, path, body):
+    response = client.post(path, json=body)
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+INFO = {
+    'duration': 100,
+    'formats': [
+        {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'tbr': 500},
+        {'format_id': '134', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1.4d401e', 'acodec': 'none', 'tbr': 300},
+        {'format_id': '243', 'ext': 'webm', 'height': 360, 'vcodec': 'vp9', 'acodec': 'none', 'tbr': 250},
+        {'format_id': '136', 'ext': 'mp4', 'height': 720, 'vcodec': 'avc1.4d401f', 'acodec': 'none',
+         'tbr': 1500, 'filesize': 20_000_000},
+        {'format_id': '247', 'ext': 'webm', 'height': 720, 'vcodec': 'vp9', 'acodec': 'none',
+         'tbr': 1200, 'filesize': 15_000_000},
+        {'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 128, 'tbr': 128},
+        {'format_id': '251', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 160, 'tbr': 160},
+        {'format_id': 'sb0', 'ext': 'mhtml', 'protocol': 'mhtml', 'height': 90, 'vcodec': 'none', 'acodec': 'none'},
+    ],
+}
+
+def test_plan_prefers_mp4_pairs_up_to_max_height(planner):
+    plan = planner.plan(INFO, max_height=720)
+
+    # mp4 video is paired with m4a even though opus has the higher bitrate
+    assert plan.format_id == '136+140'
+    assert plan.ext == 'mp4'
+    assert plan.selector == '136+140/bestvideo[height<=720]+bestaudio/best[height<=720]'
+
+def test_plan_honours_requested_codec(planner):
+    plan = planner.plan(INFO, max_height=720, codec='vp9')
+
+    assert plan.format_id == '247+251'
+    assert plan.vcodec == 'vp9'
+
+def test_plan_keeps_within_size_budget(planner):
+    # 136+140 is about 21.6 MB, 247+251 about 17 MB
+    plan = planner.plan(INFO, max_height=720, max_bytes=18_000_000)
+
+    assert plan.format_id == '247+251'
+    assert plan.estimated_size == 15_000_000 + 160 * 125 * 100
+
+def test_plan_single_file_only_uses_muxed_formats(planner):
+    plan = planner.plan(INFO, max_height=1080, single_file=True)
+
+    assert plan.format_id == '18'
+    assert plan.fallback.startswith('best[height<=1080][ext=mp4]')
+
+def test_plan_takes_lowest_height_when_nothing_fits(planner):
+    assert planner.plan(INFO, max_height=144).height == 360
+
+def test_plan_without_formats_falls_back_to_selector(planner):
+    plan = planner.plan(None, max_height=480)
+
+    assert plan.format_id is None
+    assert plan.selector == 'bestvideo[height<=480]+bestaudio/best[height<=480]'
+    assert plan.key == plan.selector
+
+def test_options_lists_one_plan_per_height(planner):
+    options = planner.options(INFO)
+
+    assert [option['height'] for option in options] == [720, 360]
+    assert options[0]['format_id'] == '136+140'
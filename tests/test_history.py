@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Video
+
+UPLOADER = 'history-tests'
+
+@pytest.fixture(scope='module')
+def videos(app_module):
+    """Seven videos, two of them sharing a download date to exercise the id tie-break"""
+    db = app_module.db
+    base = datetime(2024, 1, 1, 12)
+    with app_module.app.app_context():
+        rows = []
+        for i in range(7):
+            rows.append(Video(
+                youtube_id=f'hist{i:07d}',
+                title=f'History {i}',
+                url=f'https://youtu.be/hist{i:07d}',
+                uploader=UPLOADER,
+                download_date=base + timedelta(days=min(i, 5)),
+                uploaded_to_drive=i % 2 == 0,
+            ))
+        db.session.add_all(rows)
+        db.session.commit()
+        # Newest first, ties broken by the higher id
+        return [video.id for video in sorted(rows, key=lambda v: (v.download_date, v.id), reverse=True)]
+
+def pages(client, **params):
+    params = dict(params, uploader=UPLOADER)
+    seen = []
+    while True:
+        response = client.get('/history', query_string=params)
+        assert response.status_code == 200
+        data = response.get_json()
+        seen.append([video['id'] for video in data['videos']])
+        if not data['next_cursor']:
+            return seen
+        params['cursor'] = data['next_cursor']
+
+def test_cursor_pages_cover_every_video_once_in_order(client, videos):
+    result = pages(client, limit=3)
+
+    assert [len(page) for page in result] == [3, 3, 1]
+    assert sum(result, []) == videos
+
+def test_cursor_pages_respect_filters(client, videos, app_module):
+    result = pages(client, limit=2, uploaded_to_drive='true')
+
+    with app_module.app.app_context():
+        expected = [video_id for video_id in videos
+                    if app_module.db.session.get(Video, video_id).uploaded_to_drive]
+    assert sum(result, []) == expected
+
+def test_date_filters_include_whole_end_day(client, videos):
+    response = client.get('/history', query_string={
+        'uploader': UPLOADER, 'date_from': '2024-01-02', 'date_to': '2024-01-03'
+    })
+
+    assert len(response.get_json()['videos']) == 2
+
+def test_invalid_cursor_is_rejected(client, videos):
+    response = client.get('/history', query_string={'uploader': UPLOADER, 'cursor': 'not-a-cursor'})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
+
+def test_unchanged_history_is_not_modified(client, videos):
+    first = client.get('/history', query_string={'uploader': UPLOADER})
+    second = client.get('/history', query_string={'uploader': UPLOADER},
+                        headers={'If-None-Match': first.headers['ETag']})
+
+    assert second.status_code == 304
@@ -0,0 +1,31 @@
+import threading
+import time
+
+def test_job_events_stream_incrementally(app_module, client):
+    tracker = app_module.progress_tracker
+    tracker.update('sse-job', 'download', downloaded_bytes=1, total_bytes=3)
+
+    def advance():
+        time.sleep(1)
+        tracker.update('sse-job', 'download', downloaded_bytes=2, total_bytes=3)
+        time.sleep(1)
+        tracker.finish('sse-job', 'download')
+
+    threading.Thread(target=advance, daemon=True).start()
+    started = time.monotonic()
+    response = client.get('/jobs/sse-job/events', buffered=False)
+
+    assert response.mimetype == 'text/event-stream'
+    assert 'Content-Length' not in response.headers
+    assert 'ETag' not in response.headers
+
+    arrivals = []
+    for chunk in response.response:
+        if chunk.startswith(b'data:'):
+            arrivals.append(time.monotonic() - started)
+    response.close()
+
+    assert len(arrivals) == 3
+    # The first event is sent right away, not once the job has finished
+    assert arrivals[0] < 0.5
+    assert arrivals[-1] >= 1.5
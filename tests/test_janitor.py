@@ -0,0 +1,131 @@
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from janitor import MediaJanitor
+from media_store import MediaStore
+from models import db
+from workdir import WorkDir
+
+HOUR = 3600
+
+@pytest.fixture
+def setup(tmp_path):
+    """Build a janitor over its own work dir and database, with config overrides"""
+    def build(**config):
+        app = Flask(__name__)
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'janitor.db'}",
+            JANITOR_INTERVAL=0,
+            MEDIA_MAX_BYTES=250,
+            MEDIA_MAX_AGE=24 * HOUR,
+        )
+        app.config.update(config)
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+        workdir = WorkDir(str(tmp_path / 'work'))
+        store = MediaStore(workdir.media_dir)
+        return app, MediaJanitor(app, store, workdir), workdir, store
+    return build
+
+def add_file(workdir, name, age):
+    """Write a 100 byte media file last used age seconds ago"""
+    path = os.path.join(workdir.media_dir, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * 100)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+def run(app, janitor):
+    with app.app_context():
+        return janitor.run_once()
+
+def test_evicts_least_recently_used_over_budget(setup):
+    app, janitor, workdir, _ = setup()
+    oldest = add_file(workdir, 'a.mp4', 3 * HOUR)
+    middle = add_file(workdir, 'b.mp4', 2 * HOUR)
+    newest = add_file(workdir, 'c.mp4', HOUR)
+
+    summary = run(app, janitor)
+
+    assert summary['evicted_files'] == 1
+    assert summary['media_bytes'] == 200
+    assert not os.path.exists(oldest)
+    assert os.path.exists(middle) and os.path.exists(newest)
+
+def test_evicts_expired_files_under_budget(setup):
+    app, janitor, workdir, _ = setup(MEDIA_MAX_BYTES=10 ** 9)
+    expired = add_file(workdir, 'a.mp4', 25 * HOUR)
+    recent = add_file(workdir, 'b.mp4', HOUR)
+
+    run(app, janitor)
+
+    assert not os.path.exists(expired)
+    assert os.path.exists(recent)
+
+def test_leased_files_are_skipped(setup):
+    app, janitor, workdir, store = setup()
+    oldest = add_file(workdir, 'a.mp4', 3 * HOUR)
+    middle = add_file(workdir, 'b.mp4', 2 * HOUR)
+    add_file(workdir, 'c.mp4', HOUR)
+
+    with store.lease(oldest):
+        summary = run(app, janitor)
+
+    assert summary['skipped_in_use'] == 1
+    assert os.path.exists(oldest)
+    assert not os.path.exists(middle)
+
+def test_touch_makes_a_file_recently_used(setup):
+    app, janitor, workdir, store = setup()
+    oldest = add_file(workdir, 'a.mp4', 3 * HOUR)
+    middle = add_file(workdir, 'b.mp4', 2 * HOUR)
+    add_file(workdir, 'c.mp4', HOUR)
+    mtime = os.stat(oldest).st_mtime
+
+    with app.app_context():
+        store.touch(oldest)
+    run(app, janitor)
+
+    assert os.path.exists(oldest)
+    assert os.stat(oldest).st_mtime == mtime
+    assert not os.path.exists(middle)
+
+def test_offloaded_files_are_kept_for_the_lease(setup):
+    app, janitor, workdir, _ = setup(DOWNLOAD_OFFLOAD='x-sendfile', DOWNLOAD_OFFLOAD_LEASE=6 * HOUR)
+    # All three were handed to the proxy within the lease
+    for name in ('a.mp4', 'b.mp4', 'c.mp4'):
+        add_file(workdir, name, HOUR)
+    beyond = add_file(workdir, 'd.mp4', 7 * HOUR)
+
+    summary = run(app, janitor)
+
+    assert not os.path.exists(beyond)
+    assert summary['evicted_files'] == 1
+    assert summary['skipped_in_use'] == 3
+
+def test_offload_lease_only_applies_when_offloading(setup):
+    app, janitor, workdir, _ = setup(DOWNLOAD_OFFLOAD_LEASE=6 * HOUR)
+    add_file(workdir, 'a.mp4', 3 * HOUR)
+    add_file(workdir, 'b.mp4', 2 * HOUR)
+    add_file(workdir, 'c.mp4', HOUR)
+
+    assert janitor.offload_lease == 0
+    assert run(app, janitor)['evicted_files'] == 1
+
+def test_stale_scratch_dirs_are_removed(setup):
+    app, janitor, workdir, _ = setup()
+    stale = os.path.join(workdir.jobs_dir, 'stale-job')
+    fresh = os.path.join(workdir.jobs_dir, 'fresh-job')
+    os.makedirs(stale)
+    os.makedirs(fresh)
+    old = time.time() - 7 * HOUR
+    os.utime(stale, (old, old))
+
+    assert run(app, janitor)['removed_scratch_dirs'] == 1
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
@@ -0,0 +1,57 @@
+import os
+import socket
+import subprocess
+import sys
+
+from jobs import INTERRUPTED_ERROR
+from models import DownloadBatch, DownloadJob
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def test_recover_fails_jobs_of_exited_processes(app_module):
+    host = socket.gethostname()
+    owners = {
+        'exited': f'{host}:{exited_pid()}',
+        'alive': f'{host}:{os.getppid()}',
+        'elsewhere': 'other-host:1',
+        'legacy': None,
+    }
+    queue = app_module.job_queue
+    db = app_module.db
+
+    with app_module.app.app_context():
+        ids = {name: queue.create(f'https://youtu.be/{name}', status='running', owner=owner).id
+               for name, owner in owners.items()}
+        done = queue.create('https://youtu.be/done', status='completed', owner=owners['exited']).id
+
+        # Other tests may have left jobs of this process running
+        assert queue.recover() >= 2
+
+        db.session.expire_all()
+        jobs = {name: db.session.get(DownloadJob, job_id) for name, job_id in ids.items()}
+        assert jobs['exited'].status == 'failed'
+        assert jobs['exited'].error == INTERRUPTED_ERROR
+        assert jobs['exited'].finished_at is not None
+        assert jobs['legacy'].status == 'failed'
+        assert jobs['alive'].status == 'running'
+        assert jobs['elsewhere'].status == 'running'
+        assert db.session.get(DownloadJob, done).status == 'completed'
+
+def test_recover_closes_interrupted_batch_listings(app_module):
+    db = app_module.db
+
+    with app_module.app.app_context():
+        batch = DownloadBatch(id='interrupted-batch', concurrency=1, source_url='https://youtube.com/playlist?list=x',
+                              expanding=True, skipped=0, owner=f'{socket.gethostname()}:{exited_pid()}')
+        db.session.add(batch)
+        db.session.commit()
+
+        assert app_module.batch_scheduler.recover() == 1
+
+        db.session.expire_all()
+        batch = db.session.get(DownloadBatch, 'interrupted-batch')
+        assert not batch.expanding
+        assert batch.to_dict()['status'] == 'failed'
@@ -0,0 +1,138 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect
+
+import migrations
+from models import db
+from search_index import SearchIndex
+
+# Tables as they were before any migration existed
+LEGACY_SCHEMA = """
+CREATE TABLE video (
+    id INTEGER PRIMARY KEY,
+    youtube_id VARCHAR(50) NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    url VARCHAR(255) NOT NULL,
+    duration INTEGER,
+    thumbnail_url VARCHAR(255),
+    uploader VARCHAR(255),
+    download_date DATETIME,
+    file_size BIGINT,
+    download_success BOOLEAN,
+    uploaded_to_drive BOOLEAN,
+    drive_file_id VARCHAR(100),
+    drive_folder_id VARCHAR(100),
+    uploaded_to_youtube BOOLEAN,
+    youtube_upload_id VARCHAR(100)
+);
+CREATE TABLE api_credential (
+    id INTEGER PRIMARY KEY,
+    service_name VARCHAR(50) NOT NULL,
+    client_id VARCHAR(255) NOT NULL,
+    client_secret VARCHAR(255) NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME
+);
+CREATE TABLE download_batch (
+    id VARCHAR(32) PRIMARY KEY,
+    concurrency INTEGER NOT NULL,
+    source_url VARCHAR(255),
+    expanding BOOLEAN,
+    skipped INTEGER,
+    error TEXT,
+    created_at DATETIME
+);
+CREATE TABLE download_job (
+    id VARCHAR(32) PRIMARY KEY,
+    url VARCHAR(255) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    video_id INTEGER REFERENCES video (id),
+    batch_id VARCHAR(32) REFERENCES download_batch (id),
+    batch_position INTEGER,
+    result TEXT,
+    error TEXT,
+    created_at DATETIME,
+    started_at DATETIME,
+    finished_at DATETIME
+);
+INSERT INTO video (id, youtube_id, title, url, uploader, download_date)
+    VALUES (1, 'aaaaaaaaaaa', 'Legacy cat video', 'https://youtu.be/aaaaaaaaaaa', 'Someone', '2024-01-01 00:00:00');
+INSERT INTO api_credential (id, service_name, client_id, client_secret, updated_at)
+    VALUES (1, 'google', 'old', 'old', '2024-01-01 00:00:00'),
+           (2, 'google', 'new', 'new', '2024-02-01 00:00:00');
+"""
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+def upgrade(app):
+    with app.app_context():
+        db.create_all()
+        applied = migrations.upgrade()
+        db.engine.dispose()
+    return applied
+
+def describe(app):
+    """Columns and indexes of every table, to compare two schemas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        schema = {
+            table: (
+                sorted(column['name'] for column in inspector.get_columns(table)),
+                sorted((index['name'], bool(index['unique'])) for index in inspector.get_indexes(table)),
+            )
+            for table in inspector.get_table_names()
+        }
+        db.engine.dispose()
+    return schema
+
+@pytest.fixture
+def legacy_app(tmp_path):
+    path = tmp_path / 'legacy.db'
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.close()
+    return make_app(path)
+
+def test_fresh_database_gets_every_migration(tmp_path):
+    app = make_app(tmp_path / 'fresh.db')
+
+    assert upgrade(app) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert upgrade(app) == []
+
+def test_legacy_database_ends_up_like_a_fresh_one(tmp_path, legacy_app):
+    fresh_app = make_app(tmp_path / 'fresh.db')
+    upgrade(fresh_app)
+
+    upgrade(legacy_app)
+
+    assert describe(legacy_app) == describe(fresh_app)
+
+def test_legacy_duplicates_are_removed_before_unique_index(legacy_app):
+    upgrade(legacy_app)
+
+    with legacy_app.app_context():
+        rows = db.session.execute(db.text('SELECT client_id FROM api_credential')).fetchall()
+        db.session.remove()
+        db.engine.dispose()
+    assert rows == [('new',)]
+
+def test_legacy_videos_are_indexed_for_search(legacy_app):
+    upgrade(legacy_app)
+
+    search = SearchIndex(legacy_app)
+    with legacy_app.app_context():
+        results, _ = search.search('cat')
+        found = [(video.youtube_id, rank is not None) for video, rank in results]
+        db.session.remove()
+        db.engine.dispose()
+    # Ranked, so the full-text index was built rather than the LIKE fallback
+    assert found == [('aaaaaaaaaaa', True)]
+
+def test_retired_migration_is_never_registered():
+    assert 3 not in [version for version, _, _ in migrations.MIGRATIONS]
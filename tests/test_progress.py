@@ -0,0 +1,51 @@
+import json
+
+from progress import ProgressTracker
+
+def test_stream_ends_with_state_from_check():
+    tracker = ProgressTracker()
+    tracker.update('job', 'download', downloaded_bytes=1, total_bytes=3)
+    checks = []
+
+    def check():
+        checks.append(None)
+        if len(checks) < 2:
+            return None
+        return {'job_id': 'job', 'phase': 'download', 'status': 'error', 'error': 'gone'}
+
+    events = list(tracker.stream('job', phase='download', keepalive=0.01, check=check))
+
+    assert events[0].startswith('data:')
+    assert events[1] == ': keepalive\n\n'
+    assert json.loads(events[2][len('data: '):])['error'] == 'gone'
+    assert len(events) == 3
+
+def test_job_events_notice_jobs_failed_elsewhere(app_module, client, monkeypatch):
+    tracker = app_module.progress_tracker
+    stream = tracker.stream
+    monkeypatch.setattr(tracker, 'stream', lambda job_id, **kwargs: stream(job_id, keepalive=0.05, **kwargs))
+
+    with app_module.app.app_context():
+        job = app_module.job_queue.create('https://youtu.be/stalled', status='running')
+        job_id = job.id
+    tracker.update(job_id, 'download', downloaded_bytes=1, total_bytes=3)
+
+    response = client.get(f'/jobs/{job_id}/events', buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'data:')
+    assert next(chunks) == b': keepalive\n\n'
+
+    # Another process marks the job failed, this one never hears about it
+    with app_module.app.app_context():
+        job = app_module.db.session.get(app_module.DownloadJob, job_id)
+        job.status = 'failed'
+        job.error = 'Worker died'
+        app_module.db.session.commit()
+
+    events = [chunk for chunk in chunks if chunk.startswith(b'data:')]
+    response.close()
+
+    assert len(events) == 1
+    state = json.loads(events[0][len(b'data: '):])
+    assert state['status'] == 'error'
+    assert state['error'] == 'Worker died'
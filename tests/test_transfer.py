@@ -0,0 +1,14 @@
+import pytest
+
+def test_transfer_failure_before_upload_is_reported(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.metadata_cache, 'get_info',
+                        lambda url: {'id': 'abc', 'title': 'Test', 'formats': []})
+
+    with app_module.app.app_context():
+        job = app_module.job_queue.create('https://youtu.be/abc', status='running')
+        with pytest.raises(RuntimeError, match='Not authenticated'):
+            app_module.run_transfer_job(job, 'drive', user_id=-1, options={})
+
+    state = app_module.progress_tracker.get(job.id)
+    assert state['status'] == 'error'
+    assert state['error'] == 'Not authenticated with Google'
@@ -0,0 +1,65 @@
+from uploads import CHUNK_ALIGNMENT, ChunkSizer
+
+MIB = 1024 * 1024
+
+def sizer(initial=8 * MIB, minimum=MIB, maximum=64 * MIB, target_seconds=4):
+    return ChunkSizer(initial, minimum, maximum, target_seconds)
+
+def test_sizes_are_aligned_and_clamped():
+    chunks = ChunkSizer(3 * MIB + 1, MIB + 1, 10 * MIB + 1, 4)
+
+    assert chunks.minimum == MIB
+    assert chunks.maximum == 10 * MIB
+    assert chunks.size == 3 * MIB
+    assert ChunkSizer(1, 0, 0, 4).size == CHUNK_ALIGNMENT
+
+def test_fast_link_grows_chunks_by_at_most_double():
+    chunks = sizer()
+
+    # 8 MiB in a second would justify 32 MiB chunks
+    chunks.record(8 * MIB, 1)
+    assert chunks.size == 16 * MIB
+    chunks.record(16 * MIB, 1)
+    chunks.record(32 * MIB, 1)
+    chunks.record(64 * MIB, 1)
+    assert chunks.size == 64 * MIB
+
+def test_slow_link_shrinks_chunks_to_target_duration():
+    chunks = sizer()
+
+    # 256 KiB/s takes about 4 seconds for 1 MiB
+    chunks.record(8 * MIB, 32)
+    assert chunks.size == MIB
+    assert chunks.throughput == 8 * MIB / 32
+
+def test_errors_halve_chunks_down_to_minimum():
+    chunks = sizer(initial=4 * MIB)
+
+    chunks.record_error()
+    assert chunks.size == 2 * MIB
+    chunks.record_error()
+    chunks.record_error()
+    assert chunks.size == MIB
+    assert chunks.retries == 3
+
+def test_one_slow_chunk_does_not_collapse_the_size():
+    chunks = sizer()
+    chunks.record(8 * MIB, 2)
+    chunks.record(16 * MIB, 4)
+
+    chunks.record(16 * MIB, 40)
+
+    assert chunks.size >= 8 * MIB
+
+def test_telemetry_reports_range_and_measurements():
+    chunks = sizer()
+    chunks.record(8 * MIB, 32)
+    chunks.record(MIB, 0.25)
+
+    telemetry = chunks.telemetry()
+
+    assert telemetry['chunks'] == 2
+    assert telemetry['chunk_size_min'] == MIB
+    assert telemetry['chunk_size_max'] == 8 * MIB
+    assert telemetry['chunk_latency'] == 0.25
+    assert telemetry['retries'] == 0
@@ -0,0 +1,177 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from sqlalchemy.exc import IntegrityError
+
+from models import db, OAuthToken
+
+logger = logging.getLogger(__name__)
+
+class TokenStore:
+    """
+    Server-side Google OAuth tokens per user
+
+    A background thread refreshes access tokens shortly before they expire,
+    so handlers get ready-to-use credentials without a round trip to the
+    token endpoint. A token that is already expired when it's requested,
+    e.g. because the scheduler is disabled, is refreshed on the spot.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.client_secret = None
+        self.http_session = None
+        self.refresh_margin = 300
+        self.interval = 60
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, http_session=None):
+        """
+        Configure the store and start its refresh thread
+
+        Args:
+            app: Flask application
+            http_session (requests.Session): Pooled session for token refreshes
+        """
+        self.app = app
+        self.client_secret = app.config.get('GOOGLE_CLIENT_SECRET')
+        self.http_session = http_session
+        self.refresh_margin = app.config.get('TOKEN_REFRESH_MARGIN', self.refresh_margin)
+        self.interval = app.config.get('TOKEN_REFRESH_INTERVAL', self.interval)
+        if self.interval > 0:
+            self.start()
+
+    def start(self):
+        """Start the background refresh loop once per process"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='token-refresh', daemon=True)
+        self._thread.start()
+        logger.info(f"Token refresh started: every {self.interval}s, {self.refresh_margin}s before expiry")
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.refresh_due()
+            except Exception as e:
+                logger.error(f"Token refresh run failed: {e}")
+
+    def save(self, user_id, credentials):
+        """
+        Store a user's credentials, replacing any earlier ones
+
+        Args:
+            user_id (int): Owner of the credentials
+            credentials (Credentials): Credentials from a login or refresh
+        """
+        row = OAuthToken.query.filter_by(user_id=user_id).first()
+        if row is None:
+            row = OAuthToken(user_id=user_id)
+            db.session.add(row)
+
+        row.token = credentials.token
+        # Google only sends a refresh token on the first consent, keep the old one
+        if credentials.refresh_token:
+            row.refresh_token = credentials.refresh_token
+        row.token_uri = credentials.token_uri
+        row.client_id = credentials.client_id
+        row.scopes = json.dumps(list(credentials.scopes or []))
+        row.expiry = credentials.expiry
+        row.last_error = None
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Saved concurrently for the same user, the other write wins
+            db.session.rollback()
+        return row
+
+    def get(self, user_id):
+        """
+        Return ready-to-use credentials for a user
+
+        Returns:
+            Credentials: The user's credentials, or None if there are none
+        """
+        row = OAuthToken.query.filter_by(user_id=user_id).first()
+        if row is None:
+            return None
+
+        credentials = self._credentials(row)
+        if credentials.expired and credentials.refresh_token:
+            logger.info(f"Token of user {user_id} expired before it was refreshed, refreshing now")
+            self._refresh(row)
+            credentials = self._credentials(row)
+        return credentials
+
+    def has(self, user_id):
+        """Check whether credentials are stored for a user"""
+        return db.session.query(OAuthToken.query.filter_by(user_id=user_id).exists()).scalar()
+
+    def delete(self, user_id):
+        """Forget a user's credentials"""
+        OAuthToken.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    def refresh_due(self):
+        """
+        Refresh every token that expires within the refresh margin
+
+        Returns:
+            int: Number of tokens refreshed
+        """
+        cutoff = datetime.utcnow() + timedelta(seconds=self.refresh_margin)
+        rows = OAuthToken.query.filter(
+            OAuthToken.refresh_token.isnot(None),
+            OAuthToken.last_error.is_(None),
+            db.or_(OAuthToken.expiry.is_(None), OAuthToken.expiry < cutoff)
+        ).all()
+
+        refreshed = 0
+        for row in rows:
+            if self._refresh(row):
+                refreshed += 1
+        if rows:
+            logger.info(f"Refreshed {refreshed} of {len(rows)} expiring tokens")
+        return refreshed
+
+    def _refresh(self, row):
+        """Refresh one stored token, returning True on success"""
+        credentials = self._credentials(row)
+        try:
+            credentials.refresh(Request(session=self.http_session))
+        except RefreshError as e:
+            # Revoked or otherwise invalid, the user has to log in again
+            logger.warning(f"Token of user {row.user_id} can't be refreshed: {e}")
+            row.last_error = str(e)
+            db.session.commit()
+            return False
+        except Exception as e:
+            logger.error(f"Error refreshing token of user {row.user_id}: {e}")
+            return False
+        self.save(row.user_id, credentials)
+        return True
+
+    def _credentials(self, row):
+        """Build a Credentials object from a stored row"""
+        return Credentials(
+            token=row.token,
+            refresh_token=row.refresh_token,
+            token_uri=row.token_uri,
+            client_id=row.client_id,
+            client_secret=self.client_secret,
+            scopes=json.loads(row.scopes) if row.scopes else None,
+            expiry=row.expiry
+        )
+
+# Shared by the auth blueprint and the app
+token_store = TokenStore()
@@ -0,0 +1,371 @@
+import logging
+import os
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaUpload
+from sqlalchemy.exc import IntegrityError
+
+from models import db, UploadSession
+from progress import tracker
+
+logger = logging.getLogger(__name__)
+
+# Resumable upload chunks must be a multiple of this
+CHUNK_ALIGNMENT = 256 * 1024
+
+# HTTP statuses worth retrying a chunk for
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class PipeMediaUpload(MediaUpload):
+    """
+    Resumable media body read from a non-seekable stream, e.g. a pipe
+
+    Only the bytes the server hasn't confirmed yet are kept, so memory use is
+    bounded by about two chunks no matter how long the stream is. The total
+    size is unknown until the stream ends; it is detected one chunk ahead so
+    the final chunk can be sent with the real size.
+
+    The stream can't be read again, so unlike file uploads these can't be
+    serialized with to_json() or resumed after the process exits.
+    """
+
+    def __init__(self, stream, mimetype='video/mp4', chunksize=8 * 1024 * 1024, on_eof=None):
+        """
+        Args:
+            stream: Binary file object to read from
+            mimetype (str): Mime type of the upload
+            chunksize (int): Bytes per request, a multiple of 256 KiB
+            on_eof (callable): Called once the stream ends; may raise to abort
+                the upload before its final chunk, e.g. if the producer failed
+        """
+        self._stream = stream
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._on_eof = on_eof
+        self._buffer = bytearray()
+        self._buffer_start = 0
+        self._next_offset = 0
+        self._eof = False
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        # Look one chunk ahead so the size is known before the last chunk is sent
+        if not self._eof:
+            self._fill(self._next_offset + self._chunksize + 1)
+        if self._eof:
+            return self._buffer_start + len(self._buffer)
+        return None
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        if begin < self._buffer_start:
+            raise ValueError(f'Bytes from offset {begin} were already discarded')
+
+        # Everything before begin has been confirmed by the server
+        del self._buffer[:begin - self._buffer_start]
+        self._buffer_start = begin
+
+        self._fill(begin + length + 1)
+        data = bytes(self._buffer[:length])
+        self._next_offset = begin + len(data)
+        return data
+
+    def _fill(self, until):
+        """Read from the stream until offset until is buffered or it ends"""
+        while not self._eof and self._buffer_start + len(self._buffer) < until:
+            wanted = until - self._buffer_start - len(self._buffer)
+            data = self._stream.read(min(wanted, 1024 * 1024))
+            if not data:
+                self._eof = True
+                if self._on_eof is not None:
+                    self._on_eof()
+                break
+            self._buffer.extend(data)
+
+def open_upload_session(video_id, destination, filename):
+    """
+    Find the checkpoint of an interrupted upload of a file, or start a new one
+
+    Args:
+        video_id (int): Video being uploaded
+        destination (str): 'drive' or 'youtube'
+        filename (str): Local file being uploaded
+
+    Returns:
+        UploadSession: Checkpoint to pass to execute_resumable()
+    """
+    total_size = os.path.getsize(filename)
+    upload_session = UploadSession.query.filter_by(video_id=video_id, destination=destination).first()
+    if upload_session is None:
+        upload_session = UploadSession(video_id=video_id, destination=destination)
+        db.session.add(upload_session)
+    elif (upload_session.status == 'active' and upload_session.filename == filename
+          and upload_session.total_size == total_size):
+        return upload_session
+
+    # A finished upload or a different file starts over
+    upload_session.filename = filename
+    upload_session.total_size = total_size
+    upload_session.session_uri = None
+    upload_session.confirmed_offset = 0
+    upload_session.status = 'active'
+    upload_session.remote_id = None
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request created the checkpoint first
+        db.session.rollback()
+        upload_session = UploadSession.query.filter_by(video_id=video_id, destination=destination).first()
+    return upload_session
+
+def query_upload_offset(request_obj, session_uri):
+    """
+    Ask the server how many bytes of an upload session it has received
+
+    Returns:
+        tuple: (API response if the upload already completed, byte offset to
+            continue from, or None if the session no longer exists)
+    """
+    size = request_obj.resumable.size()
+    resp, content = request_obj.http.request(
+        session_uri,
+        'PUT',
+        headers={'Content-Range': f"bytes */{size if size is not None else '*'}", 'content-length': '0'}
+    )
+    if resp.status in (200, 201):
+        return request_obj.postproc(resp, content), size
+    if resp.status == 308:
+        # Without a range header the server has received nothing yet
+        offset = int(resp['range'].split('-')[1]) + 1 if 'range' in resp else 0
+        return None, offset
+    return None, None
+
+def is_transient(error):
+    """Check if a failed chunk is worth retrying"""
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRY_STATUSES
+    return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+class ChunkSizer:
+    """
+    Picks the size of the next upload chunk from measured throughput
+
+    Chunks are sized to take about target_seconds each: on a fast link that
+    means few round trips, on a slow or flaky one little work lost per retry.
+    Growth is limited to doubling per chunk, and a failed chunk halves it.
+    """
+
+    def __init__(self, initial, minimum, maximum, target_seconds):
+        self.minimum = max(CHUNK_ALIGNMENT, minimum // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+        self.maximum = max(self.minimum, maximum // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+        self.target_seconds = target_seconds
+        self.size = self._clamp(initial)
+        self.throughput = None
+        self.latency = None
+        self.chunks = 0
+        self.retries = 0
+        self.smallest = self.size
+        self.largest = self.size
+
+    def record(self, sent_bytes, seconds):
+        """Account for a chunk that was sent successfully"""
+        self.chunks += 1
+        self.latency = seconds
+        if sent_bytes <= 0 or seconds <= 0:
+            return
+        # Exponentially weighted, so one slow chunk doesn't collapse the size
+        rate = sent_bytes / seconds
+        if self.throughput is None:
+            self.throughput = rate
+        else:
+            self.throughput = 0.3 * rate + 0.7 * self.throughput
+        self._resize(min(self.throughput * self.target_seconds, self.size * 2))
+
+    def record_error(self):
+        """Account for a chunk that failed and will be retried"""
+        self.retries += 1
+        self._resize(self.size // 2)
+
+    def telemetry(self):
+        """Return the measurements for progress events and checkpoints"""
+        return {
+            'chunk_size': self.size,
+            'chunk_size_min': self.smallest,
+            'chunk_size_max': self.largest,
+            'chunks': self.chunks,
+            'retries': self.retries,
+            'throughput': round(self.throughput, 1) if self.throughput else None,
+            'chunk_latency': round(self.latency, 3) if self.latency is not None else None
+        }
+
+    def _resize(self, size):
+        self.size = self._clamp(size)
+        self.smallest = min(self.smallest, self.size)
+        self.largest = max(self.largest, self.size)
+
+    def _clamp(self, size):
+        size = int(size) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+        return max(self.minimum, min(size, self.maximum))
+
+class UploadEngine:
+    """
+    Runs resumable Drive and YouTube uploads chunk by chunk
+
+    Chunk sizes adapt to the measured throughput, transient failures are
+    retried from the offset the server confirms, and progress plus chunk
+    telemetry is reported to the progress tracker.
+    """
+
+    def __init__(self, app=None):
+        self.initial_chunk_size = 8 * 1024 * 1024
+        self.min_chunk_size = 1024 * 1024
+        self.max_chunk_size = 128 * 1024 * 1024
+        self.target_seconds = 8
+        self.max_retries = 5
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read chunk limits from the application config"""
+        self.initial_chunk_size = app.config.get('UPLOAD_CHUNK_INITIAL', self.initial_chunk_size)
+        self.min_chunk_size = app.config.get('UPLOAD_CHUNK_MIN', self.min_chunk_size)
+        self.max_chunk_size = app.config.get('UPLOAD_CHUNK_MAX', self.max_chunk_size)
+        self.target_seconds = app.config.get('UPLOAD_CHUNK_TARGET_SECONDS', self.target_seconds)
+        self.max_retries = app.config.get('UPLOAD_MAX_RETRIES', self.max_retries)
+
+    def execute(self, request_obj, job_id=None, phase='upload', checkpoint=None):
+        """
+        Run a resumable upload to completion
+
+        Args:
+            request_obj: googleapiclient HttpRequest with a resumable media body
+            job_id (str): Job to report progress against, if any
+            phase (str): Progress phase name, e.g. 'drive_upload'
+            checkpoint (UploadSession): Saved after every chunk, and used to
+                continue an interrupted upload instead of starting from byte 0
+
+        Returns:
+            dict: The API response of the completed upload
+        """
+        media = request_obj.resumable
+        total_size = media.size()
+        sizer = ChunkSizer(self.initial_chunk_size, self.min_chunk_size,
+                           self.max_chunk_size, self.target_seconds)
+        response = None
+        last_progress = 0
+        attempts = 0
+
+        if checkpoint is not None and checkpoint.session_uri:
+            response = self._resume(request_obj, checkpoint)
+
+        if job_id:
+            tracker.update(job_id, phase, downloaded_bytes=request_obj.resumable_progress,
+                           total_bytes=total_size, **sizer.telemetry())
+
+        try:
+            while response is None:
+                # Both MediaFileUpload and PipeMediaUpload read the size from here
+                media._chunksize = sizer.size
+                offset = request_obj.resumable_progress
+                started = time.monotonic()
+                try:
+                    status, response = request_obj.next_chunk()
+                except Exception as e:
+                    if not is_transient(e) or attempts >= self.max_retries:
+                        raise
+                    attempts += 1
+                    sizer.record_error()
+                    logger.warning(f"{phase} chunk failed ({e}), retry {attempts} of {self.max_retries} "
+                                   f"with {sizer.size} byte chunks")
+                    time.sleep(min(2 ** attempts, 30))
+                    if request_obj.resumable_uri:
+                        response = self._sync(request_obj)
+                    continue
+
+                attempts = 0
+                confirmed = status.resumable_progress if status else media.size()
+                sizer.record(confirmed - offset, time.monotonic() - started)
+                if checkpoint is not None:
+                    save_checkpoint(checkpoint, request_obj, response, sizer)
+                if status:
+                    if job_id:
+                        tracker.update(job_id, phase,
+                                       downloaded_bytes=status.resumable_progress,
+                                       total_bytes=status.total_size,
+                                       **sizer.telemetry())
+                    progress = int(status.progress() * 100)
+                    # Only log if progress has changed significantly
+                    if progress - last_progress >= 5:
+                        logger.info(f"{phase} progress: {progress}%, chunk size {sizer.size}")
+                        last_progress = progress
+        except Exception as e:
+            if job_id:
+                tracker.fail(job_id, phase, str(e))
+            raise
+
+        if checkpoint is not None and checkpoint.status != 'completed':
+            save_checkpoint(checkpoint, request_obj, response, sizer)
+
+        # Stream uploads only know their size once they are complete
+        total_size = media.size()
+        logger.info(f"{phase} finished: {sizer.telemetry()}")
+        if job_id:
+            tracker.finish(job_id, phase, downloaded_bytes=total_size, total_bytes=total_size,
+                           **sizer.telemetry())
+        return response
+
+    def _resume(self, request_obj, checkpoint):
+        """Point a request at a saved session, returning the response if it already completed"""
+        response, offset = query_upload_offset(request_obj, checkpoint.session_uri)
+        if response is not None:
+            logger.info(f"Upload of video {checkpoint.video_id} to {checkpoint.destination} had already completed")
+            return response
+
+        if offset is None:
+            # Sessions expire after about a week, a new one is created on the first chunk
+            logger.warning(f"Upload session for video {checkpoint.video_id} is gone, starting over")
+            checkpoint.session_uri = None
+            checkpoint.confirmed_offset = 0
+            db.session.commit()
+            return None
+
+        request_obj.resumable_uri = checkpoint.session_uri
+        request_obj.resumable_progress = offset
+        logger.info(f"Resuming upload of video {checkpoint.video_id} to {checkpoint.destination} "
+                    f"at byte {offset}")
+        return None
+
+    def _sync(self, request_obj):
+        """After a failed chunk, continue from the offset the server confirms"""
+        response, offset = query_upload_offset(request_obj, request_obj.resumable_uri)
+        if response is None:
+            if offset is None:
+                request_obj.resumable_uri = None
+                offset = 0
+            request_obj.resumable_progress = offset
+        return response
+
+def save_checkpoint(checkpoint, request_obj, response=None, sizer=None):
+    """Persist the session URI, confirmed offset and chunk telemetry of an upload"""
+    checkpoint.session_uri = request_obj.resumable_uri
+    checkpoint.confirmed_offset = request_obj.resumable_progress
+    if sizer is not None:
+        checkpoint.chunk_size = sizer.size
+        checkpoint.throughput = sizer.throughput
+    if response is not None:
+        checkpoint.status = 'completed'
+        checkpoint.confirmed_offset = request_obj.resumable.size()
+        checkpoint.remote_id = response.get('id')
+    db.session.commit()
@@ -1,5 +1,5 @@
 import os
-import time
+import uuid
 import logging
 from urllib.parse import urlparse
 
@@ -62,6 +62,9 @@ def generate_temp_filename(prefix="yt_video", extension="mp4"):
     """
     Generate a unique temporary filename
     
+    A random suffix is used so that files created in the same second
+    never collide.
+    
     Args:
         prefix (str): Filename prefix
         extension (str): File extension
@@ -69,5 +72,4 @@ def generate_temp_filename(prefix="yt_video", extension="mp4"):
     Returns:
         str: Generated filename
     """
-    timestamp = int(time.time())
-    return f"{prefix}_{timestamp}.{extension}"
+    return f"{prefix}_{uuid.uuid4().hex}.{extension}"
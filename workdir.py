@@ -0,0 +1,94 @@
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class WorkDir:
+    """
+    Managed on-disk layout for downloads
+
+    Every job writes into its own scratch directory under ``jobs/``. Finished
+    files are moved into ``media/`` with an atomic rename, so anything found
+    in the media directory is always complete.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.jobs_dir = os.path.join(self.root, 'jobs')
+        self.media_dir = os.path.join(self.root, 'media')
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.media_dir, exist_ok=True)
+
+    @contextmanager
+    def scratch(self, job_id):
+        """
+        Create a unique scratch directory for a job, removed on exit
+
+        Args:
+            job_id (str): Job the directory belongs to, used as a name prefix
+
+        Yields:
+            str: Path of the scratch directory
+        """
+        path = tempfile.mkdtemp(prefix=f"{job_id}_", dir=self.jobs_dir)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def media_path(self, filename):
+        """Return the path a finished file with this name lives at"""
+        return os.path.join(self.media_dir, os.path.basename(filename))
+
+    def commit(self, partial_path, final_path):
+        """
+        Atomically move a finished file into place
+
+        Args:
+            partial_path (str): Completed file inside a scratch directory
+            final_path (str): Destination inside the media directory
+
+        Returns:
+            str: The final path
+        """
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(partial_path, final_path)
+        logger.info(f"Committed {partial_path} -> {final_path}")
+        return final_path
+
+    def is_media(self, path):
+        """Check that a path points inside the media directory"""
+        real_path = os.path.realpath(path)
+        return os.path.commonpath([real_path, self.media_dir]) == self.media_dir
+
+    def usage(self):
+        """Return byte and file counts for media and scratch space"""
+        media_bytes, media_files = self._measure(self.media_dir)
+        scratch_bytes, scratch_files = self._measure(self.jobs_dir)
+        disk = shutil.disk_usage(self.root)
+        return {
+            'root': self.root,
+            'media_bytes': media_bytes,
+            'media_files': media_files,
+            'scratch_bytes': scratch_bytes,
+            'scratch_files': scratch_files,
+            'total_bytes': media_bytes + scratch_bytes,
+            'disk_free_bytes': disk.free
+        }
+
+    def _measure(self, path):
+        """Sum the size of every file below a directory"""
+        total = 0
+        count = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                    count += 1
+                except OSError:
+                    # File removed while walking
+                    pass
+        return total, count